@@ -0,0 +1,190 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import os
+import traceback
+
+from parallel_extract import Ready, init_thread_worker
+
+# asyncio-driven metadata extraction for libraries on network storage (NAS shares and the like),
+# where opening each file takes long enough that the link sits idle while files are read one
+# at a time. Many reads are kept in flight at once, but only so many per storage root so that
+# one slow share doesn't get swamped, and the header reads themselves run in a bounded pool
+# of threads. Every file gets a timeout and a few retries.
+#
+# Results are yielded as soon as they arrive, so they're not in the same order as the jobs.
+# Everything downstream (pairing live photos and sorting) doesn't depend on the order.
+
+ASYNC_EXECUTOR = "async"
+DEFAULT_ROOT_CONCURRENCY = 8
+DEFAULT_TIMEOUT = 30.0
+DEFAULT_RETRIES = 2
+# seconds to wait before the first retry, doubled for every retry after that
+RETRY_BACKOFF = 0.5
+# errors worth trying again, since they might be the network
+RETRYABLE_ERRORS = (OSError, asyncio.TimeoutError)
+
+
+# The storage a path is on: its drive or UNC share on Windows, otherwise its mount point.
+# Remembers the answer for every directory it's asked about.
+class StorageRoots:
+    def __init__(self):
+        self.roots = {}
+
+    def __call__(self, filepath):
+        dirpath = os.path.dirname(os.path.abspath(filepath))
+        root = self.roots.get(dirpath)
+        if root is None:
+            root = self.roots[dirpath] = self.find_root(dirpath)
+        return root
+
+    def find_root(self, dirpath):
+        drive = os.path.splitdrive(dirpath)[0]
+        if drive:
+            return drive.casefold()
+        while not os.path.ismount(dirpath):
+            parent = os.path.dirname(dirpath)
+            if parent == dirpath:
+                break
+            dirpath = parent
+        return dirpath
+
+
+# The pool of threads reading headers. It's never handed more reads than it has threads, so a
+# read's timeout only starts once a thread has been set aside for it rather than while it waits
+# its turn behind the others. A read that times out keeps its thread until it finishes, since
+# there's no stopping it, and the next read waits for that thread like any other.
+class Readers:
+    def __init__(self, loop, workers):
+        self.loop = loop
+        self.executor = ThreadPoolExecutor(max_workers=workers, initializer=init_thread_worker)
+        self.idle = asyncio.Semaphore(workers)
+        self.reading = set()
+
+    async def read(self, timeout, fn, *args):
+        await self.idle.acquire()
+        future = self.loop.run_in_executor(self.executor, fn, *args)
+        self.reading.add(future)
+        future.add_done_callback(self.finished)
+        # shielded so that timing out doesn't hand the thread to another read while it's still busy
+        return await asyncio.wait_for(asyncio.shield(future), timeout)
+
+    def finished(self, future):
+        self.reading.discard(future)
+        self.idle.release()
+
+    # Stop without waiting on the reads that timed out, they'll finish on their own
+    def shutdown(self):
+        for future in list(self.reading):
+            future.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def extract_with_retries(readers, extract_fn, filepath, args, timeout, retries):
+    for attempt in range(retries + 1):
+        try:
+            result = await readers.read(timeout, extract_fn, filepath, *args)
+            return filepath, result, None
+        except RETRYABLE_ERRORS as e:
+            if attempt == retries:
+                if isinstance(e, asyncio.TimeoutError):
+                    return filepath, None, "Timed out after {0}s ({1} attempts)".format(timeout, retries + 1)
+                return filepath, None, traceback.format_exc()
+            await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt)
+        except Exception:
+            return filepath, None, traceback.format_exc()
+
+
+# The next (filepath, args, storage root) from jobs, or None when there are no more.
+# Runs on a thread of its own (see produce).
+def next_job(jobs, root_of):
+    for filepath, args in jobs:
+        return filepath, args, None if isinstance(args, Ready) else root_of(filepath)
+    return None
+
+
+async def produce(jobs, results, extract_fn, workers, queue_size, root_concurrency, timeout, retries, root_of):
+    loop = asyncio.get_running_loop()
+    in_flight = asyncio.Semaphore(queue_size)
+    root_limits = {}
+    tasks = set()
+
+    async def run(filepath, args, root_limit):
+        try:
+            async with root_limit:
+                await results.put(await extract_with_retries(readers, extract_fn, filepath, args, timeout, retries))
+        finally:
+            in_flight.release()
+
+    readers = Readers(loop, workers)
+    # jobs walks the directories and looks files up in the metadata cache, which would hold up
+    # the event loop, so it's pulled from on another thread while the reads carry on
+    walker = ThreadPoolExecutor(max_workers=1)
+    try:
+        while True:
+            job = await loop.run_in_executor(walker, next_job, jobs, root_of)
+            if job is None:
+                break
+            filepath, args, root = job
+            if isinstance(args, Ready):
+                await results.put((filepath, args.value, None))
+                continue
+            await in_flight.acquire()
+            root_limit = root_limits.get(root)
+            if root_limit is None:
+                root_limit = root_limits[root] = asyncio.Semaphore(root_concurrency)
+            task = loop.create_task(run(filepath, args, root_limit))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+    finally:
+        # the job being pulled is let finish, so that jobs isn't left running on the other thread
+        walker.shutdown(wait=True)
+        readers.shutdown()
+    await results.put(None)
+
+
+# Generator that applies extract_fn to every (filepath, args) job like extract_all in
+# parallel_extract.py, but yields (filepath, result, error) in the order the results arrive.
+# workers is the number of threads reading headers, queue_size the most files in flight at once,
+# and root_concurrency the most files in flight per storage root (see StorageRoots).
+# jobs is pulled from on a thread of its own, so whatever it does (like looking files up in the
+# metadata cache) has to be safe to do while the caller is handling the results.
+def extract_all_async(extract_fn, jobs, workers=1, queue_size=None, root_concurrency=DEFAULT_ROOT_CONCURRENCY,
+                      timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES, root_of=None):
+    workers = max(workers, 1)
+    if queue_size is None:
+        queue_size = workers * 4
+    queue_size = max(queue_size, 1)
+    if root_of is None:
+        root_of = StorageRoots()
+
+    loop = asyncio.new_event_loop()
+    try:
+        # a little room so that finished reads don't wait on the caller
+        results = asyncio.Queue(maxsize=queue_size)
+        producer = loop.create_task(produce(jobs, results, extract_fn, workers, queue_size,
+                                            root_concurrency, timeout, retries, root_of))
+        while True:
+            get = loop.create_task(results.get())
+            loop.run_until_complete(asyncio.wait([get, producer], return_when=asyncio.FIRST_COMPLETED))
+            if not get.done():
+                if producer.cancelled() or producer.exception() is not None:
+                    # the producer ran into an error, so nothing else is coming
+                    get.cancel()
+                    producer.result()
+                # otherwise it's finished and the rest of the results are waiting in the queue
+                item = loop.run_until_complete(get)
+            else:
+                item = get.result()
+            if item is None:
+                break
+            yield item
+        loop.run_until_complete(producer)
+    finally:
+        pending = asyncio.all_tasks(loop)
+        for task in pending:
+            task.cancel()
+        if pending:
+            loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        loop.close()
@@ -0,0 +1,162 @@
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import fake_pymiere
+fake_pymiere.install()
+from async_extract import extract_all_async, DEFAULT_ROOT_CONCURRENCY
+from create_chronological_prpro_seq import pair_live_photos, sort_key  # noqa: E402 (needs the fake installed first)
+from file_pipeline import FileRecord, pair_by_directory
+from parallel_extract import extract_all
+
+# Benchmark for the asyncio extraction in async_extract.py against the serial and thread pool
+# extraction in parallel_extract.py, on simulated high-latency storage (nothing is read from disk).
+# The files are spread over --roots network shares that each take --latency seconds (plus up to
+# --jitter more) per file, and the latency goes up with every read in flight on the same share
+# past --share-slots, like a NAS that's being swamped. Some files fail with an I/O error the first
+# time they're read (--flaky) and some hang for longer than --io-timeout (--stall).
+#
+# Reports the wall time, the time until the first result, and how many files couldn't be read,
+# and checks that every run that read every file sorted them exactly the same way.
+#
+# Example: `python3 ./benchmarks/bench_async_io.py --files 2000 --workers 32 --io-concurrency 8`
+
+START = datetime(2022, 1, 1, tzinfo=timezone.utc)
+
+
+class SimulatedStorage:
+    def __init__(self, latency, jitter, share_slots, flaky, stall, stall_seconds, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.share_slots = share_slots
+        self.flaky = flaky
+        self.stall = stall
+        self.stall_seconds = stall_seconds
+        self.seed = seed
+        self.lock = threading.Lock()
+        self.attempts = {}
+        self.in_flight = {}
+
+    def reset(self):
+        self.attempts.clear()
+
+    # Stand-in for get_earliest_date_and_dimensions
+    def extract(self, filepath):
+        share = root_of(filepath)
+        # the same numbers for a file every time it's read
+        rng = random.Random("{0}:{1}".format(self.seed, filepath))
+        stalls, jitter, fails, seconds = rng.random() < self.stall, rng.random(), rng.random() < self.flaky, rng.randrange(10 ** 7)
+        with self.lock:
+            attempt = self.attempts[filepath] = self.attempts.get(filepath, 0) + 1
+            busy = self.in_flight[share] = self.in_flight.get(share, 0) + 1
+        try:
+            # only the first read of a file fails or hangs, retrying it works
+            if attempt == 1 and stalls:
+                time.sleep(self.stall_seconds)
+            delay = self.latency + jitter * self.jitter
+            time.sleep(delay * max(1.0, busy / self.share_slots))
+            if attempt == 1 and fails:
+                raise OSError("The specified network name is no longer available")
+        finally:
+            with self.lock:
+                self.in_flight[share] -= 1
+        is_video = filepath.endswith(".MOV")
+        return { "filename": filepath,
+                 "datetime": START + timedelta(seconds=seconds),
+                 "height": 1080 if is_video else 3024,
+                 "width": 1920 if is_video else 4032 }
+
+
+# The share a simulated file is on: the first part of its path
+def root_of(filepath):
+    return filepath.split(os.sep, 1)[0]
+
+
+# The directory sizes and the jobs for num_files photos (and the video of every third one's
+# live photo) spread over directories on num_roots shares
+def make_jobs(num_files, num_roots, files_per_dir=50):
+    sizes = {}
+    jobs = []
+    i = 0
+    while len(jobs) < num_files:
+        d = i // files_per_dir
+        dirpath = os.path.join("share_{0}".format(d % num_roots), "dir_{0:03d}".format(d))
+        exts = [".JPG", ".MOV"] if i % 3 == 0 else [".JPG"]
+        for ext in exts[:num_files - len(jobs)]:
+            jobs.append((os.path.join(dirpath, "IMG_{0:04d}{1}".format(i, ext)), ()))
+            sizes[dirpath] = sizes.get(dirpath, 0) + 1
+        i += 1
+    return sizes, jobs
+
+
+def run(results, sizes):
+    failed = []
+    first = None
+    start = time.perf_counter()
+    def records():
+        nonlocal first
+        for filepath, file_meta, error in results:
+            if first is None:
+                first = time.perf_counter() - start
+            if error is not None:
+                failed.append(filepath)
+                continue
+            yield FileRecord(**file_meta)
+    sorted_files = list(pair_by_directory(records(), pair_live_photos, [], sizes))
+    sorted_files.sort(key=sort_key)
+    return [(x["filename"], x["datetime"]) for x in sorted_files], failed, time.perf_counter() - start, first
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--roots", type=int, default=2, help="number of simulated network shares")
+    parser.add_argument("--latency", type=float, default=0.02, help="simulated seconds per file")
+    parser.add_argument("--jitter", type=float, default=0.03, help="up to this many more seconds per file")
+    parser.add_argument("--share-slots", type=int, default=8,
+                        help="reads in flight on a share before every read on it slows down")
+    parser.add_argument("--flaky", type=float, default=0.01, help="fraction of files whose first read fails")
+    parser.add_argument("--stall", type=float, default=0.002, help="fraction of files whose first read hangs")
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--io-concurrency", type=int, default=DEFAULT_ROOT_CONCURRENCY)
+    parser.add_argument("--io-timeout", type=float, default=1.0)
+    parser.add_argument("--io-retries", type=int, default=2)
+    parser.add_argument("--skip-serial", action="store_true", help="don't run the (slow) serial extraction")
+    args = parser.parse_args()
+
+    storage = SimulatedStorage(args.latency, args.jitter, args.share_slots, args.flaky, args.stall,
+                               stall_seconds=args.io_timeout * 3)
+    sizes, jobs = make_jobs(args.files, args.roots)
+    # what every run that reads every file should come up with
+    expected, _, _, _ = run(extract_all(SimulatedStorage(0.0, 0.0, 1, 0.0, 0.0, 0.0).extract, iter(jobs)), None)
+
+    runs = []
+    if not args.skip_serial:
+        runs.append(("serial", lambda: extract_all(storage.extract, iter(jobs)), None))
+    runs.append(("thread x{0}".format(args.workers),
+                 lambda: extract_all(storage.extract, iter(jobs), workers=args.workers, executor_type="thread"), None))
+    runs.append(("async x{0}, {1} per share".format(args.workers, args.io_concurrency),
+                 lambda: extract_all_async(storage.extract, iter(jobs), workers=args.workers,
+                                           root_concurrency=args.io_concurrency, timeout=args.io_timeout,
+                                           retries=args.io_retries, root_of=root_of), sizes))
+
+    print("{0} files on {1} simulated shares".format(len(jobs), args.roots))
+    print("{0:<28} {1:>10} {2:>12} {3:>10} {4:>8}  {5}".format("extraction", "time (s)", "first (s)", "files/s", "failed", "output"))
+    for name, results, run_sizes in runs:
+        storage.reset()
+        sorted_files, failed, elapsed, first = run(results(), run_sizes)
+        if failed:
+            output = "incomplete"
+        else:
+            output = "as expected" if sorted_files == expected else "MISMATCH!"
+        print("{0:<28} {1:10.2f} {2:12.3f} {3:10.1f} {4:>8}  {5}".format(
+            name, elapsed, first or 0.0, len(jobs) / elapsed, len(failed), output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import argparse
+import os
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# Compares getting the dimensions of photos and videos with the header probe
+# (probe_dimensions in media_headers.py) against decoding them with OpenCV,
+# which is what the script used to fall back on.
+# Each method runs in its own process so its peak memory can be measured on its own.
+#
+# Pass your own files, e.g. 48MP iPhone photos:
+#   `python3 ./benchmarks/bench_dimension_probe.py IMG_0001.HEIC IMG_0002.JPG IMG_0003.MOV`
+# or let it generate a large JPEG (and MP4) with OpenCV:
+#   `python3 ./benchmarks/bench_dimension_probe.py --width 8064 --height 6048`
+# Without OpenCV, it writes a JPEG, PNG and MP4 that only have valid headers (the rest is
+# padding) instead, and only the header probe is run.
+
+
+def peak_rss_mb():
+    try:
+        import resource
+        # kilobytes on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024.0 / (1024.0 if sys.platform == "darwin" else 1.0)
+    except ImportError:
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / 1024.0 / 1024.0
+    except (ImportError, AttributeError):
+        return float("nan")
+
+
+def probe_header(filepath):
+    from media_headers import probe_dimensions
+    return probe_dimensions(filepath)
+
+
+def probe_cv2(filepath):
+    import cv2
+    if os.path.splitext(filepath)[-1].lower() in [".mp4", ".mov"]:
+        vcap = cv2.VideoCapture(filepath)
+        try:
+            return int(vcap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(vcap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        finally:
+            vcap.release()
+    im = cv2.imread(filepath)
+    return None if im is None else (im.shape[1], im.shape[0])
+
+
+METHODS = {"header": probe_header, "cv2": probe_cv2}
+
+
+# Runs in the child process: time the method on every file and report peak memory.
+def run_child(method, filepaths, repeat):
+    baseline = peak_rss_mb()
+    probe = METHODS[method]
+    # import outside of the timed part
+    probe(filepaths[0])
+    for filepath in filepaths:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            dimensions = probe(filepath)
+        elapsed = (time.perf_counter() - start) / repeat
+        print("{0:<7} {1:<40} {2!s:<14} {3:10.3f} ms".format(
+            method, os.path.basename(filepath), dimensions, elapsed * 1000.0))
+    print("{0:<7} peak RSS {1:.1f} MB (process baseline {2:.1f} MB)".format(method, peak_rss_mb(), baseline))
+
+
+def make_files(tmp, width, height):
+    import cv2
+    import numpy as np
+    # a gradient compresses like a real photo more than noise does
+    row = np.linspace(0, 255, width, dtype=np.uint8)
+    image = np.dstack([np.tile(row, (height, 1))] * 3)
+    jpeg = os.path.join(tmp, "generated_{0}x{1}.jpg".format(width, height))
+    cv2.imwrite(jpeg, image)
+    mp4 = os.path.join(tmp, "generated_1920x1080.mp4")
+    writer = cv2.VideoWriter(mp4, cv2.VideoWriter_fourcc(*"mp4v"), 30, (1920, 1080))
+    frame = cv2.resize(image, (1920, 1080))
+    for _ in range(30):
+        writer.write(frame)
+    writer.release()
+    return [jpeg, mp4]
+
+
+def box(box_type, payload):
+    return struct.pack(">I", 8 + len(payload)) + box_type + payload
+
+
+# Files with headers that probe_dimensions can read but nothing to decode, padded out to
+# about the size of the real thing
+def make_header_files(tmp, width, height, padding=8 * 1024 * 1024):
+    jpeg = os.path.join(tmp, "header_only_{0}x{1}.jpg".format(width, height))
+    with open(jpeg, "wb") as f:
+        # start of image, JFIF APP0, baseline start of frame with 3 components, start of scan
+        f.write(b"\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00")
+        f.write(b"\xff\xc0\x00\x11\x08" + struct.pack(">HH", height, width) + b"\x03\x01\x22\x00\x02\x11\x01\x03\x11\x01")
+        f.write(b"\xff\xda\x00\x0c\x03\x01\x00\x02\x11\x03\x11\x00\x3f\x00")
+        f.write(b"\x00" * padding + b"\xff\xd9")
+    png = os.path.join(tmp, "header_only_{0}x{1}.png".format(width, height))
+    with open(png, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n" + struct.pack(">I", 13) + b"IHDR" + struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        f.write(b"\x00" * (4 + padding))
+    mp4 = os.path.join(tmp, "header_only_1920x1080.mp4")
+    with open(mp4, "wb") as f:
+        # the 'moov' atom after the media data, like most phones write it
+        mvhd = box(b"mvhd", b"\x00" * 100)
+        tkhd = box(b"tkhd", b"\x00" * 76 + struct.pack(">II", 1920 << 16, 1080 << 16))
+        f.write(box(b"ftyp", b"isom\x00\x00\x02\x00isommp41"))
+        f.write(box(b"mdat", b"\x00" * padding))
+        f.write(box(b"moov", mvhd + box(b"trak", tkhd)))
+    return [jpeg, png, mp4]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("files", nargs="*")
+    parser.add_argument("--width", type=int, default=8064)
+    parser.add_argument("--height", type=int, default=6048)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--methods", nargs="+", choices=list(METHODS), default=list(METHODS))
+    parser.add_argument("--child", choices=list(METHODS), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.files, args.repeat)
+        return
+
+    methods = args.methods
+    with tempfile.TemporaryDirectory() as tmp:
+        filepaths = args.files
+        if not filepaths:
+            try:
+                import cv2  # noqa: F401
+                filepaths = make_files(tmp, args.width, args.height)
+            except ImportError:
+                print("OpenCV isn't installed, so the generated files only have headers and cv2 is skipped")
+                filepaths = make_header_files(tmp, args.width, args.height)
+                methods = [method for method in methods if method != "cv2"]
+        for method in methods:
+            cmd = [sys.executable, os.path.abspath(__file__), "--child", method, "--repeat", str(args.repeat)] + filepaths
+            result = subprocess.run(cmd)
+            if result.returncode != 0:
+                print("{0} failed (is it installed?)".format(method))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import fake_pymiere
+fake_pymiere.install()
+from create_chronological_prpro_seq import pair_live_photos  # noqa: E402 (needs the fake installed first)
+
+# Shows that pairing live photos (pair_live_photos) scales linearly with the number of files.
+# Builds a synthetic iPhone-heavy library where a third of the photos are live photos
+# (HEIC + MOV), some of those also have an .AAE edit, and the walk order is shuffled.
+# The old search (one scan of every file per live photo video) can be timed too with --old.
+#
+# Example: `python3 ./benchmarks/bench_live_photo_pairing.py --sizes 12500 25000 50000 100000 --old`
+
+
+def make_file_metas(num_files, seed=0):
+    rng = random.Random(seed)
+    start = datetime(2022, 1, 1, tzinfo=timezone.utc)
+    file_metas = []
+    i = 0
+    while len(file_metas) < num_files:
+        dirpath = os.path.join("..", "phone_{0}".format(i % 20))
+        stem = os.path.join(dirpath, "IMG_{0:05d}".format(i))
+        dt = start + timedelta(seconds=rng.randrange(10 ** 7))
+        file_metas.append({"filename": stem + ".HEIC", "datetime": dt, "height": 3024, "width": 4032})
+        if i % 3 == 0:
+            file_metas.append({"filename": stem + ".MOV", "datetime": dt + timedelta(seconds=2), "height": 1440, "width": 1920})
+            if i % 9 == 0:
+                file_metas.append({"filename": stem + ".AAE", "datetime": dt - timedelta(days=1), "height": 0, "width": 0})
+        i += 1
+    del file_metas[num_files:]
+    rng.shuffle(file_metas)
+    return file_metas
+
+
+# The pairing as it was before pair_live_photos
+def old_pair_live_photos(file_metas):
+    filepathnames = set()
+    live_photos = []
+    for i, file_meta in enumerate(file_metas):
+        filepath_wo_ext = os.path.splitext(file_meta["filename"])[0]
+        if filepath_wo_ext in filepathnames:
+            live_photos.append((file_meta["filename"], i))
+        else:
+            filepathnames.add(filepath_wo_ext)
+    for lp in live_photos:
+        dt = next(x["datetime"] for x in file_metas if os.path.splitext(x["filename"])[0] == os.path.splitext(lp[0])[0] and x["filename"] != lp[0])
+        file_metas[lp[1]]["datetime"] = dt
+
+
+def time_it(fn, file_metas):
+    start = time.perf_counter()
+    fn(file_metas)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[12500, 25000, 50000, 100000])
+    parser.add_argument("--old", action="store_true", help="also time the old quadratic search (slow!)")
+    parser.add_argument("--old-max", type=int, default=25000, help="largest size to run the old search on")
+    args = parser.parse_args()
+
+    print("{0:>10} {1:>12} {2:>14} {3:>12}".format("files", "pairing (s)", "us per file", "old (s)"))
+    for size in args.sizes:
+        elapsed = time_it(pair_live_photos, make_file_metas(size))
+        old = ""
+        if args.old and size <= args.old_max:
+            old = "{0:12.3f}".format(time_it(old_pair_live_photos, make_file_metas(size)))
+        print("{0:>10} {1:12.4f} {2:14.3f} {3:>12}".format(size, elapsed, elapsed / size * 1e6, old))
+
+
+if __name__ == "__main__":
+    main()
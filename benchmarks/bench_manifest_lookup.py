@@ -0,0 +1,60 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from manifest import Manifest
+from bench_live_photo_pairing import make_file_metas
+
+# Microbenchmark for looking up files in the sorted files list the way read_config_sequence
+# (one lookup per config sequence clip) and the resume logic in main() do.
+# Compares the old linear scan with the hash maps in Manifest.
+#
+# Example: `python3 ./benchmarks/bench_manifest_lookup.py --files 100000 --clips 10 100 1000 10000`
+
+
+def linear_lookup(sorted_files, filepaths):
+    return [next((x for x in sorted_files if x["filename"] == fp), None) for fp in filepaths]
+
+
+def manifest_lookup(manifest, filepaths):
+    return [manifest.get(fp) for fp in filepaths]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=100000)
+    parser.add_argument("--clips", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--linear-max", type=int, default=1000, help="largest number of clips to time the linear scan on")
+    args = parser.parse_args()
+
+    sorted_files = make_file_metas(args.files)
+    rng = random.Random(1)
+    print("{0:>8} {1:>16} {2:>16} {3:>16}".format("clips", "linear scan (s)", "index build (s)", "lookups (s)"))
+    for num_clips in args.clips:
+        filepaths = [rng.choice(sorted_files)["filename"] for _ in range(num_clips)]
+
+        linear = ""
+        if num_clips <= args.linear_max:
+            start = time.perf_counter()
+            expected = linear_lookup(sorted_files, filepaths)
+            linear = "{0:16.4f}".format(time.perf_counter() - start)
+        else:
+            expected = None
+
+        manifest = Manifest(sorted_files)
+        start = time.perf_counter()
+        manifest.index_of(filepaths[0])
+        build = time.perf_counter() - start
+        start = time.perf_counter()
+        found = manifest_lookup(manifest, filepaths)
+        lookups = time.perf_counter() - start
+        if expected is not None and found != expected:
+            print("MISMATCH between the linear scan and the manifest index!")
+        print("{0:>8} {1:>16} {2:16.4f} {3:16.6f}".format(num_clips, linear, build, lookups))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from parallel_extract import extract_all, EXECUTOR_TYPES
+
+# Benchmark for the pooled metadata extraction in parallel_extract.py.
+# Reports files/sec as the number of workers goes up and checks that
+# every worker count produces exactly the same results as the serial path.
+#
+# Without --search-root a synthetic library is generated and each file "costs"
+# --latency seconds of simulated shell/disk wait, so this runs anywhere.
+# With --search-root and --tz-config the real get_earliest_date_and_dimensions is used.
+#
+# Example: `python3 ./benchmarks/bench_parallel_extraction.py --files 2000 --workers 1 2 4 8 16`
+
+
+# Stand-in for get_earliest_date_and_dimensions: wait like the shell would,
+# then actually read the file so there's some real I/O involved.
+def synthetic_extract(filepath, latency):
+    time.sleep(latency)
+    with open(filepath, "rb") as f:
+        data = f.read()
+    return {"filename": filepath, "datetime": len(data), "height": 1080, "width": 1920}
+
+
+def make_synthetic_library(root, num_files):
+    for i in range(num_files):
+        subdir = os.path.join(root, "subdir_{0}".format(i % 10))
+        os.makedirs(subdir, exist_ok=True)
+        with open(os.path.join(subdir, "IMG_{0:04d}.JPG".format(i)), "wb") as f:
+            f.write(os.urandom(64 + i % 512))
+
+
+def run(extract_fn, jobs, workers, executor_type):
+    start = time.perf_counter()
+    results = list(extract_all(extract_fn, jobs, workers=workers, executor_type=executor_type))
+    return results, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=1000, help="number of synthetic files")
+    parser.add_argument("--latency", type=float, default=0.005, help="simulated seconds per synthetic file")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--executor", choices=list(EXECUTOR_TYPES), default="thread")
+    parser.add_argument("--search-root", default=None, help="benchmark a real library instead")
+    parser.add_argument("--tz-config", default=None, help="timezone config for --search-root")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.search_root:
+            import fake_pymiere
+            fake_pymiere.install()
+            from create_chronological_prpro_seq import get_earliest_date_and_dimensions, load_tz_config
+            tz_config = load_tz_config(args.tz_config)
+            filepaths = [os.path.join(dirpath, filename)
+                         for dirpath, _, filenames in os.walk(args.search_root) for filename in filenames]
+            extract_fn = get_earliest_date_and_dimensions
+            job_list = [(fp, (tz_config[os.path.relpath(os.path.dirname(fp), args.search_root)],)) for fp in filepaths]
+        else:
+            make_synthetic_library(tmp, args.files)
+            filepaths = sorted(os.path.join(dirpath, filename)
+                               for dirpath, _, filenames in os.walk(tmp) for filename in filenames)
+            extract_fn = synthetic_extract
+            job_list = [(fp, (args.latency,)) for fp in filepaths]
+
+        print("Extracting metadata from {0} files with a {1} pool".format(len(job_list), args.executor))
+        baseline = None
+        for workers in args.workers:
+            results, elapsed = run(extract_fn, job_list, workers, args.executor)
+            if baseline is None:
+                baseline = results
+            matches = results == baseline
+            print("workers={0:<4} {1:8.2f}s {2:10.1f} files/sec  matches first run: {3}".format(
+                workers, elapsed, len(results) / elapsed, matches))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import fake_pymiere
+
+# End-to-end benchmark of the Premiere half of create_chronological_prpro_seq.py
+# (indexing the bins, reading the config sequence and adding the clips), run against
+# the in-process fake of pymiere in fake_pymiere.py instead of a real Premiere.
+# For synthetic projects of each size, reports the bridge calls (round trips to Premiere)
+# and wall time of each phase, and the bridge calls per clip.
+#
+# --latency makes every bridge call wait that many seconds, to get an idea of
+# the wall time against a real Premiere (a few milliseconds per call is typical).
+# --track-cost makes adding a clip to a track wait that many seconds per clip already on it,
+# like Premiere slowing down as the sequence grows, which --chunk-size is meant to avoid.
+#
+# Example: `python3 ./benchmarks/bench_premiere_pipeline.py --items 1000 10000 100000 --batch-size 50 --chunk-size 500`
+
+SEARCH_ROOT = os.path.join("..", "media")
+PHOTO_DIMENSIONS = (3024, 4032)
+VIDEO_DIMENSIONS = (1080, 1920)
+
+
+# A project with a bin for SEARCH_ROOT holding num_items photos and videos spread over
+# subdirectory bins, a config_sequence with a photo and a video in it, and the matching
+# sorted files list. One in every video_every items is a video.
+def make_project(num_items, num_subdirs=20, video_every=5):
+    project = fake_pymiere.Project(path="C:\\fake\\project.prproj")
+    root = project._data["rootItem"]
+    parent_bin = root.add_bin(os.path.basename(SEARCH_ROOT))
+    subdir_bins = [parent_bin.add_bin("subdir_{0}".format(i)) for i in range(num_subdirs)]
+    start = datetime(2022, 1, 1, tzinfo=timezone.utc)
+    sorted_files = []
+    for i in range(num_items):
+        subdir = "subdir_{0}".format(i % num_subdirs)
+        if i % video_every == 0:
+            name, duration, (height, width) = "VID_{0:06d}.MOV".format(i), fake_pymiere.DEFAULT_VIDEO_SECONDS, VIDEO_DIMENSIONS
+        else:
+            name, duration, (height, width) = "IMG_{0:06d}.JPG".format(i), fake_pymiere.DEFAULT_PHOTO_SECONDS, PHOTO_DIMENSIONS
+        subdir_bins[i % num_subdirs].add_item(name, duration)
+        sorted_files.append({"filename": os.path.join(SEARCH_ROOT, subdir, name),
+                             "datetime": start + timedelta(seconds=i), "height": height, "width": width})
+
+    # the config sequence: one photo with Scale keyframes and one scaled video
+    config_seq = project.createNewSequence("config_sequence", "placeholderID")
+    track = config_seq._data["videoTracks"]._items[0]
+    with fake_pymiere.bridge.inside():
+        for item in (subdir_bins[1]._data["children"]._items[0], subdir_bins[0]._data["children"]._items[0]):
+            track.overwriteClip(item, 0 if not track._data["clips"]._items else track._data["clips"]._items[-1]._seconds("end"))
+        photo, video = track._data["clips"]._items
+        photo_scale = photo._data["components"]._items[1]._data["properties"]._items[1]
+        photo_scale.addKey(0)
+        photo_scale.setValueAtKey(0, 50.0)
+        photo_scale.addKey(photo._seconds("duration"))
+        photo_scale.setValueAtKey(photo._seconds("duration"), 60.0)
+        video._data["components"]._items[1]._data["properties"]._items[1].setValue(75.0)
+    return project, parent_bin, sorted_files
+
+
+# Runs fn with its output hidden, returning (result, bridge calls, eval_script calls, seconds)
+def measure(bridge, fn, *args):
+    bridge.reset_counts()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = fn(*args)
+    return result, bridge.calls, bridge.scripts, time.perf_counter() - start
+
+
+def print_row(num_items, phase, calls, scripts, seconds, num_clips=None):
+    per_clip = "{0:12.2f}".format(calls / num_clips) if num_clips else ""
+    print("{0:>8} {1:<28} {2:>10} {3:>8} {4:>12} {5:10.2f}".format(num_items, phase, calls, scripts, per_clip, seconds))
+
+
+# The clips on seq's track, with the clips of every sequence nested in it in its place
+def flattened_clips(project, seq):
+    sequences = { x._data["name"]: x for x in project._data["sequences"]._items }
+    clips = []
+    for clip in seq._data["videoTracks"]._items[0]._data["clips"]._items:
+        nested = sequences.get(clip._data["name"])
+        clips.extend(flattened_clips(project, nested) if nested is not None else [clip])
+    return clips
+
+
+def run(num_items, batch_size, chunk_size, proxy_walk_max, latency, track_cost):
+    bridge = fake_pymiere.bridge
+    project, parent_bin, sorted_file_list = make_project(num_items)
+    fake_pymiere.use_project(project)
+    bridge.latency = latency
+    seq_module = sys.modules["create_chronological_prpro_seq"]
+    from bin_index import load_bin_index
+    from manifest import Manifest
+    sorted_files = Manifest(sorted_file_list)
+    to_filepath = lambda tree_path: seq_module.bin_tree_path_to_filepath(tree_path, SEARCH_ROOT)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        index_filename = os.path.join(tmpdir, "bin_index.json")
+        bin_dict, calls, scripts, seconds = measure(bridge, seq_module.memoize_bins, project, parent_bin, index_filename, SEARCH_ROOT)
+        print_row(num_items, "index bins (bulk)", calls, scripts, seconds)
+        _, calls, scripts, seconds = measure(bridge, seq_module.memoize_bins, project, parent_bin, index_filename, SEARCH_ROOT)
+        print_row(num_items, "index bins (unchanged)", calls, scripts, seconds)
+    if num_items <= proxy_walk_max:
+        def proxy_walk():
+            bin_index = load_bin_index(os.devnull, project, SEARCH_ROOT, to_filepath)
+            bin_index.update(parent_bin, bulk=False)
+        _, calls, scripts, seconds = measure(bridge, proxy_walk)
+        print_row(num_items, "index bins (per item)", calls, scripts, seconds)
+
+    (seq_settings, prop_dict), calls, scripts, seconds = measure(
+        bridge, seq_module.read_config_sequence, project, "config_sequence", sorted_files, SEARCH_ROOT)
+    print_row(num_items, "read config sequence", calls, scripts, seconds)
+    dimension_lookups = seq_module.build_dimension_lookups(prop_dict)
+
+    bridge.track_cost = track_cost
+    runs = [("add clips (one at a time)", 0, 0), ("add clips (batch {0})".format(batch_size), batch_size, 0)]
+    if chunk_size:
+        runs.append(("add clips (chunks of {0})".format(chunk_size), batch_size, chunk_size))
+    for phase, size, chunk in runs:
+        if size == 1:
+            continue
+        # start each run without any project items fetched from Premiere yet
+        bin_dict.proxies.clear()
+        with fake_pymiere.bridge.inside():
+            seq = project.createNewSequence("GENERATED_{0}_{1}".format(size, chunk), "placeholderID")
+            seq_time = fake_pymiere.Time()
+        _, calls, scripts, seconds = measure(bridge, seq_module.add_clips_to_sequence, seq, sorted_files, 0, prop_dict,
+                                             dimension_lookups, bin_dict, seq_time, size, None, None, chunk)
+        clips = len(flattened_clips(project, seq))
+        if clips != num_items:
+            print("WARNING: {0} clips were added instead of {1}!".format(clips, num_items))
+        print_row(num_items, phase, calls, scripts, seconds, clips)
+    bridge.latency = 0.0
+    bridge.track_cost = 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--chunk-size", type=int, default=500, help="also add the clips in nested sequences of this many (0: don't)")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds every bridge call waits (default: 0)")
+    parser.add_argument("--track-cost", type=float, default=0.0,
+                        help="seconds adding a clip to a track waits per clip already on it (default: 0)")
+    parser.add_argument("--proxy-walk-max", type=int, default=10000,
+                        help="largest project to also index one item at a time through pymiere")
+    args = parser.parse_args()
+
+    fake_pymiere.install()
+    import create_chronological_prpro_seq  # noqa: F401 (needs the fake installed first)
+
+    print("{0:>8} {1:<28} {2:>10} {3:>8} {4:>12} {5:>10}".format("items", "phase", "calls", "scripts", "calls/clip", "time (s)"))
+    for num_items in args.items:
+        run(num_items, args.batch_size, args.chunk_size, args.proxy_walk_max, args.latency, args.track_cost)
+
+
+if __name__ == "__main__":
+    main()
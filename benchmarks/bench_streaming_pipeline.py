@@ -0,0 +1,126 @@
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import fake_pymiere
+fake_pymiere.install()
+from create_chronological_prpro_seq import pair_live_photos, sort_key  # noqa: E402 (needs the fake installed first)
+from external_sort import external_sort
+from file_pipeline import ExcludeFilter, walk_dirs, pair_by_directory, as_record, DEFAULT_EXCLUDES
+from manifest import read_sorted_files, write_sorted_files
+from parallel_extract import extract_all
+
+# Compares the peak memory of sorting a huge library the way sort_files used to
+# (a list of every path, then a list of dictionaries, then a sorted copy) with the
+# streaming pipeline of generators and FileRecords it uses now. With --sort-run-size, the
+# streaming pipeline merges the runs into a binary manifest and opens it like sort_files does.
+# The directory tree is synthetic (nothing is written to disk) and so is the metadata,
+# so this only measures what the script itself holds on to.
+#
+# Example: `python3 ./benchmarks/bench_streaming_pipeline.py --files 1000000 --sort-run-size 100000`
+
+START = datetime(2022, 1, 1, tzinfo=timezone.utc)
+
+
+# Works like os.walk over a tree of num_files photos (and the videos of every third one's
+# live photo) spread over num_dirs directories, with a RAW file in each directory.
+def synthetic_walk(num_files, num_dirs):
+    def walk(search_root):
+        per_dir = -(-num_files // num_dirs)
+        made = 0
+        for d in range(num_dirs):
+            filenames = []
+            i = d * per_dir
+            while i < (d + 1) * per_dir and made < num_files:
+                filenames.append("IMG_{0:07d}.JPG".format(i))
+                made += 1
+                if i % 3 == 0 and made < num_files:
+                    filenames.append("IMG_{0:07d}.MOV".format(i))
+                    made += 1
+                i += 1
+            filenames.append("IMG_RAW_{0}.CR2".format(d))
+            yield os.path.join(search_root, "dir_{0:04d}".format(d)), [], filenames
+    return walk
+
+
+# Stand-in for get_earliest_date_and_dimensions
+def synthetic_extract(filepath):
+    n = int(filepath[-11:-4])
+    return { "filename": filepath,
+             "datetime": START + timedelta(seconds=(n * 7919) % 10 ** 8),
+             "height": 3024,
+             "width": 4032 }
+
+
+def old_sort(walk, search_root, sort_run_size):
+    all_files = []
+    for dirpath, _, filenames in walk(search_root):
+        all_files.extend(os.path.join(dirpath, filename) for filename in filenames
+                         if os.path.splitext(filename)[1].lower() not in [".cr2", ".cr3"])
+    file_metas = [file_meta for _, file_meta, _ in extract_all(synthetic_extract, ((fp, ()) for fp in all_files))]
+    pair_live_photos(file_metas)
+    if sort_run_size:
+        return list(external_sort(iter(file_metas), sort_key, sort_run_size))
+    return sorted(file_metas, key=sort_key)
+
+
+def new_sort(walk, search_root, sort_run_size):
+    exclude = ExcludeFilter(DEFAULT_EXCLUDES)
+    # joined like files_with_tz_config does
+    files = (prefix + filename for prefix, filenames in ((os.path.join(dirpath, ""), filenames)
+                                                         for dirpath, filenames in walk_dirs(search_root, exclude, walk))
+             for filename in filenames)
+    records = (as_record(file_meta) for _, file_meta, _ in extract_all(synthetic_extract, ((fp, ()) for fp in files)))
+    records = pair_by_directory(records, pair_live_photos, [])
+    if sort_run_size:
+        # merged straight into a binary manifest and opened from it, like sort_files does
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, "sorted_files.manifest")
+            write_sorted_files(filename, external_sort(records, sort_key, sort_run_size))
+            return read_sorted_files(filename)
+    sorted_files = list(records)
+    sorted_files.sort(key=sort_key)
+    return sorted_files
+
+
+def measure(sort_fn, *args):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = sort_fn(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, peak, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--dirs", type=int, default=200)
+    parser.add_argument("--sort-run-size", type=int, default=None)
+    args = parser.parse_args()
+
+    search_root = os.path.join("..", "media")
+    print("{0:>9} {1:>16} {2:>16} {3:>12} {4:>12}".format("files", "lists peak (MB)", "stream peak (MB)", "lists (s)", "stream (s)"))
+    for num_files in args.files:
+        walk = synthetic_walk(num_files, args.dirs)
+        old, old_peak, old_time = measure(old_sort, walk, search_root, args.sort_run_size)
+        old = [(x["filename"], x["datetime"]) for x in old]
+        gc.collect()
+        new, new_peak, new_time = measure(new_sort, walk, search_root, args.sort_run_size)
+        if [(x["filename"], x["datetime"]) for x in new] != old:
+            print("MISMATCH between the old and the streaming pipeline!")
+        del old, new
+        print("{0:>9} {1:16.1f} {2:16.1f} {3:12.2f} {4:12.2f}".format(
+            num_files, old_peak / 2 ** 20, new_peak / 2 ** 20, old_time, new_time))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,519 @@
+import bisect
+import json
+import re
+import sys
+import time
+import types
+from contextlib import contextmanager
+from urllib.parse import unquote
+
+# In-process stand-in for the parts of pymiere (and Premiere itself) that
+# create_chronological_prpro_seq.py uses, so the Premiere half of the script can be run
+# and measured without Premiere: the project, its bins and items, sequences, tracks,
+# clips, components, properties and keyframes.
+#
+# With real pymiere, every property read or write and every method call on a Premiere
+# object is a round trip to Premiere, and so is every eval_script. The fake counts each
+# of those as one "bridge call" and can wait --latency seconds on each to simulate the
+# cost. Collections cost one call for their length and one per item fetched.
+#
+# Premiere also gets slower at adding a clip to a track the more clips there already are on it.
+# track_cost simulates that by waiting that many seconds per clip already on the track.
+#
+# The ExtendScript the script sends (see bin_index.py, extendscript_batch.py, build_journal.py
+# and sequence_chunks.py) can't be
+# run here, so it's recognized and emulated in Python. Whatever happens "inside Premiere"
+# in an emulated script isn't counted, just like a real script only costs one round trip.
+#
+# Call install() before importing anything that imports pymiere.
+
+TICKS_PER_SECOND = 254016000000
+# Premiere's default still image duration
+DEFAULT_PHOTO_SECONDS = 5.0
+DEFAULT_VIDEO_SECONDS = 10.0
+MOTION_PROPERTIES = ["Position", "Scale", "Scale Width", "Uniform Scale", "Rotation", "Anchor Point", "Anti-flicker Filter"]
+
+
+class Bridge:
+    def __init__(self, latency=0.0, track_cost=0.0):
+        self.latency = latency
+        self.track_cost = track_cost
+        self.calls = 0
+        self.scripts = 0
+        self.objects = {}
+        # nodeId -> ProjectItem
+        self.nodes = {}
+        self.next_id = 0
+        self.depth = 0
+        self.session = "fake-session"
+
+    def call(self, n=1):
+        if self.depth:
+            return
+        self.calls += n
+        if self.latency:
+            time.sleep(self.latency * n)
+
+    def register(self, obj):
+        self.next_id += 1
+        obj_id = "fake{0}".format(self.next_id)
+        self.objects[obj_id] = obj
+        return obj_id
+
+    # Anything done in here is happening inside Premiere, so it isn't a bridge call
+    @contextmanager
+    def inside(self):
+        self.depth += 1
+        try:
+            yield
+        finally:
+            self.depth -= 1
+
+    def reset_counts(self):
+        self.calls = 0
+        self.scripts = 0
+
+
+bridge = Bridge()
+
+
+# Base for everything that lives in Premiere. Reading or writing any public attribute is a bridge call.
+class FakeObject:
+    def __init__(self, **data):
+        object.__setattr__(self, "_data", data)
+        object.__setattr__(self, "_pymiere_id", bridge.register(self))
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        data = object.__getattribute__(self, "_data")
+        if name not in data:
+            raise AttributeError(name)
+        bridge.call()
+        return data[name]
+
+    def __setattr__(self, name, value):
+        # private attributes, and properties that count the call themselves
+        if name.startswith("_") or isinstance(getattr(type(self), name, None), property):
+            object.__setattr__(self, name, value)
+            return
+        bridge.call()
+        self._set(name, value)
+
+    # for subclasses with attributes that do more than store a value
+    def _set(self, name, value):
+        self._data[name] = value
+
+
+class Collection:
+    def __init__(self, items=None):
+        self._items = list(items or [])
+
+    def __len__(self):
+        bridge.call()
+        return len(self._items)
+
+    def __getitem__(self, index):
+        bridge.call()
+        return self._items[index]
+
+    def __iter__(self):
+        bridge.call(1 + len(self._items))
+        return iter(list(self._items))
+
+
+class Time(FakeObject):
+    def __init__(self):
+        bridge.call()
+        super().__init__(ticks="0")
+
+    @property
+    def seconds(self):
+        bridge.call()
+        return int(self._data["ticks"]) / TICKS_PER_SECOND
+
+    @seconds.setter
+    def seconds(self, value):
+        bridge.call()
+        self._data["ticks"] = str(int(round(value * TICKS_PER_SECOND)))
+
+
+def time_from_seconds(seconds):
+    t = Time()
+    t.seconds = seconds
+    return t
+
+
+class ProjectItemType:
+    CLIP = 1
+    BIN = 2
+    ROOT = 3
+    FILE = 4
+
+
+class ProjectItem(FakeObject):
+    def __init__(self, name, item_type, parent=None, duration=None):
+        tree_path = (parent._data["treePath"] if parent is not None else "") + "\\" + name
+        super().__init__(name=name, type=item_type, treePath=tree_path, children=Collection(),
+                         nodeId="{0:08x}".format(bridge.next_id + 1), duration=duration)
+        bridge.nodes[self._data["nodeId"]] = self
+        if parent is not None:
+            parent._data["children"]._items.append(self)
+
+    def add_bin(self, name):
+        return ProjectItem(name, ProjectItemType.BIN, self)
+
+    def add_item(self, name, duration):
+        return ProjectItem(name, ProjectItemType.CLIP, self, duration)
+
+
+# pymiere.ProjectItem(**kwargs) for what _eval_script_returning_object(as_kwargs=True) returns
+def project_item_from_kwargs(pymiere_id, **kwargs):
+    return bridge.objects[pymiere_id]
+
+
+class ComponentParam(FakeObject):
+    def __init__(self, name, value):
+        super().__init__(displayName=name)
+        self._value = value
+        self._time_varying = False
+        self._keys = {}
+
+    def getValue(self):
+        bridge.call()
+        return self._value
+
+    def setValue(self, value, update_ui=True):
+        bridge.call()
+        self._value = value
+
+    def getValueAtTime(self, seconds):
+        bridge.call()
+        if hasattr(seconds, "_data"):
+            seconds = int(seconds._data["ticks"]) / TICKS_PER_SECOND
+        if not self._keys:
+            return self._value
+        # the value of the closest keyframe at or before then (no interpolation)
+        before = [t for t in self._keys if t <= seconds + 1e-9]
+        return self._keys[max(before) if before else min(self._keys)]
+
+    def setTimeVarying(self, varying, update_ui=True):
+        bridge.call()
+        self._time_varying = varying
+
+    def addKey(self, seconds):
+        bridge.call()
+        self._keys.setdefault(round(seconds, 6), self._value)
+
+    def setValueAtKey(self, seconds, value, update_ui=True):
+        bridge.call()
+        self._keys[round(seconds, 6)] = value
+
+
+class Component(FakeObject):
+    def __init__(self, name, properties):
+        super().__init__(displayName=name, properties=Collection(properties))
+
+
+class TrackItem(FakeObject):
+    def __init__(self, project_item, start_seconds):
+        duration = project_item._data["duration"]
+        motion = Component("Motion", [ComponentParam(name, 100.0 if name == "Scale" else None)
+                                      for name in MOTION_PROPERTIES])
+        components = [Component("Opacity", [ComponentParam("Opacity", 100.0)]), motion]
+        super().__init__(name=project_item._data["name"], projectItem=project_item,
+                         components=Collection(components),
+                         start=seconds_time(start_seconds), end=seconds_time(start_seconds + duration),
+                         inPoint=seconds_time(0), outPoint=seconds_time(duration),
+                         duration=seconds_time(duration))
+
+    def _set(self, name, value):
+        if name != "end":
+            raise AttributeError("{0} can't be set in the fake".format(name))
+        end = int(value._data["ticks"]) / TICKS_PER_SECOND
+        start = int(self._data["start"]._data["ticks"]) / TICKS_PER_SECOND
+        self._data["end"] = seconds_time(end)
+        self._data["duration"] = seconds_time(end - start)
+        self._data["outPoint"] = seconds_time(end - start)
+
+    def _seconds(self, name):
+        return int(self._data[name]._data["ticks"]) / TICKS_PER_SECOND
+
+
+# A Time made inside Premiere, which isn't a bridge call
+def seconds_time(seconds):
+    with bridge.inside():
+        return time_from_seconds(seconds)
+
+
+class Track(FakeObject):
+    def __init__(self):
+        super().__init__(clips=Collection())
+
+    def overwriteClip(self, project_item, seconds):
+        bridge.call()
+        if hasattr(seconds, "_data"):
+            seconds = int(seconds._data["ticks"]) / TICKS_PER_SECOND
+        clips = self._data["clips"]._items
+        if bridge.track_cost:
+            time.sleep(bridge.track_cost * len(clips))
+        new_clip = TrackItem(project_item, seconds)
+        end = new_clip._seconds("end")
+        # like Premiere, replace the clips it covers and cut short the one it starts in
+        # (without the precision of keeping what's left of a clip it only covers the start of)
+        i = bisect.bisect_left(clips, seconds - 1e-9, key=lambda clip: clip._seconds("start"))
+        if i > 0 and clips[i - 1]._seconds("end") > seconds + 1e-9:
+            clips[i - 1]._set("end", seconds_time(seconds))
+        j = i
+        while j < len(clips) and clips[j]._seconds("start") < end - 1e-9:
+            j += 1
+        clips[i:j] = [new_clip]
+
+
+class Sequence(FakeObject):
+    def __init__(self, name, timebase=str(TICKS_PER_SECOND // 30)):
+        super().__init__(name=name, videoTracks=Collection([Track()]), timebase=timebase,
+                         sequenceID="fake-sequence-{0}".format(bridge.next_id))
+        self._settings = {}
+
+    def getSettings(self):
+        bridge.call()
+        return dict(self._settings)
+
+    def setSettings(self, settings):
+        bridge.call()
+        self._settings = dict(settings)
+
+
+class Project(FakeObject):
+    def __init__(self, path, name="project.prproj"):
+        root = ProjectItem(name, ProjectItemType.ROOT)
+        super().__init__(path=path, rootItem=root, sequences=Collection())
+
+    def createNewSequence(self, name, placeholder_id):
+        bridge.call()
+        sequence = Sequence(name)
+        self._data["sequences"]._items.append(sequence)
+        return sequence
+
+
+class App(FakeObject):
+    def __init__(self, project):
+        super().__init__(project=project)
+
+
+def alert(message):
+    bridge.call()
+
+
+# ---- ExtendScript emulation ----
+
+ES_STRING = re.compile(r'decodeURIComponent\("([^"]*)"\)')
+PYMIERE_REFERENCE = re.compile(r"\$\._pymiere\['([^']+)'\]")
+
+
+def project():
+    return sys.modules["pymiere"].objects.app._data["project"]
+
+
+# The sequence an ExtendScript expression refers to (see es_sequence in extendscript_batch.py)
+def resolve_sequence(expression):
+    match = PYMIERE_REFERENCE.search(expression)
+    if match:
+        return bridge.objects[match.group(1)]
+    sequence_id = unquote(ES_STRING.search(expression).group(1))
+    return next(x for x in project()._data["sequences"]._items if x._data["sequenceID"] == sequence_id)
+
+
+# The arguments the script's outermost function is called with
+def script_call(script):
+    return script[script.rindex("\n})(") + 4:]
+
+
+# bin_index.WALK_SCRIPT
+def emulate_walk(script):
+    call = script_call(script)
+    root = bridge.objects[PYMIERE_REFERENCE.search(call).group(1)]
+    known = {}
+    for match in re.finditer(r'"([^"]+)": \[decodeURIComponent\("([^"]*)"\), (\d+)\]', call):
+        known[match.group(1)] = [unquote(match.group(2)), int(match.group(3))]
+    bins = []
+    stack = [root]
+    while stack:
+        b = stack.pop()
+        children = b._data["children"]._items
+        old = known.get(b._data["nodeId"])
+        same = old is not None and old == [b._data["treePath"], len(children)]
+        child_bins, ids, names = [], None if same else [], None if same else []
+        for child in children:
+            if child._data["type"] == ProjectItemType.BIN:
+                child_bins.append(child._data["nodeId"])
+                stack.append(child)
+            elif not same:
+                ids.append(child._data["nodeId"])
+                names.append(child._data["name"])
+        bins.append([b._data["nodeId"], b._data["treePath"], len(children), child_bins, ids, names])
+    return {"bins": bins}
+
+
+FIND_ITEM = re.compile(r'findItem\(decodeURIComponent\("([^"]*)"\)')
+ITEM_REFERENCE = re.compile(FIND_ITEM.pattern + "|" + PYMIERE_REFERENCE.pattern)
+
+
+# The project item an ExtendScript expression refers to (see es_find_item in bin_index.py),
+# or None if it isn't in the project
+def resolve_item(expression):
+    match = ITEM_REFERENCE.search(expression)
+    if match.group(1) is not None:
+        return bridge.nodes.get(unquote(match.group(1)))
+    return bridge.objects[match.group(2)]
+
+
+# bin_index.REHYDRATE_SCRIPT
+def emulate_rehydrate(script):
+    node = resolve_item(script[script.index("return findItem("):])
+    return None if node is None else {"pymiere_id": node._pymiere_id}
+
+
+# extendscript_batch.BATCH_SCRIPT
+def emulate_batch(script):
+    def var(name):
+        return re.search(r"var {0} = (.*);\n".format(name), script).group(1)
+    seq = resolve_sequence(var("seq"))
+    items = [resolve_item(match.group(0)) for match in ITEM_REFERENCE.finditer(var("items"))]
+    placements = json.loads(var("placements"))
+    clip_idx = int(var("clipIdx"))
+    t = float(var("t"))
+    track = seq._data["videoTracks"]._items[0]
+    frame_seconds = int(seq._data["timebase"]) / TICKS_PER_SECOND
+    placed = 0
+    errors = []
+    for i, p in enumerate(placements):
+        try:
+            track.overwriteClip(items[p["item"]], t)
+            clip = track._data["clips"]._items[clip_idx]
+            motion = next(x for x in clip._data["components"]._items if x._data["displayName"] == "Motion")
+            props = { x._data["displayName"]: x for x in motion._data["properties"]._items }
+            if p["type"] == "video":
+                props["Scale"].setValue(p["scale"], True)
+            else:
+                clip.end = seconds_time(t + p["duration"])
+                in_time = clip._seconds("inPoint")
+                out_time = in_time + clip._seconds("duration") - frame_seconds
+                for key_time, scale in ((in_time, p["scaleIn"]), (out_time, p["scaleOut"])):
+                    props["Scale"].addKey(key_time)
+                    props["Scale"].setValueAtKey(key_time, scale, True)
+                    props["Position"].addKey(key_time)
+                    props["Position"].setValueAtKey(key_time, [0.5, 0.5], True)
+        except Exception as e:
+            errors.append({"index": i, "message": str(e)})
+            break
+        t += clip._seconds("duration")
+        clip_idx += 1
+        placed += 1
+    return {"end": t, "placed": placed, "clipIdx": clip_idx, "errors": errors}
+
+
+# build_journal.VERIFY_SCRIPT
+def emulate_verify(script):
+    call = script_call(script)
+    seq = bridge.objects[PYMIERE_REFERENCE.search(call).group(1)]
+    clip_indices = json.loads(call[call.index(", [") + 2:call.rindex(")")])
+    clips = seq._data["videoTracks"]._items[0]._data["clips"]._items
+    ends = [clips[i]._seconds("end") if 0 <= i < len(clips) else None for i in clip_indices]
+    return {"numClips": len(clips), "frame": int(seq._data["timebase"]) / TICKS_PER_SECOND, "ends": ends}
+
+
+# sequence_chunks.NEW_PART_SCRIPT
+def emulate_new_part(script):
+    call = script_call(script)
+    template = bridge.objects[PYMIERE_REFERENCE.search(call).group(1)]
+    name = unquote(ES_STRING.search(call).group(1))
+    sequences = project()._data["sequences"]._items
+    sequences[:] = [x for x in sequences if x._data["name"] != name]
+    part = Sequence(name, template._data["timebase"])
+    part._settings = dict(template._settings)
+    sequences.append(part)
+    return part._data["sequenceID"]
+
+
+# sequence_chunks.NEST_SCRIPT
+def emulate_nest(script):
+    call = script_call(script)
+    seq = bridge.objects[PYMIERE_REFERENCE.search(call).group(1)]
+    part = resolve_sequence(call[call.index(",") + 1:])
+    start = float(call[call.rindex(",") + 1:call.rindex(")")])
+    clips = part._data["videoTracks"]._items[0]._data["clips"]._items
+    duration = clips[-1]._seconds("end") if clips else 0.0
+    item = ProjectItem(part._data["name"], ProjectItemType.CLIP, None, duration)
+    seq._data["videoTracks"]._items[0].overwriteClip(item, start)
+    return {"end": start + duration}
+
+
+def emulate(script):
+    if "$._chronoSeq.session" in script:
+        return bridge.session
+    if "var stack = [root];" in script:
+        return emulate_walk(script)
+    if "track.overwriteClip(items[p.item], t);" in script:
+        return emulate_batch(script)
+    if "return findItem(" in script:
+        return emulate_rehydrate(script)
+    if "var ends = [];" in script:
+        return emulate_verify(script)
+    if "template.clone();" in script:
+        return emulate_new_part(script)
+    if "overwriteClip(part.projectItem, start);" in script:
+        return emulate_nest(script)
+    raise NotImplementedError("The fake pymiere doesn't know how to run this script:\n" + script[:200])
+
+
+def eval_script(script):
+    bridge.call()
+    bridge.scripts += 1
+    with bridge.inside():
+        return emulate(script)
+
+
+def _eval_script_returning_object(script, as_kwargs=False):
+    # through the module like pymiere does, so anything wrapping eval_script sees it
+    result = sys.modules["pymiere.core"].eval_script(script)
+    if not as_kwargs and isinstance(result, dict):
+        return project_item_from_kwargs(**result)
+    return result
+
+
+# ---- putting it together ----
+
+# Register the fake as the pymiere package (and the submodules the script imports),
+# with app.project being project.
+# Without a project, app.project is an empty one. That's enough for benchmarks that only
+# import create_chronological_prpro_seq for its part 1 functions, since importing it imports
+# pymiere, which only works with Premiere installed.
+def install(project=None, latency=0.0):
+    if project is None:
+        project = Project(path="C:\\fake\\unused.prproj")
+    bridge.latency = latency
+    pymiere = types.ModuleType("pymiere")
+    objects = types.ModuleType("pymiere.objects")
+    objects.app = App(project)
+    objects.ProjectItemType = ProjectItemType
+    objects.alert = alert
+    core = types.ModuleType("pymiere.core")
+    core.eval_script = eval_script
+    core._eval_script_returning_object = _eval_script_returning_object
+    wrappers = types.ModuleType("pymiere.wrappers")
+    wrappers.time_from_seconds = time_from_seconds
+    pymiere.objects = objects
+    pymiere.core = core
+    pymiere.wrappers = wrappers
+    pymiere.Time = Time
+    pymiere.ProjectItem = project_item_from_kwargs
+    sys.modules.update({ "pymiere": pymiere, "pymiere.objects": objects,
+                         "pymiere.core": core, "pymiere.wrappers": wrappers })
+    return bridge
+
+
+# Make project app.project, after install()
+def use_project(project):
+    sys.modules["pymiere"].objects.app = App(project)
@@ -0,0 +1,340 @@
+import json
+import os
+from urllib.parse import quote
+import uuid
+
+import pymiere
+
+from manifest import normalize_path
+from instrumentation import report
+
+# Index of the media in the Premiere Pro project bins, so that finding the project item
+# for a file doesn't mean searching the bins (which Premiere is incredibly slow at).
+#
+# Only stable identifiers are stored (each item's nodeId and treePath), never pymiere
+# objects, which stop working as soon as Premiere is restarted. The project item for a file
+# is only fetched from Premiere ("rehydrated") when it's actually needed.
+#
+# The index is saved as JSON, stamped with the project's path and a fingerprint of the
+# running Premiere session, and is thrown away automatically if either has changed.
+# Within the same session, updating the index only walks the bins again whose number
+# of children has changed since the index was saved.
+#
+# The bins are walked inside Premiere by a single ExtendScript call (WALK_SCRIPT) that
+# sends back the whole bin tree at once, instead of asking for the type and treePath of
+# every item over the bridge one at a time. Walking the pymiere proxies is still there
+# as a fallback if that call fails.
+
+DEFAULT_INDEX_FILENAME = "bin_index.json"
+INDEX_VERSION = 1
+
+# pymiere.objects.ProjectItemType.BIN (see bin_enum)
+_bin_enum = None
+
+
+# ---- ExtendScript helpers ----
+# pymiere doubles every backslash in the code it sends to Premiere, so strings are
+# passed percent-encoded and decoded on the ExtendScript side instead of being escaped.
+def es_string(s):
+    return 'decodeURIComponent("{0}")'.format(quote(s, safe=""))
+
+
+# The fingerprint is a random id stored in ExtendScript's global state the first time
+# it's asked for. That state only lasts as long as Premiere is running.
+SESSION_SCRIPT = """
+(function(candidate) {{
+    if (typeof $._chronoSeq === 'undefined') {{
+        $._chronoSeq = {{ "session": candidate, "nodes": {{}} }};
+    }}
+    return $._chronoSeq.session;
+}})({candidate});
+"""
+
+# Finds a project item by following its treePath down from the root of the project,
+# and at the last level matching its nodeId (names aren't necessarily unique).
+# Every sibling passed on the way is remembered by nodeId, so the rest of a bin's items
+# can be found without searching again. Scripts that use it call it findItem (see es_find_item).
+FIND_ITEM_FUNCTION = """function(nodeId, parts) {
+    var nodes = $._chronoSeq.nodes;
+    if (nodes[nodeId]) {
+        return nodes[nodeId];
+    }
+    var parent = app.project.rootItem;
+    for (var i = 0; i < parts.length; i++) {
+        var last = i === parts.length - 1;
+        var next = null;
+        for (var j = 0; j < parent.children.numItems; j++) {
+            var child = parent.children[j];
+            if (last) {
+                nodes[child.nodeId] = child;
+            }
+            if (next === null && (last ? child.nodeId === nodeId : (child.type === ProjectItemType.BIN && child.name === parts[i]))) {
+                next = child;
+            }
+        }
+        if (next === null) {
+            return undefined;
+        }
+        parent = next;
+    }
+    return parent;
+}"""
+
+# Sends back the project item {item} (see es_find_item)
+REHYDRATE_SCRIPT = """
+(function() {{
+    var findItem = {find_item};
+    return {item};
+}})()
+"""
+
+
+# Walk every bin under a root bin without recursion, using a stack.
+# known maps the nodeId of each bin already in the index to [treePath, numChildren];
+# bins that still match are sent back without their items (null), since those haven't changed.
+# Every item passed is remembered by nodeId so it can be rehydrated without searching.
+# Sends back { "bins": [[nodeId, treePath, numChildren, [child bin nodeIds], [item nodeIds] or null, [item names] or null]] }
+WALK_SCRIPT = """
+(function(root, known) {{
+    if (typeof $._chronoSeq === 'undefined') {{
+        $._chronoSeq = {{ "session": null, "nodes": {{}} }};
+    }}
+    var nodes = $._chronoSeq.nodes;
+    var bins = [];
+    var stack = [root];
+    while (stack.length > 0) {{
+        var bin = stack.pop();
+        var children = bin.children;
+        var numChildren = children.numItems;
+        var old = known[bin.nodeId];
+        var same = old !== undefined && old[0] === bin.treePath && old[1] === numChildren;
+        var childBins = [];
+        var ids = same ? null : [];
+        var names = same ? null : [];
+        for (var i = 0; i < numChildren; i++) {{
+            var child = children[i];
+            if (child.type === ProjectItemType.BIN) {{
+                childBins.push(child.nodeId);
+                stack.push(child);
+            }} else {{
+                nodes[child.nodeId] = child;
+                if (!same) {{
+                    ids.push(child.nodeId);
+                    names.push(child.name);
+                }}
+            }}
+        }}
+        bins.push([bin.nodeId, bin.treePath, numChildren, childBins, ids, names]);
+    }}
+    return ExtendJSON.stringify({{ "bins": bins }});
+}})({root}, {known})
+"""
+
+
+# Looking up ProjectItemType.BIN asks Premiere, so it's only done the first time it's needed
+# rather than whenever this module is imported
+def bin_enum():
+    global _bin_enum
+    if _bin_enum is None:
+        _bin_enum = pymiere.objects.ProjectItemType.BIN
+    return _bin_enum
+
+
+def get_session_fingerprint():
+    pymiere.core.eval_script(SESSION_SCRIPT.format(candidate=es_string(uuid.uuid4().hex)))
+    # ask again in case the first call returned something unexpected
+    return pymiere.core.eval_script("$._chronoSeq.session;")
+
+
+# The bins between the project and the item, ex. "\winter trip.prproj\West Trip\Tim's Photos\IMG_7079.mov"
+# becomes ["West Trip", "Tim's Photos", "IMG_7079.mov"]
+def tree_path_parts(tree_path):
+    return tree_path.split('\\')[2:]
+
+
+# ExtendScript expression for the project item with node_id and tree_path, in a script
+# that has FIND_ITEM_FUNCTION as findItem
+def es_find_item(node_id, tree_path):
+    parts = ", ".join(es_string(part) for part in tree_path_parts(tree_path))
+    return "findItem({0}, [{1}])".format(es_string(node_id), parts)
+
+
+def rehydrate(node_id, tree_path):
+    script = REHYDRATE_SCRIPT.format(find_item=FIND_ITEM_FUNCTION, item=es_find_item(node_id, tree_path))
+    kwargs = pymiere.core._eval_script_returning_object(script, as_kwargs=True)
+    if not isinstance(kwargs, dict):
+        return None
+    return pymiere.ProjectItem(**kwargs)
+
+
+class BinIndex:
+    # to_filepath turns an item's treePath into the path of its file (see bin_tree_path_to_filepath)
+    def __init__(self, stamp, to_filepath, bins=None, root_node_id=None):
+        self.stamp = stamp
+        self.to_filepath = to_filepath
+        # bin nodeId -> { "treePath", "numChildren", "bins": [child bin nodeIds], "items": [[nodeId, treePath]] }
+        self.bins = bins or {}
+        self.root_node_id = root_node_id
+        self.items = {}
+        self.proxies = {}
+        self.walked = 0
+        self.reused = 0
+        self.elapsed = 0.0
+        self.progress = None
+        self._build_items()
+
+    def _build_items(self):
+        self.items = {}
+        for bin_info in self.bins.values():
+            for node_id, tree_path in bin_info["items"]:
+                self.items.setdefault(normalize_path(self.to_filepath(tree_path)), (node_id, tree_path))
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, filepath):
+        return normalize_path(filepath) in self.items
+
+    # Returns the project item for filepath, fetching it from Premiere the first time.
+    # Raises KeyError if it isn't in the project.
+    def __getitem__(self, filepath):
+        key = normalize_path(filepath)
+        node_id, tree_path = self.items[key]
+        proxy = self.proxies.get(node_id)
+        if proxy is None:
+            proxy = rehydrate(node_id, tree_path)
+            if proxy is None:
+                raise KeyError(filepath)
+            self.proxies[node_id] = proxy
+        return proxy
+
+    # Returns an ExtendScript expression for the project item for filepath (see es_find_item),
+    # so a script can find it inside Premiere instead of it being fetched first.
+    # Raises KeyError if it isn't in the project.
+    def es_item(self, filepath):
+        node_id, tree_path = self.items[normalize_path(filepath)]
+        return es_find_item(node_id, tree_path)
+
+    # Walk every child of bin_proxy, recording the items and walking new child bins.
+    def _walk_bin(self, bin_proxy, node_id, tree_path):
+        old = self.bins.get(node_id)
+        children = bin_proxy.children
+        bin_info = { "treePath": tree_path, "numChildren": len(children), "bins": [], "items": [] }
+        bin_type = bin_enum()
+        for child in children:
+            child_node_id = child.nodeId
+            child_tree_path = child.treePath
+            if child.type == bin_type:
+                bin_info["bins"].append(child_node_id)
+                self._update_bin(child, child_node_id, child_tree_path)
+            else:
+                bin_info["items"].append([child_node_id, child_tree_path])
+                self.progress.add()
+        self.bins[node_id] = bin_info
+        self.walked += 1
+        # forget child bins that aren't there anymore
+        if old is not None:
+            for removed in set(old["bins"]) - set(bin_info["bins"]):
+                self._forget_bin(removed)
+
+    def _forget_bin(self, node_id):
+        bin_info = self.bins.pop(node_id, None)
+        if bin_info is not None:
+            for child in bin_info["bins"]:
+                self._forget_bin(child)
+
+    # Only walk a bin again if its number of children changed, otherwise just check its child bins
+    def _update_bin(self, bin_proxy, node_id, tree_path):
+        old = self.bins.get(node_id)
+        if old is None or old["treePath"] != tree_path or len(bin_proxy.children) != old["numChildren"]:
+            self._walk_bin(bin_proxy, node_id, tree_path)
+            return
+        self.reused += 1
+        for child_node_id in old["bins"]:
+            child_tree_path = self.bins[child_node_id]["treePath"] if child_node_id in self.bins else None
+            child = rehydrate(child_node_id, child_tree_path) if child_tree_path else None
+            if child is None:
+                # can't find it anymore, so walk the parent from scratch
+                self._walk_bin(bin_proxy, node_id, tree_path)
+                return
+            self._update_bin(child, child_node_id, child_tree_path)
+
+    # Walk the whole tree under parent_bin in one ExtendScript call (see WALK_SCRIPT).
+    # Returns False if Premiere didn't send back what was expected.
+    def _walk_bulk(self, parent_bin):
+        # treePaths have backslashes in them, so they can't just be sent as JSON (see es_string)
+        known = ", ".join("{0}: [{1}, {2}]".format(json.dumps(node_id), es_string(bin_info["treePath"]), int(bin_info["numChildren"]))
+                          for node_id, bin_info in self.bins.items())
+        script = WALK_SCRIPT.format(root="$._pymiere['{0}']".format(parent_bin._pymiere_id),
+                                    known="{" + known + "}")
+        result = pymiere.core.eval_script(script)
+        if not isinstance(result, dict) or not isinstance(result.get("bins"), list):
+            return False
+        bins = {}
+        for node_id, tree_path, num_children, child_bins, ids, names in result["bins"]:
+            if ids is None:
+                bin_info = dict(self.bins[node_id], bins=child_bins)
+                self.reused += 1
+            else:
+                items = [[item_id, tree_path + "\\" + name] for item_id, name in zip(ids, names)]
+                bin_info = { "treePath": tree_path, "numChildren": num_children, "bins": child_bins, "items": items }
+                self.walked += 1
+            bins[node_id] = bin_info
+            self.progress.add(len(bin_info["items"]))
+        # bins that weren't sent back aren't there anymore
+        self.bins = bins
+        return True
+
+    # Bring the index up to date with the bin the media is in.
+    # With bulk=False (or if the bulk walk fails) the bins are walked through pymiere instead.
+    def update(self, parent_bin, bulk=True):
+        root_node_id = parent_bin.nodeId
+        if root_node_id != self.root_node_id:
+            self.bins = {}
+            self.root_node_id = root_node_id
+        self.walked = 0
+        self.reused = 0
+        self.progress = report.progress("Cataloguing project items")
+        if not (bulk and self._walk_bulk(parent_bin)):
+            if bulk:
+                print("WARNING: Couldn't walk the project bins in one go, so they'll be walked one item at a time")
+                self.walked = 0
+                self.reused = 0
+            self._update_bin(parent_bin, root_node_id, parent_bin.treePath)
+        self._build_items()
+        self.progress.done()
+        self.elapsed = self.progress.elapsed()
+
+    def save(self, filename):
+        data = { "version": INDEX_VERSION,
+                 "stamp": self.stamp,
+                 "root": self.root_node_id,
+                 "bins": self.bins }
+        tmp_filename = filename + ".tmp"
+        with open(tmp_filename, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_filename, filename)
+
+
+# What a saved index has to match to still be valid
+def make_stamp(project, search_root):
+    return { "project": project.path,
+             "session": get_session_fingerprint(),
+             "search_root": os.path.normpath(search_root) }
+
+
+# Load the index saved in filename if it's still valid for this project and Premiere session,
+# otherwise start a new one. Either way, call update() on it before use.
+def load_bin_index(filename, project, search_root, to_filepath):
+    stamp = make_stamp(project, search_root)
+    if os.path.exists(filename):
+        try:
+            with open(filename, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == INDEX_VERSION and data.get("stamp") == stamp:
+                print("Loaded the project bin index from {0}".format(filename))
+                return BinIndex(stamp, to_filepath, data["bins"], data["root"])
+            print("The project bin index in {0} is from a different project or Premiere session, so it will be rebuilt".format(filename))
+        except (ValueError, KeyError) as e:
+            print("The project bin index in {0} couldn't be read ({1}), so it will be rebuilt".format(filename, e))
+    return BinIndex(stamp, to_filepath)
@@ -0,0 +1,242 @@
+import hashlib
+import json
+import os
+import time
+
+import pymiere
+
+from extendscript_batch import es_reference
+
+# Checkpoint journal of the clips added to a sequence, so that an interrupted build can pick
+# up where it left off without asking Premiere what's already on the track.
+#
+# The journal is a text file of JSON lines. The first line is a header stamping it with the
+# sequence and the sorted files list it was built from. Every line after that is an entry
+# written once a clip (or a batch of clips) has been completely added:
+#
+#   [index of the clip in the sorted files list, index of the next clip on the track, sequence time it ended at]
+#
+# Entries are only ever appended, and the file is synced to disk every SYNC_EVERY entries or
+# SYNC_INTERVAL seconds, so a crash loses at most the last few. Those clips are then simply
+# overwritten again on the next run, the same way the last clip on the track used to be.
+# Resuming only reads the header and the last line of the journal, however long it is.
+
+DEFAULT_JOURNAL_FILENAME = "build_journal.jsonl"
+JOURNAL_VERSION = 1
+SYNC_EVERY = 100
+SYNC_INTERVAL = 1.0
+# bytes read at a time from the end of the journal looking for the last entry
+TAIL_CHUNK = 4096
+
+# Looks up the clips on the first video track that the journal's entries say should be there.
+# {seq}: the sequence, {clip_indices}: JSON array of track clip indices.
+# Sends back { "numClips", "frame": seconds per frame, "ends": [end in seconds or null] }
+VERIFY_SCRIPT = """
+(function(seq, clipIndices) {{
+    var clips = seq.videoTracks[0].clips;
+    var numClips = clips.numItems;
+    var frame = new Time();
+    frame.ticks = seq.timebase;
+    var ends = [];
+    for (var i = 0; i < clipIndices.length; i++) {{
+        var idx = clipIndices[i];
+        ends.push(idx >= 0 && idx < numClips ? clips[idx].end.seconds : null);
+    }}
+    return ExtendJSON.stringify({{ "numClips": numClips, "frame": frame.seconds, "ends": ends }});
+}})({seq}, {clip_indices})
+"""
+
+
+class JournalError(Exception):
+    pass
+
+
+# Where a journal with no entries yet starts: before the first file, at the start of the sequence
+def beginning(offset):
+    return Checkpoint(-1, 0, 0.0, offset)
+
+
+# A fully added clip (or batch of clips), see the top of this file.
+# offset is where its entry ends in the journal, if it was read from one.
+class Checkpoint:
+    __slots__ = ("index", "clip_idx", "end", "offset")
+
+    def __init__(self, index, clip_idx, end, offset=None):
+        self.index = index
+        self.clip_idx = clip_idx
+        self.end = end
+        self.offset = offset
+
+    def to_json(self):
+        return json.dumps([self.index, self.clip_idx, self.end])
+
+    @staticmethod
+    def from_json(line, offset=None):
+        index, clip_idx, end = json.loads(line)
+        return Checkpoint(int(index), int(clip_idx), float(end), offset)
+
+
+# Fingerprint of the sorted files list the clips' indices refer to
+def file_digest(filename):
+    digest = hashlib.sha1()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_header(seq, sorted_json_filename, num_files):
+    return { "version": JOURNAL_VERSION,
+             "sequence": seq.sequenceID,
+             "sorted_files": file_digest(sorted_json_filename),
+             "files": num_files }
+
+
+# Appends checkpoints to a journal file
+class BuildJournal:
+    def __init__(self, filename, f):
+        self.filename = filename
+        self.f = f
+        self.unsynced = 0
+        self.last_sync = time.perf_counter()
+        self.last = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def record(self, index, clip_idx, end):
+        self.last = Checkpoint(index, clip_idx, end)
+        self.f.write(self.last.to_json() + "\n")
+        self.unsynced += 1
+        if self.unsynced >= SYNC_EVERY or time.perf_counter() - self.last_sync >= SYNC_INTERVAL:
+            self.sync()
+
+    def sync(self):
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.unsynced = 0
+        self.last_sync = time.perf_counter()
+
+    def close(self):
+        if self.f is not None:
+            self.sync()
+            self.f.close()
+            self.f = None
+
+
+# Start a new journal in filename for a sequence being built from scratch, replacing whatever was there.
+def start_journal(filename, header):
+    f = open(filename, "w", encoding="utf-8")
+    f.write(json.dumps(header) + "\n")
+    journal = BuildJournal(filename, f)
+    journal.sync()
+    return journal
+
+
+# Returns (header, offset of the first entry) from the start of an open journal
+def read_header(f):
+    line = f.readline()
+    if not line.endswith(b"\n"):
+        raise JournalError("it has no header")
+    try:
+        return json.loads(line), len(line)
+    except ValueError as e:
+        raise JournalError("its header couldn't be read ({0})".format(e))
+
+
+# Returns the last complete entry of an open journal whose entries start at offset start,
+# or None, reading backwards from the end. An entry left half written by a crash is ignored.
+def read_last_entry(f, start):
+    pos = f.seek(0, os.SEEK_END)
+    tail = b""
+    while pos > start:
+        step = min(TAIL_CHUNK, pos - start)
+        pos -= step
+        f.seek(pos)
+        tail = f.read(step) + tail
+        # try the complete lines from the last one back, leaving the first one for the next
+        # chunk if it might only be the end of a line
+        line_end = tail.rfind(b"\n")
+        while line_end >= 0:
+            line_start = tail.rfind(b"\n", 0, line_end) + 1
+            if line_start == 0 and pos > start:
+                break
+            try:
+                return Checkpoint.from_json(tail[line_start:line_end], pos + line_end + 1)
+            except (ValueError, TypeError):
+                line_end = line_start - 1
+        tail = tail[:line_end + 1] if line_end >= 0 else tail
+    return None
+
+
+# Returns the last checkpoint in the journal in filename, or None (saying why) if there's no
+# journal for this sequence and sorted files list (see make_header).
+def load_checkpoint(filename, header):
+    if not os.path.exists(filename):
+        return None
+    try:
+        with open(filename, "rb") as f:
+            saved_header, start = read_header(f)
+            if saved_header != header:
+                print("The build journal in {0} is for a different sequence or sorted files list, so it won't be used".format(filename))
+                return None
+            checkpoint = read_last_entry(f, start)
+    except JournalError as e:
+        print("The build journal in {0} can't be used, {1}".format(filename, e))
+        return None
+    return checkpoint if checkpoint is not None else beginning(start)
+
+
+# Carry on appending to the journal in filename after checkpoint (from load_checkpoint or
+# verify_checkpoint), dropping every entry after it.
+def resume_journal(filename, checkpoint):
+    with open(filename, "r+b") as f:
+        f.truncate(checkpoint.offset)
+    journal = BuildJournal(filename, open(filename, "a", encoding="utf-8"))
+    journal.last = checkpoint
+    return journal
+
+
+# Returns (every complete entry in the journal in filename, offset of the first one)
+def read_entries(filename):
+    entries = []
+    with open(filename, "rb") as f:
+        _, start = read_header(f)
+        offset = start
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            offset += len(line)
+            try:
+                entries.append(Checkpoint.from_json(line, offset))
+            except (ValueError, TypeError):
+                break
+    return entries, start
+
+
+# Check every entry of the journal in filename against the clips actually on seq's first video
+# track, in a single call to Premiere. Returns the last checkpoint that agrees with the track,
+# so that anything after it is added again.
+def verify_checkpoint(seq, filename):
+    entries, start = read_entries(filename)
+    if not entries:
+        return beginning(start)
+    script = VERIFY_SCRIPT.format(seq=es_reference(seq),
+                                  clip_indices=json.dumps([entry.clip_idx - 1 for entry in entries]))
+    result = pymiere.core.eval_script(script)
+    if not isinstance(result, dict):
+        raise JournalError("unexpected result from Premiere while checking the build journal: {0}".format(result))
+    tolerance = result["frame"] / 2
+    good = beginning(start)
+    for entry, end in zip(entries, result["ends"]):
+        # an entry from before any clip was placed has nothing to check
+        if entry.clip_idx > 0 and (end is None or abs(end - entry.end) > tolerance):
+            break
+        good = entry
+    if good is not entries[-1]:
+        print(("WARNING: The track only agrees with the build journal in {0} up to clip {1} of {2}, "
+               "the clips after that will be added again").format(filename, good.clip_idx, entries[-1].clip_idx))
+    return good
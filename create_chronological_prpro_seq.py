@@ -2,136 +2,90 @@ import pymiere
 from pymiere.wrappers import time_from_seconds
 import os
 import sys
-import win32com.client
-from win32com.propsys import propsys, pscon
-import pytz
 from datetime import datetime, timezone
 import json
-import cv2
 import re
-import pickle
+import struct
+import argparse
+import atexit
+import itertools
+import time
+from parallel_extract import extract_all, Ready, EXECUTOR_TYPES
+from async_extract import extract_all_async, ASYNC_EXECUTOR, DEFAULT_ROOT_CONCURRENCY, DEFAULT_TIMEOUT, DEFAULT_RETRIES
+from metadata_cache import MetadataCache, DEFAULT_CACHE_FILENAME, config_hash
+from metadata_backends import get_file_metadata, BACKENDS, DEFAULT_BACKEND, DATE_META, VIDEO_EXTENSIONS
+from media_headers import probe_dimensions, MediaHeaderError
+from timezone_index import compile_tz_config, TimezoneConfigError
+from external_sort import external_sort
+from manifest import Manifest, read_sorted_files, write_sorted_files
+from dimension_lookup import DimensionLookup, MATCH_MODES, FALLBACKS
+from extendscript_batch import ClipBatch, DEFAULT_BATCH_SIZE
+from sequence_chunks import new_part, nest_part, part_name
+from property_resolver import PropertyResolver
+from bin_index import load_bin_index, DEFAULT_INDEX_FILENAME
+from build_journal import (make_header, start_journal, load_checkpoint, verify_checkpoint, resume_journal,
+                           Checkpoint, JournalError, DEFAULT_JOURNAL_FILENAME)
+from file_pipeline import ExcludeFilter, walk_dirs, pair_by_directory, directory_of, as_record, DEFAULT_EXCLUDES
+from instrumentation import report, OUTPUT_MODES, DEFAULT_OUTPUT_MODE, DEFAULT_REPORT_FILENAME
 
 # To run:
-# `python3 ./create_chronological_prpro_seq <relative search path> <sorted files list json filename> <timezone config json filename> <name of sequence in Premiere>`
-# Example: `python3 ./create_chronological_prpro_seq .. sorted_files.json timezone_config.json`
+# `python3 ./create_chronological_prpro_seq <relative search path> <sorted files list json filename> <timezone config json filename> <name of sequence in Premiere> [--workers N]`
+# Example: `python3 ./create_chronological_prpro_seq .. sorted_files.json timezone_config.json GENERATED_SEQUENCE --workers 8`
 
 # IMPORTANT: Manually import all files into premiere *first*.
-#            Delete bin_dict_pkl.pkl every time you restart Premiere
-
-# TODO: automate deleting and regenerating bin_dict_pkl.pkl when Premiere is restarted
 
 # ---- PART 1 FUNCTIONS: Sorting the files by earliest date in metadata ---- 
 
-DATE_META = ["Date modified", "Date created", "Date taken", "Date accessed", "Media created"]
-VIDEO_EXTENSIONS = [".mp4", ".mov"]
-
-# Add 0's to front of single-digit months and days of the month and hours.
-# Assumes string is formatted like '1/2/2022 2:41 PM' for example.
-# This would become '01/02/2022 02:41 PM'
-# Also handle unicode junk
-def clean_date_string(date_string):
-    if date_string is None:
-        return "NA"
-    # remove unicode junk
-    date_string = date_string.replace('\u200f', '').replace('\u200e', '')
-    # split the date into its parts to see if we need to pad with 0
-    date_parts = date_string.split('/')
-    # Handle padding month
-    if len(date_parts[0]) == 1:
-        date_string = '0' + date_string
-    # Handle padding day of month
-    if len(date_parts[1]) == 1:
-        date_string = date_string[:3] + '0' + date_string[3:]
-    # add padding to hour if necessary
-    if date_string.split(' ')[1].index(':') < 2:
-        colon_idx = date_string.index(':')
-        date_string = date_string[:colon_idx - 1] + '0' + date_string[colon_idx - 1:]
-    return date_string
-
-
-# https://stackoverflow.com/questions/12521525/reading-metadata-with-python
-def get_file_metadata(dir_path, filename):
-    # Path shouldn't end with backslash, i.e. "E:\Images\Paris"
-    # filename must include extension, i.e. "PID manual.pdf"
-    # Returns dictionary containing all file metadata.
-    sh = win32com.client.gencache.EnsureDispatch('Shell.Application', 0)
-    ns = sh.NameSpace(dir_path)
-
-    file_metadata = {}
-
-    column = 0
-    columns = []
-    while True:
-        colname=ns.GetDetailsOf(None, column)
-        if not colname:
-            break
-        columns.append(colname)
-        column += 1
-
-    item = ns.ParseName(str(filename))
-    for column in range(len(columns)):
-        colval=ns.GetDetailsOf(item, column)
-        if colval:
-            file_metadata[columns[column]] = colval
-    
-    for field in DATE_META:
-        file_metadata[field] = clean_date_string(file_metadata.get(field))
-
-    if os.path.splitext(filename)[-1].lower() in VIDEO_EXTENSIONS:
-        try:
-            # https://stackoverflow.com/questions/31507038/python-how-to-read-windows-media-created-date-not-file-creation-date
-            properties = propsys.SHGetPropertyStoreFromParsingName(os.path.join(dir_path, filename))
-            dt = properties.GetValue(pscon.PKEY_Media_DateEncoded).GetValue()
-            file_metadata["Media created"] = dt
-        except:
-            pass
-    return file_metadata
-
 DIMENSIONS_PATTERN = re.compile(r"(\d+) x (\d+)")
 
+# Get the dimensions of a file that's missing them in its metadata.
+# This only reads the file header (see probe_dimensions in media_headers.py) so no pixels
+# are ever decoded. OpenCV is only imported if the header can't be understood.
+def get_dimensions_from_file(filepath, is_video):
+    try:
+        dimensions = probe_dimensions(filepath)
+        if dimensions is not None:
+            return dimensions
+    except (MediaHeaderError, OSError, IndexError, struct.error):
+        pass
+    try:
+        import cv2
+    except ImportError:
+        return 0, 0
+    try:
+        if is_video:
+            vcap = cv2.VideoCapture(filepath)
+            try:
+                if vcap.isOpened():
+                    return int(vcap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(vcap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            finally:
+                vcap.release()
+        else:
+            im = cv2.imread(filepath)
+            if im is not None:
+                return int(im.shape[1]), int(im.shape[0])
+    except:
+        pass
+    return 0, 0
+
 # Search the metadata of a file and get its earliest date as well as its dimensions
 # because Adobe ExtendScript doesn't have a way to get the dimensions of a photo or video
 # from an item that has been imported into Premiere Pro for some reason :/
-def get_earliest_date_and_dimensions(filepath, subdir_tz_config):
-    
-    def determine_timezone(naive_dt):
-        utc_dt = pytz.utc.localize(naive_dt)
-        # determine which timezone to use by comparing the original time
-        # to each timezone config time
-        tz_to_use = subdir_tz_config["timezones"][0][1]
-        for dt_pair in subdir_tz_config["timezones"][1:]:
-            dt = datetime.strptime(dt_pair[0], '%B %d, %Y %I:%M:%S %p')
-            # update tz_to_use if the original time is later than a
-            # timezone option's time bound in the config
-            if utc_dt > pytz.utc.localize(dt):
-                tz_to_use = dt_pair[1]
-        return tz_to_use
-    
-    # used for the "Media created field"
-    def determine_timezone_media_created(naive_dt):
-        # determine which timezone to use by comparing the original time
-        # to each timezone config time
-        tz_to_use = subdir_tz_config["timezones"][0][1]
-        for dt_pair in subdir_tz_config["timezones"][1:]:
-            dt = datetime.strptime(dt_pair[0], '%B %d, %Y %I:%M:%S %p')
-            # update tz_to_use if the original time is later than a
-            # timezone option's time bound in the config
-            if naive_dt.astimezone(tz=pytz.timezone(dt_pair[1])) > pytz.utc.localize(dt):
-                tz_to_use = dt_pair[1]
-        return tz_to_use
-
+# subdir_tz_config is the compiled timezone config of the file's subdirectory (see timezone_index.py).
+# backend is the name of the metadata backend to read the file with (see metadata_backends.py).
+def get_earliest_date_and_dimensions(filepath, subdir_tz_config, backend=DEFAULT_BACKEND):
     dir_path = os.path.abspath(os.path.split(filepath)[0])
     filename = os.path.split(filepath)[-1]
-    file_meta = get_file_metadata(dir_path, filename)
+    file_meta = get_file_metadata(dir_path, filename, backend)
     correct_dt = None
     # convert to datetime objects for comparison
-    try:
-        # If the datetime field to use was specified in the config file...
-        naive_dt = datetime.strptime(file_meta[subdir_tz_config["datefield"]], '%m/%d/%Y %I:%M %p')
-        tz_to_use = pytz.timezone(determine_timezone(naive_dt))
+    # If the datetime field to use was specified in the config file...
+    if subdir_tz_config.datefield is not None:
+        naive_dt = datetime.strptime(file_meta[subdir_tz_config.datefield], '%m/%d/%Y %I:%M %p')
+        tz_to_use = subdir_tz_config.zone_for_wall_time(naive_dt)
         correct_dt = tz_to_use.localize(naive_dt)
 
-    except KeyError: # otherwise see if "Media created" if is there
+    else: # otherwise see if "Media created" if is there
         if file_meta["Media created"] != "NA":
             # Make the "Media created" field naive.
             # For the case of a "Media created" field, the datetime is initially timezone-aware,
@@ -139,8 +93,8 @@ def get_earliest_date_and_dimensions(filepath, subdir_tz_config):
             # For example, a video taken in PST would appear to have a tz-aware datetime that is accurate
             # if the video were actually taken in EST if the script is being run in EST.
             naive_dt = file_meta["Media created"].astimezone(datetime.now(timezone.utc).astimezone().tzinfo).replace(tzinfo=None)
-            tz_to_use = determine_timezone_media_created(naive_dt)
-            correct_dt = file_meta["Media created"].astimezone(tz=pytz.timezone(tz_to_use))
+            tz_to_use = subdir_tz_config.zone_for_local_time(naive_dt)
+            correct_dt = file_meta["Media created"].astimezone(tz=tz_to_use)
         else:
             datetime_meta = []
             for field in DATE_META:
@@ -152,26 +106,24 @@ def get_earliest_date_and_dimensions(filepath, subdir_tz_config):
                         # based on what was specified in the timezone config json
                         naive_dt = datetime.strptime(file_meta[field], '%m/%d/%Y %I:%M %p')
                         # determine which timezone to use
-                        tz_to_use = pytz.timezone(determine_timezone(naive_dt))
+                        tz_to_use = subdir_tz_config.zone_for_wall_time(naive_dt)
                         tz_aware_dt = tz_to_use.localize(naive_dt)
                         datetime_meta.append(tz_aware_dt)
             correct_dt = min(datetime_meta)
     
     
     # Get the dimensions, defaulting to 0 if the dimensions aren't in the metadata and if
-    # OpenCV can't calculate them. Some .MOV
+    # they can't be read from the file header (or, as a last resort, by OpenCV). Some .MOV
     width = 0
     height = 0
     # handle videos
-    if os.path.splitext(filepath)[-1].lower() in VIDEO_EXTENSIONS:
+    is_video = os.path.splitext(filepath)[-1].lower() in VIDEO_EXTENSIONS
+    if is_video:
         try:
             height = int(file_meta["Frame height"])
             width = int(file_meta["Frame width"])
         except:
-            vcap = cv2.VideoCapture(filepath)
-            if vcap.isOpened():
-                width = int(vcap.get(cv2.CAP_PROP_FRAME_WIDTH))
-                height = int(vcap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            pass
     # handle photos
     else:
         try:
@@ -185,12 +137,9 @@ def get_earliest_date_and_dimensions(filepath, subdir_tz_config):
                 width = int(dim_group.group(1))
                 height = int(dim_group.group(2))
             except:
-                try: # finally, see if OpenCV can get them
-                    im = cv2.imread(filepath)
-                    height = int(im.shape[0])
-                    width = int(im.shape[1])
-                except:
-                    pass
+                pass
+    if height == 0 or width == 0:
+        width, height = get_dimensions_from_file(filepath, is_video)
     if height == 0 or width == 0:
         print("Error getting dimensions of {0}. Dimensions will be left as 0".format(filepath))
 
@@ -200,135 +149,291 @@ def get_earliest_date_and_dimensions(filepath, subdir_tz_config):
              "height": height,
              "width": width }
 
+# Load and compile the timezone config (see timezone_index.py).
+# The subdirectories in it are written with Windows path separators,
+# so convert them to whatever this platform uses.
+# Raises a TimezoneConfigError if there's anything wrong with it.
+def load_tz_config(tz_config_filename):
+    with open(tz_config_filename, "r", encoding="utf-8") as f:
+        tz_config = json.load(f)
+    tz_config = { subdir.replace('\\', os.sep): subdir_config for subdir, subdir_config in tz_config.items() }
+    return compile_tz_config(tz_config, DATE_META)
+
+SIDECAR_EXTENSIONS = [".aae", ".xmp", ".thm"]
+
+# How suitable a file is to give its datetime to the rest of its live photo group:
+# the photo itself, then the video, then sidecar files like iPhone .AAE edits.
+def live_photo_anchor_rank(file_meta):
+    ext = os.path.splitext(file_meta["filename"])[-1].lower()
+    if ext in SIDECAR_EXTENSIONS:
+        return 2
+    if ext in VIDEO_EXTENSIONS:
+        return 1
+    return 0
+
+# Live photos are saved as a photo and a video (and sometimes an .AAE file) with the same
+# path apart from the extension. Give every file in such a group the datetime of its photo
+# so they all end up together. This indexes the files by path stem in a single pass, and
+# picks the same photo no matter what order the files were walked in.
+# Returns the groups that have no photo in them, which are paired with their video instead.
+def pair_live_photos(file_metas):
+    groups = {}
+    for file_meta in file_metas:
+        stem = os.path.normcase(os.path.splitext(file_meta["filename"])[0])
+        groups.setdefault(stem, []).append(file_meta)
+
+    orphans = []
+    for group in groups.values():
+        if len(group) < 2:
+            continue
+        anchor = min(group, key=lambda x: (live_photo_anchor_rank(x), x["filename"]))
+        if live_photo_anchor_rank(anchor) != 0:
+            orphans.append(group)
+        for file_meta in group:
+            file_meta["datetime"] = anchor["datetime"]
+    return orphans
+
+# Camera sequence number at the end of a filename (ex. 4025 in "IMG_4025.JPG")
+SEQUENCE_NUMBER_PATTERN = re.compile(r"(\d+)\D*$")
+
+# Key for sorting the files: the UTC timestamp of the earliest datetime, then the camera
+# sequence number for files with the same datetime (this won't be applicable for everything
+# but it's better than nothing), then the path so the order never depends on the walk order.
+def sort_key(file_meta):
+    filename = file_meta["filename"]
+    match = SEQUENCE_NUMBER_PATTERN.search(os.path.splitext(os.path.basename(filename))[0])
+    return (file_meta["datetime"].timestamp(), int(match.group(1)) if match else -1, filename)
+
+# Generator stage yielding (filepath, compiled timezone config of its subdirectory) for every
+# file in walked (see walk_dirs in file_pipeline.py).
+# Raises a TimezoneConfigError listing every subdirectory without a timezone config
+# as soon as the walk gets to the first one.
+# If sizes is given, the number of files in each directory is put in it (see pair_by_directory).
+def files_with_tz_config(walked, search_root, tz_config, exclude, sizes=None):
+    for dirpath, filenames in walked:
+        subdir_config = tz_config.get(os.path.relpath(dirpath, search_root))
+        if subdir_config is None:
+            missing_subdirs = sorted(set(os.path.relpath(d, search_root) for d, _ in walk_dirs(search_root, exclude)) - set(tz_config))
+            raise TimezoneConfigError("No timezone config for the subdirectories: {0}".format(
+                ", ".join('"{0}"'.format(subdir) for subdir in missing_subdirs)))
+        # the same as os.path.join(dirpath, filename) for every file, without a call for each
+        prefix = os.path.join(dirpath, "")
+        if sizes is not None:
+            sizes[directory_of(prefix + filenames[0])] = len(filenames)
+        for filename in filenames:
+            yield prefix + filename, subdir_config
+
+# Stat every (filepath, subdir_config) in files on a pool of threads ahead of time,
+# yielding (filepath, subdir_config, stat result) in the same order.
+def stat_files(files, workers):
+    def stat(filepath, subdir_config):
+        try:
+            return subdir_config, os.stat(filepath)
+        except OSError:
+            return subdir_config, None
+    for filepath, (subdir_config, st), _ in extract_all(stat, ((filepath, (subdir_config,)) for filepath, subdir_config in files),
+                                                        workers=max(workers, 2), executor_type="thread"):
+        if st is None:
+            # try again here, raising the error like the other executors would
+            st = os.stat(filepath)
+        yield filepath, subdir_config, st
+
+# Generator stage yielding a FileRecord for every (filepath, subdir_config) in files.
+# Files with an up to date entry in the metadata cache are passed straight through,
+# and the rest are read by the pool of workers (see parallel_extract.py).
+# They come out in the same order, except with the "async" executor_type (see async_extract.py)
+# where they come out as soon as they've been read. io_options are passed on to extract_all_async.
+# The files that couldn't be read are added to failed_files, and counters gets the numbers for the run report.
+def read_metadata(files, cache, backend, workers, executor_type, queue_size, failed_files, counters, **io_options):
+    is_async = executor_type == ASYNC_EXECUTOR
+    # filepath -> info needed to cache the result, for the files being read
+    reading = {}
+    config_hashes = {}
+    def jobs():
+        if cache is None:
+            statted = ((filepath, subdir_config, None) for filepath, subdir_config in files)
+        elif is_async:
+            # on slow storage the stat for the cache lookup takes about as long as reading the header,
+            # and the event loop would be stuck waiting on it
+            statted = stat_files(files, workers)
+        else:
+            statted = ((filepath, subdir_config, os.stat(filepath)) for filepath, subdir_config in files)
+        for filepath, subdir_config, st in statted:
+            cache_info = None
+            if cache is not None:
+                cache.mark_seen(filepath)
+                subdir_config_hash = config_hashes.get(id(subdir_config))
+                if subdir_config_hash is None:
+                    subdir_config_hash = config_hashes[id(subdir_config)] = config_hash(subdir_config.raw, backend)
+                file_meta = cache.lookup(filepath, st, subdir_config_hash)
+                if file_meta is not None:
+                    yield filepath, Ready(file_meta)
+                    continue
+                cache_info = (st, subdir_config_hash)
+            reading[filepath] = cache_info
+            yield filepath, (subdir_config, backend)
+
+    progress = report.progress("Reading metadata")
+    if is_async:
+        results = extract_all_async(get_earliest_date_and_dimensions, jobs(), workers=workers, queue_size=queue_size, **io_options)
+    else:
+        results = extract_all(get_earliest_date_and_dimensions, jobs(), workers=workers,
+                              executor_type=executor_type, queue_size=queue_size)
+    for filepath, file_meta, error in results:
+        progress.add()
+        counters["items"] += 1
+        if filepath not in reading:
+            yield as_record(file_meta)
+            continue
+        cache_info = reading.pop(filepath)
+        counters["read"] += 1
+        report.item(filepath)
+        if error is not None:
+            print("ERROR: Could not retrieve metadata of {0}, it will be left out:\n{1}".format(filepath, error))
+            failed_files.append(filepath)
+            continue
+        if cache_info is not None:
+            cache.store(filepath, *cache_info, file_meta)
+        yield as_record(file_meta)
+    progress.done()
+
 # Sort all the files based on earliest datetime in metadata
-def sort_files(search_root, sorted_json_filename, tz_config):
+# The files go through a pipeline of generators (see file_pipeline.py), so apart from the
+# sorted list itself nothing holds the whole library at once (and with sort_run_size, not even that).
+# workers, executor_type and queue_size control the extraction pool (see parallel_extract.py).
+# With the "async" executor_type, io_concurrency, io_timeout and io_retries are the most files read at
+# once per storage root, and the timeout and retries for each file (see async_extract.py).
+# cache is an optional MetadataCache (see metadata_cache.py) used to skip files that haven't changed.
+# backend is the name of the metadata backend used to read each file (see metadata_backends.py).
+# sort_run_size, if given, sorts more files than that with an external merge sort (see external_sort.py)
+# that's merged straight into sorted_json_filename.
+# excludes are glob patterns for the files and directories to leave out (see ExcludeFilter in file_pipeline.py).
+def sort_files(search_root, sorted_json_filename, tz_config, workers=1, executor_type="process", queue_size=None,
+               cache=None, backend=DEFAULT_BACKEND, sort_run_size=None, excludes=DEFAULT_EXCLUDES,
+               io_concurrency=DEFAULT_ROOT_CONCURRENCY, io_timeout=DEFAULT_TIMEOUT, io_retries=DEFAULT_RETRIES):
     print("Retrieving metadata of files...")
-    # Get list of all files in windows file explorer (not premiere)
-    
-    all_files = []
-    for (dirpath, _, filenames) in os.walk(search_root):
-        if "..\\Auto-Create-Chronological-Premiere-Pro-Sequence" not in dirpath:
-            # skip RAW files
-            all_files.extend(os.path.join(dirpath, filename) for filename in filenames if os.path.splitext(filename)[1].lower() not in [".cr2", ".cr3"])#, ".heic", ".jpeg"]) # uncomment for speed
-
-    numfiles = len(all_files)
-
-    # Retrieve all the relevant metadata for each file
-    filepathnames = set()
-    live_photos = []
-    file_metas = []
-    for i, filepath in enumerate(all_files):
-        if i % 100 == 0:
-            print("Metadata retrieved from", i, "files of", numfiles)
-        print(filepath)
-        subdir = os.path.join(*filepath.split('\\')[1:-1])
-        file_meta = get_earliest_date_and_dimensions(filepath, tz_config[subdir])
-        file_metas.append(file_meta)
-        # determine if it's a live photo (if the filepath without the extension has already appeared)
-        filepath_wo_ext = os.path.splitext(filepath)[0]
-        if filepath_wo_ext in filepathnames:
-            live_photos.append((filepath, i))
+    exclude = ExcludeFilter(excludes)
+    failed_files = []
+    orphans = []
+    is_async = executor_type == ASYNC_EXECUTOR
+    io_options = dict(root_concurrency=io_concurrency, timeout=io_timeout, retries=io_retries) if is_async else {}
+    # the number of files in each directory, to pair up live photos that are read out of order
+    sizes = {} if is_async else None
+
+    with report.phase("scan") as scan:
+        scan.update(items=0, read=0, backend=backend, workers=workers,
+                    executor=executor_type if workers > 1 or is_async else None, **io_options)
+        if cache is not None:
+            print("Checking {0} for previously retrieved metadata...".format(cache.filename))
+            cache.begin_scan()
+        # walk -> check timezone config -> read metadata (or look it up in the cache) -> pair live photos
+        files = files_with_tz_config(walk_dirs(search_root, exclude), search_root, tz_config, exclude, sizes)
+        records = read_metadata(files, cache, backend, workers, executor_type, queue_size, failed_files, scan, **io_options)
+        records = pair_by_directory(records, pair_live_photos, orphans, sizes)
+        # Sort by earliest date in metadata, then by the sequence number in the filename, then by path.
+        if sort_run_size:
+            merged = external_sort(records, sort_key, sort_run_size)
+            # the runs have all been sorted by the time the first file comes out
+            first = next(merged, None)
         else:
-            # add to the set of filepathnames we've already seen
-            filepathnames.add(os.path.splitext(filepath)[0])
-    
-    # Handle live photos (it shouldn't be assumed that a live photo's video will come before its image)
-    for lp in live_photos:
-        # find the photo that corresponds to the live photo's video
-        # and assign its datetime to the live photo's video
-        dt = next(x["datetime"] for x in file_metas if os.path.splitext(x["filename"])[0] == os.path.splitext(lp[0])[0] and x["filename"] != lp[0])
-        file_metas[lp[1]]["datetime"] = dt
+            sorted_files = list(records)
+        scan["failed"] = len(failed_files)
+        if cache is not None:
+            # forget the files that weren't found this time
+            cache.prune_unseen(search_root)
+            cache.commit()
+            print(cache.report())
+            scan["cache_hits"] = cache.hits
+            scan["cache_misses"] = cache.misses
+            scan["cache_hit_rate"] = cache.hits / (cache.hits + cache.misses) if cache.hits + cache.misses else None
+    if cache is not None:
+        print("{0} of {1} files found in the metadata cache, {2} were read".format(cache.hits, scan["items"], scan["read"]))
+    if failed_files:
+        print("WARNING: Metadata could not be retrieved from {0} files:".format(len(failed_files)))
+        for filepath in sorted(failed_files):
+            print("  " + filepath)
+    if orphans:
+        print("WARNING: {0} live photo groups have no photo to take their datetime from:".format(len(orphans)))
+        for group in orphans:
+            print("  " + ", ".join(file_meta["filename"] for file_meta in group))
+
+    if sort_run_size:
+        # The runs are merged as they're saved, so the sorted list is never held in memory.
+        # It's opened from the saved file afterwards, which with a binary manifest (see manifest.py)
+        # only takes a few arrays, while a JSON file is loaded as a whole.
+        print("Merging the sorted runs into {0}...".format(sorted_json_filename))
+        with report.phase("save") as save:
+            write_sorted_files(sorted_json_filename, merged if first is None else itertools.chain([first], merged))
+            sorted_files = read_sorted_files(sorted_json_filename)
+            save["items"] = len(sorted_files)
+        return sorted_files
 
     print("Sorting files by datetime...")
-    # sort list by earliest date in metadata, which will be found in the 'datetime' field
-    sorted_files = sorted(file_metas, key=lambda x: x['datetime'])
-    
-    # Sort files with the same datetime by the last four digits of their filename (if applicable)
-    # Divide list into sublists based on identical datetimes
-    sorted_files_dt_groups = []
-    current_dt = None
-    for file_meta in sorted_files:
-        # create new datetime sublist if it's a new datetime
-        if file_meta["datetime"] != current_dt:
-            current_dt = file_meta["datetime"]
-            sorted_files_dt_groups.append([file_meta])
-        else: # otherwise add to the most recent datetime sublist
-            sorted_files_dt_groups[-1].append(file_meta)
-
-    # Sort each datetime sublist based on the last 4 digits of name (ex. "IMG_4025.JPG").
-    # This won't be applicable for everything but it's better than nothing.
-    for i in range(len(sorted_files_dt_groups)):
-        sorted_files_dt_groups[i].sort(key=lambda x: os.path.splitext(x["filename"])[0][-4])
-    
-    # Recombine the sorted datetime sublists into the big flat list
-    sorted_files = [file_meta for dt_group in sorted_files_dt_groups for file_meta in dt_group]
+    with report.phase("sort") as sort_phase:
+        sorted_files.sort(key=sort_key)
+        sort_phase["items"] = len(sorted_files)
 
     print("Sorted! Saving sorted files metadata in {0}.".format(sorted_json_filename))
-    # save the list in a JSON file so we hopefully don't have to redo this whole thing again
-    with open(sorted_json_filename, "w") as f:
-        f.write(json.dumps(sorted_files, default=str, sort_keys=False))
+    # save the list (as JSON or a binary manifest, see manifest.py) so we hopefully don't have to redo this whole thing again
+    with report.phase("save") as save:
+        save["items"] = len(sorted_files)
+        write_sorted_files(sorted_json_filename, sorted_files)
 
-    return sorted_files
+    return Manifest(sorted_files)
 
 
 # ---- PART 2 FUNCTIONS: Reading the config sequence and generating the new sequence ----
 
-def bin_tree_path_to_filepath(bin_tree_path):
+def bin_tree_path_to_filepath(bin_tree_path, search_root):
     # Remove the '', project name, and parent bin from the path.
     # example: "\winter tripe.prproj\West Trip Jan 2022\Tim's Photos\IMG_7079.mov"
     # becomes ["Tim's Photos", "IMG_7079.mov"]
     clipProjPath = bin_tree_path.split('\\')[3:]
     # Create the path as it would have been formatted in the JSON file entry for easy lookup.
     # example: ["Tim's Photos", "IMG_7079.mov"] becomes "..\Tim's Photos\IMG_7079.mov"
-    return os.path.join(sys.argv[1], *clipProjPath)
+    return os.path.join(search_root, *clipProjPath)
 
-# Returns a dictionary representing the bin structure that is
+# Returns an index of the media in the bins (see bin_index.py) that is
 # much faster to search than the bins themselves.
-def memoize_bins(parent_bin, pickle_filename):
-    print("Creating a dictionary for searching project bins...")
-    bin_enum = pymiere.objects.ProjectItemType.BIN
-    def memoize_bins_rec(parent_bin, bin_dict, total):
-        for child in parent_bin.children:
-            if child.type == bin_enum:
-                new_dict, total = memoize_bins_rec(child, bin_dict, total)
-                bin_dict.update(new_dict)
-            else:
-                filepath = bin_tree_path_to_filepath(child.treePath)
-                bin_dict[filepath] = child
-                total += 1
-                print("Item {0} catalogued: {1}".format(total, filepath))
-        return bin_dict, total
-    bin_dict, _ = memoize_bins_rec(parent_bin, {}, 0)
-    print("Bin dictionary created! Pickling result in {0} for later!".format(pickle_filename))
-    with open(pickle_filename, 'ab') as f:
-        pickle.dump(bin_dict, f)
-    return bin_dict
+# The index is saved in index_filename and reused on the next run as long as
+# Premiere hasn't been restarted, in which case only bins that changed are walked again.
+def memoize_bins(project, parent_bin, index_filename, search_root):
+    print("Creating an index for searching project bins...")
+    bin_index = load_bin_index(index_filename, project, search_root,
+                               lambda tree_path: bin_tree_path_to_filepath(tree_path, search_root))
+    bin_index.update(parent_bin)
+    print("Bin index updated with {0} items in {1:.1f}s ({2} bins walked, {3} unchanged)! Saving it in {4} for later!".format(
+        len(bin_index), bin_index.elapsed, bin_index.walked, bin_index.reused, index_filename))
+    bin_index.save(index_filename)
+    return bin_index
 
 # Retreives the info that was stored in the JSON file for a given TrackItem clip.
 # Need this because there's no way to obtain the dimensions of a particular photo or video
 # via Adobe's API....
-def get_clip_filesys_info(clip, sorted_files):
-    clip_filepath = bin_tree_path_to_filepath(clip.projectItem.treePath)
+# sorted_files is the Manifest of the sorted files (see manifest.py).
+def get_clip_filesys_info(clip, sorted_files, search_root):
+    clip_filepath = bin_tree_path_to_filepath(clip.projectItem.treePath, search_root)
     # return the first entry in the sorted list with that filepath/filename
-    return next((x for x in sorted_files if x["filename"] == clip_filepath), None)
+    return sorted_files.get(clip_filepath)
     
 # Reads the configuration sequence in the Premiere Pro project and returns
 # a dictionary that specifies what effects and durations should be applied to
 # each type of media
-def read_config_sequence(project, config_seq_name, sorted_files):
+def read_config_sequence(project, config_seq_name, sorted_files, search_root):
     config_seq = next((x for x in project.sequences if x.name == config_seq_name), None)
     if not config_seq:
         print("ERROR: No sequence named {0} has been found in the open Premiere Pro project!".format(config_seq_name))
         exit(1)
     
     prop_dict = { "photo": {}, "video": {} }
+    resolver = PropertyResolver()
 
     # Get the necessary properties for each clip in the first video track.
     print("Reading {0} to learn what to do with each type of photo and video...".format(config_seq_name))
     for clip in config_seq.videoTracks[0].clips:
         print("Analyzing {0}...".format(clip.name))
         # get info with video dimensions:
-        clipInfo = get_clip_filesys_info(clip, sorted_files)
+        clipInfo = get_clip_filesys_info(clip, sorted_files, search_root)
         if clipInfo is None:
             print(("CONFIG SEQUENCE WARNING: "
                    "Dimensions for {0} could not be found. "
@@ -336,12 +441,13 @@ def read_config_sequence(project, config_seq_name, sorted_files):
         else:
             height = clipInfo["height"]
             width = clipInfo["width"]
+            media_type = "video" if os.path.splitext(clip.name)[-1].lower() in VIDEO_EXTENSIONS else "photo"
             # get the "Scale" property of the "Motion" component
-            motion = next(x for x in clip.components if x.displayName == "Motion")
-            scale = next(x for x in motion.properties if x.displayName == "Scale")
+            motion = resolver.component(clip, "Motion", media_type)
+            scale = resolver.property(motion, "Motion", "Scale", media_type)
             
             # if it's a video...
-            if os.path.splitext(clip.name)[-1].lower() in VIDEO_EXTENSIONS:
+            if media_type == "video":
                 # assume that this lacks keyframes and is the only property we care about
                 prop_dict["video"][(height, width)] = { "scale": scale.getValue() }
             
@@ -357,18 +463,64 @@ def read_config_sequence(project, config_seq_name, sorted_files):
                 # assuming they are co-located with the Scale keyframes but they will retain their default values.
                 # So no need to record anything for them here (for this project at least).
     
+    print(resolver.report())
     print("Finished reading {0}!".format(config_seq_name))
     return config_seq.getSettings(), prop_dict
 
 # Some clips may not exactly match the dimensions of those that were
-# used in the configuration sequence, so here we'll find the closest one.
-# For now just go based on the height... usually more important than width
-def calculate_closest_dimensions(file_info, media_dict):
-    return sorted([x for x in media_dict.keys()], key=lambda y: abs(file_info["height"] - y[0]))[0]
+# used in the configuration sequence, so build lookups for finding the closest one
+# of each media type (see dimension_lookup.py).
+def build_dimension_lookups(prop_dict, mode="dimensions", max_distance=None, fallback="nearest"):
+    return { media_type: DimensionLookup(media_dict.keys(), mode, max_distance, fallback)
+             for media_type, media_dict in prop_dict.items() }
+
+# Work out what to do with one entry of the sorted files list: returns the
+# (project item, media type, (height, width) key into prop_dict) to add it with,
+# or None (after saying why) if it should be left out of the sequence.
+# With in_script, the project item is an ExtendScript expression for it (see BinIndex.es_item)
+# rather than being fetched from Premiere.
+def plan_clip(file_info, position, num_files, dimension_lookups, bin_dict, in_script=False):
+    # there shouldn't be any RAW files but skip them to remain sane anyways
+    if os.path.splitext(file_info['filename'])[-1].lower() in [".cr2", ".cr3"]:
+        report.item("{0} of {1}: Skipping RAW file {2}".format(str(position), num_files, file_info['filename']))
+        return None
+    try:
+        report.item("{0} of {1}: Adding {2} to the sequence and applying motion properties...".format(str(position), num_files, file_info["filename"]))
+        proj_item = bin_dict.es_item(file_info["filename"]) if in_script else bin_dict[file_info["filename"]]
+    except KeyError:
+        print(("ERROR: {0} appears to be missing from the Premiere project files "
+                   "and problems are about to occur! Delete its entry from the sorted files "
+                   "JSON file if you're unable to import it into Premiere!").format(file_info['filename']))
+        return None
+    media_type = "video" if os.path.splitext(file_info['filename'])[-1].lower() in VIDEO_EXTENSIONS else "photo"
+    dimensions = dimension_lookups[media_type].closest(file_info["height"], file_info["width"])
+    if dimensions is None:
+        print(("WARNING: No {0} in the config sequence has dimensions close enough to {1}x{2}, "
+               "so {3} will be left out!").format(media_type, file_info["width"], file_info["height"], file_info["filename"]))
+        return None
+    return proj_item, media_type, dimensions
 
 # Populate the new sequence with the photos and videos in the correct order
 # with the correct motion properties applied
-def add_clips_to_sequence(new_seq, sorted_files, start_idx, prop_dict, bin_dict, seq_time):
+# dimension_lookups comes from build_dimension_lookups.
+# With a batch_size above 1 the clips are added in batches of that many,
+# one ExtendScript call per batch (see extendscript_batch.py).
+# With a chunk_size, every chunk_size clips are added to a sequence of their own that's
+# nested in new_seq (see sequence_chunks.py), in batches of batch_size.
+# clip_idx is the index of the next clip on the track (start_idx if not given), and every clip
+# that's been added is recorded in journal if there is one (see build_journal.py).
+def add_clips_to_sequence(new_seq, sorted_files, start_idx, prop_dict, dimension_lookups, bin_dict, seq_time, batch_size=0,
+                          clip_idx=None, journal=None, chunk_size=0):
+    if clip_idx is None:
+        clip_idx = start_idx
+    if chunk_size > 0:
+        add_clips_in_chunks(new_seq, sorted_files, start_idx, prop_dict, dimension_lookups, bin_dict, seq_time,
+                            chunk_size, batch_size if batch_size > 1 else DEFAULT_BATCH_SIZE, clip_idx, journal)
+        return
+    if batch_size > 1:
+        add_clips_to_sequence_batched(new_seq, sorted_files, start_idx, prop_dict, dimension_lookups, bin_dict, seq_time,
+                                      batch_size, clip_idx, journal)
+        return
     print("Adding clips to sequence in chronological order...")
     track = new_seq.videoTracks[0]
     # get the time duration of a single frame
@@ -376,35 +528,30 @@ def add_clips_to_sequence(new_seq, sorted_files, start_idx, prop_dict, bin_dict,
     frameTime.ticks = str(new_seq.timebase)
     num_files = len(sorted_files)
     sorted_files_to_add = sorted_files[start_idx:]
+    # kept here instead of reading seq_time back from Premiere for every clip
+    current_time = seq_time.seconds
+    resolver = PropertyResolver()
+    progress = report.progress("Adding clips", len(sorted_files_to_add))
     for i, file_info in enumerate(sorted_files_to_add):
-        proj_item = None
-        # there shouldn't be any RAW files but skip them to remain sane anyways
-        if os.path.splitext(file_info['filename'])[-1].lower() in [".cr2", ".cr3"]:
-            print("{0} of {1}: Skipping RAW file {2}".format(str(start_idx + i + 1), num_files, file_info['filename']))
-            continue
-        try:
-            print("{0} of {1}: Adding {2} to the sequence and applying motion properties...".format(str(start_idx + i + 1), num_files, file_info["filename"]))
-            proj_item = bin_dict[file_info["filename"]]
-        except KeyError:
-            print(("ERROR: {0} appears to be missing from the Premiere project files "
-                       "and problems are about to occur! Delete its entry from the sorted files "
-                       "JSON file if you're unable to import it into Premiere!").format(file_info['filename']))
+        progress.add()
+        plan = plan_clip(file_info, start_idx + i + 1, num_files, dimension_lookups, bin_dict)
+        if plan is None:
             continue
+        proj_item, media_type, dimensions = plan
         # add the projectItem to the sequence
-        track.overwriteClip(proj_item, seq_time.seconds)
+        track.overwriteClip(proj_item, current_time)
         # apply the appropriate Motion properties
-        new_clip = track.clips[start_idx + i]
-        motion = next(x for x in new_clip.components if x.displayName == "Motion")
-        scale = next(x for x in motion.properties if x.displayName == "Scale")
+        new_clip = track.clips[clip_idx]
+        clip_idx += 1
+        motion = resolver.component(new_clip, "Motion", media_type)
+        scale = resolver.property(motion, "Motion", "Scale", media_type)
         # video
-        if os.path.splitext(file_info['filename'])[-1].lower() in VIDEO_EXTENSIONS:
-            dimensions = calculate_closest_dimensions(file_info, prop_dict["video"])
+        if media_type == "video":
             scale.setValue(prop_dict["video"][dimensions]["scale"], True)
         # photo
         else:
-            position = next(x for x in motion.properties if x.displayName == "Position")
-            dimensions = calculate_closest_dimensions(file_info, prop_dict["photo"])
-            new_clip.end = time_from_seconds(seq_time.seconds + prop_dict["photo"][dimensions]["duration"].seconds)
+            position = resolver.property(motion, "Motion", "Position", media_type)
+            new_clip.end = time_from_seconds(current_time + prop_dict["photo"][dimensions]["duration"].seconds)
             scale.setTimeVarying(True)
             position.setTimeVarying(True)
             # start keyframes
@@ -420,18 +567,257 @@ def add_clips_to_sequence(new_seq, sorted_files, start_idx, prop_dict, bin_dict,
             scale.setValueAtKey(outTime, prop_dict["photo"][dimensions]["scaleOutKey"], 1)
             position.addKey(outTime)
             position.setValueAtKey(outTime, [0.5, 0.5], 1)
-        seq_time.seconds += new_clip.duration.seconds
-        
-        
+        current_time += new_clip.duration.seconds
+        seq_time.seconds = current_time
+        report.count("clips", "items")
+        if journal is not None:
+            journal.record(start_idx + i, clip_idx, current_time)
+    progress.done()
+    print(resolver.report())
+
+# The placements (see extendscript_batch.py) for each config clip in prop_dict.
+# The keyframe values for each config clip only need to be fetched from Premiere once.
+class Placements:
+    def __init__(self, prop_dict):
+        self.prop_dict = prop_dict
+        self.placements = {}
+
+    def get(self, media_type, dimensions):
+        key = (media_type, dimensions)
+        if key not in self.placements:
+            props = self.prop_dict[media_type][dimensions]
+            if media_type == "video":
+                self.placements[key] = { "type": "video", "scale": props["scale"] }
+            else:
+                self.placements[key] = { "type": "photo",
+                                         "duration": props["duration"].seconds,
+                                         "scaleIn": props["scaleInKey"],
+                                         "scaleOut": props["scaleOutKey"] }
+        return self.placements[key]
+
+# Same as add_clips_to_sequence, but the placements and keyframes of batch_size clips
+# at a time are sent to Premiere as a single ExtendScript call.
+def add_clips_to_sequence_batched(new_seq, sorted_files, start_idx, prop_dict, dimension_lookups, bin_dict, seq_time, batch_size,
+                                  clip_idx, journal=None):
+    print("Adding clips to sequence in chronological order, {0} at a time...".format(batch_size))
+    num_files = len(sorted_files)
+    placements = Placements(prop_dict)
+    current_time = seq_time.seconds
+    batch = ClipBatch()
+    batch_number = 0
+    total_start = time.perf_counter()
+    def flush():
+        nonlocal clip_idx, current_time, batch, batch_number
+        batch_number += 1
+        result = batch.run(new_seq, clip_idx, current_time, batch_number)
+        report.count("clips", "items", result["placed"])
+        clip_idx = result["clipIdx"]
+        current_time = result["end"]
+        # a batch stops at a clip it couldn't add in full, so only the clips before that one are
+        # journaled, and the run stops like it would adding the clips one at a time
+        last_placed = batch.last_placed(result)
+        if journal is not None and last_placed is not None:
+            journal.record(last_placed, clip_idx, current_time)
+        batch.check(result)
+        batch = ClipBatch()
+
+    progress = report.progress("Adding clips", num_files - start_idx)
+    for i, file_info in enumerate(sorted_files[start_idx:]):
+        progress.add()
+        plan = plan_clip(file_info, start_idx + i + 1, num_files, dimension_lookups, bin_dict, in_script=True)
+        if plan is None:
+            continue
+        proj_item, media_type, dimensions = plan
+        batch.add(proj_item, placements.get(media_type, dimensions), file_info["filename"], start_idx + i)
+        if len(batch) >= batch_size:
+            flush()
+    if len(batch):
+        flush()
+    progress.done()
+    seq_time.seconds = current_time
+    print("Added clips in {0} batches in {1:.1f}s".format(batch_number, time.perf_counter() - total_start))
+
+# Same as add_clips_to_sequence_batched, but the clips are added chunk_size at a time to
+# sequences of their own ("parts") that are nested in new_seq one after the other, so that no
+# track ever has more than chunk_size clips on it (see sequence_chunks.py).
+# The clips on new_seq's track are the parts, so that's what clip_idx counts, and the journal
+# gets an entry for every part once it's been nested.
+def add_clips_in_chunks(new_seq, sorted_files, start_idx, prop_dict, dimension_lookups, bin_dict, seq_time,
+                        chunk_size, batch_size, clip_idx, journal=None):
+    print("Adding clips to sequence in chronological order, {0} to a nested sequence...".format(chunk_size))
+    num_files = len(sorted_files)
+    seq_name = new_seq.name
+    placements = Placements(prop_dict)
+    current_time = seq_time.seconds
+    total_start = time.perf_counter()
+    num_parts = 0
+    # the part being added to: its sequenceID (made when its first batch is ready), next clip index and end time
+    part_id = None
+    part_clip_idx = 0
+    part_time = 0.0
+    batch = ClipBatch()
+    batch_number = 0
+    def flush():
+        nonlocal part_id, part_clip_idx, part_time, batch, batch_number
+        if part_id is None:
+            part_id = new_part(new_seq, part_name(seq_name, clip_idx + 1))
+        batch_number += 1
+        result = batch.run(part_id, part_clip_idx, part_time, batch_number)
+        report.count("clips", "items", result["placed"])
+        part_clip_idx = result["clipIdx"]
+        part_time = result["end"]
+        # the part isn't nested or journaled with a clip in it that couldn't be added in full,
+        # so the next run makes it again from its first clip
+        batch.check(result)
+        batch = ClipBatch()
+
+    def finish_part(last_idx):
+        nonlocal part_id, part_clip_idx, part_time, clip_idx, current_time, num_parts
+        if len(batch):
+            flush()
+        if part_id is not None:
+            part_started = current_time
+            current_time = nest_part(new_seq, part_id, current_time)
+            clip_idx += 1
+            num_parts += 1
+            report.item("{0}: {1} clips from {2:.1f}s to {3:.1f}s".format(
+                part_name(seq_name, clip_idx), part_clip_idx, part_started, current_time))
+            if journal is not None:
+                journal.record(last_idx, clip_idx, current_time)
+        part_id = None
+        part_clip_idx = 0
+        part_time = 0.0
+
+    # number of clips planned for the part being added to
+    part_size = 0
+    progress = report.progress("Adding clips", num_files - start_idx)
+    for i, file_info in enumerate(sorted_files[start_idx:]):
+        progress.add()
+        plan = plan_clip(file_info, start_idx + i + 1, num_files, dimension_lookups, bin_dict, in_script=True)
+        if plan is None:
+            continue
+        proj_item, media_type, dimensions = plan
+        batch.add(proj_item, placements.get(media_type, dimensions), file_info["filename"], start_idx + i)
+        part_size += 1
+        if part_size >= chunk_size:
+            finish_part(start_idx + i)
+            part_size = 0
+        elif len(batch) >= batch_size:
+            flush()
+    finish_part(num_files - 1)
+    progress.done()
+    seq_time.seconds = current_time
+    print("Added clips in {0} nested sequences ({1} batches) in {2:.1f}s".format(
+        num_parts, batch_number, time.perf_counter() - total_start))
+
+# Work out where to carry on adding clips to a sequence without a build journal (see build_journal.py),
+# from the clips on its track: returns a Checkpoint for the second to last clip.
+# Use second-to-last because the last item may not have been fully added,
+# and thus it should be overwritten.
+def find_resume_point(existing_seq, sorted_files, search_root, sorted_json_filename):
+    clips = existing_seq.videoTracks[0].clips
+    num_clips = len(clips)
+    second_to_last_clip = clips[num_clips - 2]
+    last_filepath = bin_tree_path_to_filepath(second_to_last_clip.projectItem.treePath, search_root)
+    resume_idx = sorted_files.index_of(last_filepath)
+    if resume_idx is None:
+        print("Could not find {0} in {1}!".format(last_filepath, sorted_json_filename))
+        exit(1)
+    return Checkpoint(resume_idx, num_clips - 1, second_to_last_clip.end.seconds)
 
 # ------------------------------------------------
 
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Create a Premiere Pro sequence with all the media in a directory in chronological order.")
+    parser.add_argument("search_root", help="relative search path containing the media subdirectories")
+    parser.add_argument("sorted_json_filename",
+                        help=("sorted files list filename (created if it doesn't exist), "
+                              "JSON if it ends in .json and a compact binary manifest otherwise"))
+    parser.add_argument("tz_config_filename", help="timezone config JSON filename")
+    parser.add_argument("seq_name", help="name of the sequence in Premiere")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of workers used to read file metadata (default: 1, i.e. serial)")
+    parser.add_argument("--executor", choices=list(EXECUTOR_TYPES) + [ASYNC_EXECUTOR], default="process",
+                        help=("kind of worker pool used when --workers is more than 1, 'async' keeps many reads in "
+                              "flight for network storage with --workers threads reading headers (default: process)"))
+    parser.add_argument("--queue-size", type=int, default=None,
+                        help="maximum number of files queued in the worker pool at once (default: 4 per worker)")
+    parser.add_argument("--io-concurrency", type=int, default=DEFAULT_ROOT_CONCURRENCY,
+                        help=("with --executor async, most files read at once from each drive, share or mount "
+                              "(default: {0})").format(DEFAULT_ROOT_CONCURRENCY))
+    parser.add_argument("--io-timeout", type=float, default=DEFAULT_TIMEOUT,
+                        help="with --executor async, seconds before giving up on reading a file (default: {0})".format(DEFAULT_TIMEOUT))
+    parser.add_argument("--io-retries", type=int, default=DEFAULT_RETRIES,
+                        help=("with --executor async, how many times to try reading a file again after an I/O error "
+                              "or timeout (default: {0})").format(DEFAULT_RETRIES))
+    parser.add_argument("--cache", default=DEFAULT_CACHE_FILENAME,
+                        help="file used to cache the metadata of each file between runs (default: {0})".format(DEFAULT_CACHE_FILENAME))
+    parser.add_argument("--no-cache", action="store_true", help="don't read or write the metadata cache")
+    parser.add_argument("--metadata-backend", choices=list(BACKENDS), default=DEFAULT_BACKEND,
+                        help=("how file metadata is read: 'native' parses the file headers directly and falls back "
+                              "to the Windows shell for files it can't read, 'shell' always uses the Windows shell "
+                              "(default: {0})").format(DEFAULT_BACKEND))
+    parser.add_argument("--exclude", action="append", default=[], metavar="PATTERN",
+                        help=("leave out files and directories matching this glob pattern, matched against their name "
+                              "and their path relative to the search path (can be given more than once, and is added "
+                              "to the defaults: {0})").format(", ".join(DEFAULT_EXCLUDES)))
+    parser.add_argument("--no-default-excludes", action="store_true",
+                        help="don't leave out RAW files and this script's directory unless --exclude says to")
+    parser.add_argument("--sort-run-size", type=int, default=None,
+                        help=("sort libraries with more than this many files in runs of this size that are spilled "
+                              "to temporary files and merged straight into the sorted files list, so the whole library "
+                              "is never in memory at once. Best with a binary sorted files list, since a .json one is "
+                              "loaded back as a whole (default: sort in memory)"))
+    parser.add_argument("--dimension-match", choices=MATCH_MODES, default="dimensions",
+                        help=("how to pick the config sequence clip with the closest dimensions: by height and width, "
+                              "or by height alone like older versions (default: dimensions)"))
+    parser.add_argument("--max-dimension-distance", type=int, default=None,
+                        help="how many pixels off the closest config sequence clip can be (default: no limit)")
+    parser.add_argument("--dimension-fallback", choices=FALLBACKS, default="nearest",
+                        help=("what to do with a clip when no config sequence clip is within --max-dimension-distance: "
+                              "use the nearest one anyway or leave the clip out (default: nearest)"))
+    parser.add_argument("--batch-size", type=int, default=0,
+                        help=("add clips to the sequence this many at a time, with one ExtendScript call to Premiere "
+                              "per batch instead of dozens per clip (default: 0, one clip at a time through pymiere)"))
+    parser.add_argument("--chunk-size", type=int, default=0,
+                        help=("add the clips this many at a time to sequences of their own that are nested in the sequence, "
+                              "so adding each clip doesn't get slower as the sequence grows (default: 0, every clip on the "
+                              "sequence's own track). The clips are added in batches of --batch-size (or {0})").format(DEFAULT_BATCH_SIZE))
+    parser.add_argument("--bin-index", default=DEFAULT_INDEX_FILENAME,
+                        help=("file used to save the index of the media in the project bins between runs "
+                              "(default: {0})").format(DEFAULT_INDEX_FILENAME))
+    parser.add_argument("--journal", default=DEFAULT_JOURNAL_FILENAME,
+                        help=("file every clip added to the sequence is recorded in, so an interrupted run can carry on "
+                              "where it left off (default: {0})").format(DEFAULT_JOURNAL_FILENAME))
+    parser.add_argument("--no-journal", action="store_true",
+                        help=("don't record the clips added, and work out where to carry on from the clips on the "
+                              "track like older versions"))
+    parser.add_argument("--verify-journal", action="store_true",
+                        help="check the journal against the clips on the track before carrying on")
+    parser.add_argument("--output", choices=OUTPUT_MODES, default=DEFAULT_OUTPUT_MODE,
+                        help=("'verbose' prints a line for every file and clip, 'progress' prints progress every few seconds "
+                              "and 'quiet' only prints warnings and errors (default: {0})").format(DEFAULT_OUTPUT_MODE))
+    parser.add_argument("--report", default=DEFAULT_REPORT_FILENAME,
+                        help=("file the timings and counters of each phase of the run are saved in as JSON when the "
+                              "script exits (default: {0})").format(DEFAULT_REPORT_FILENAME))
+    parser.add_argument("--no-report", action="store_true", help="don't save the run report")
+    parser.add_argument("--rescan", action="store_true",
+                        help="sort the files again even if the sorted files JSON already exists")
+    return parser.parse_args(argv)
+
 def main():
     # ---- PART 1: Organize the files ----
-    search_root = sys.argv[1]
-    sorted_json_filename = sys.argv[2]
-    tz_config_filename = sys.argv[3]
-    seq_name = sys.argv[4]
+    args = parse_args(sys.argv[1:])
+    search_root = args.search_root
+    sorted_json_filename = args.sorted_json_filename
+    tz_config_filename = args.tz_config_filename
+    seq_name = args.seq_name
+
+    # time and count each phase, and save the numbers when the script exits (see instrumentation.py)
+    report.mode = args.output
+    report.info["args"] = vars(args)
+    report.count_bridge_calls()
+    atexit.register(report.finish, None if args.no_report else args.report)
 
     project = pymiere.objects.app.project
 
@@ -446,36 +832,52 @@ def main():
         exit(1)
 
     # Obtain the information on timezones
-    with open(tz_config_filename, "r", encoding="utf-8") as f:
-        tz_config = json.load(f)
-        print("Loaded timezone information from {0}".format(tz_config_filename))
+    try:
+        tz_config = load_tz_config(tz_config_filename)
+    except TimezoneConfigError as e:
+        print("ERROR: {0} is invalid! {1}".format(tz_config_filename, e))
+        exit(1)
+    print("Loaded timezone information from {0}".format(tz_config_filename))
 
     # only get all the metadata and sort it if we haven't done that before
     sorted_files = []
-    if os.path.exists(sorted_json_filename):
-        with open(sorted_json_filename, "r") as f:
-            sorted_files = json.load(f)
+    if os.path.exists(sorted_json_filename) and not args.rescan:
+        with report.phase("load") as load:
+            sorted_files = read_sorted_files(sorted_json_filename)
+            load["items"] = len(sorted_files)
         print("Sorted files relevant metadata loaded from {0}".format(sorted_json_filename))
     else:
-        sorted_files = sort_files(search_root, sorted_json_filename, tz_config)
+        cache = None if args.no_cache else MetadataCache(args.cache)
+        try:
+            sorted_files = sort_files(search_root, sorted_json_filename, tz_config,
+                                      workers=args.workers, executor_type=args.executor,
+                                      queue_size=args.queue_size, cache=cache, backend=args.metadata_backend,
+                                      sort_run_size=args.sort_run_size,
+                                      excludes=([] if args.no_default_excludes else DEFAULT_EXCLUDES) + args.exclude,
+                                      io_concurrency=args.io_concurrency, io_timeout=args.io_timeout,
+                                      io_retries=args.io_retries)
+        except TimezoneConfigError as e:
+            print("ERROR: {0} is incomplete! {1}".format(tz_config_filename, e))
+            exit(1)
+        finally:
+            if cache is not None:
+                cache.close()
     
     # ---- PART 2: Read the Premiere Pro config sequence and generate the new sequence
     
     # First memoize the contents of the bins in the Premiere Pro file
     # because Premiere is incredibly slow at searching the bins....
-    # It's better to just do it once.
-    # NOTE: if you restart Premiere, you may need to delete bin_dict_pkl.pkl
-    # so that this operation can be performed again.
-    pickle_filename = "bin_dict_pkl"
-    if os.path.exists(pickle_filename):
-        with open(pickle_filename, 'rb') as f:
-            bin_dict = pickle.load(f)
-        print("Loaded previously pickled project bin dictionary from {0}".format(pickle_filename))
-    else:
-        bin_dict = memoize_bins(parent_bin, pickle_filename)
+    # The index is saved so it only has to be rebuilt for the bins that changed,
+    # and it rebuilds itself from scratch if Premiere has been restarted.
+    with report.phase("bin index") as bin_phase:
+        bin_dict = memoize_bins(project, parent_bin, args.bin_index, search_root)
+        bin_phase.update(items=len(bin_dict), bins_walked=bin_dict.walked, bins_unchanged=bin_dict.reused)
 
     # Next read the "config_sequence" to decide how to handle each media type
-    seq_settings, prop_dict = read_config_sequence(project, "config_sequence", sorted_files)
+    with report.phase("config sequence"):
+        seq_settings, prop_dict = read_config_sequence(project, "config_sequence", sorted_files, search_root)
+    dimension_lookups = build_dimension_lookups(prop_dict, args.dimension_match,
+                                                args.max_dimension_distance, args.dimension_fallback)
 
     # Check if the specified sequence name already exists.
     existing_seq = next((x for x in project.sequences if x.name == seq_name), None)
@@ -494,27 +896,55 @@ def main():
         # create time object initialized to 0
         seq_time = pymiere.Time()
         seq_time.seconds = 0
+        # record every clip added so an interrupted run can carry on from there (see build_journal.py)
+        journal = None
+        if not args.no_journal:
+            journal = start_journal(args.journal, make_header(new_seq, sorted_json_filename, len(sorted_files)))
         # Populate the new sequence with the photos and videos in the correct order
         # with the correct motion properties applied
-        add_clips_to_sequence(new_seq, sorted_files, 0, prop_dict, bin_dict, seq_time)
+        try:
+            with report.phase("clips"):
+                add_clips_to_sequence(new_seq, sorted_files, 0, prop_dict, dimension_lookups, bin_dict, seq_time,
+                                      args.batch_size, journal=journal, chunk_size=args.chunk_size)
+        finally:
+            if journal is not None:
+                journal.close()
     # If it does, then we'll just add to that existing sequence.
     else:
         print("Figuring out where we left off...")
-        # Figure out what the second to last item added was and at what point it stopped.
-        # Use second-to-last because the last item may not have been fully added,
-        # and thus it should be overwritten.
-        second_to_last_clip = existing_seq.videoTracks[0].clips[-2]
+        journal = None
+        checkpoint = None
+        if not args.no_journal:
+            header = make_header(existing_seq, sorted_json_filename, len(sorted_files))
+            checkpoint = load_checkpoint(args.journal, header)
+            if checkpoint is not None and args.verify_journal:
+                try:
+                    checkpoint = verify_checkpoint(existing_seq, args.journal)
+                except JournalError as e:
+                    print("ERROR: {0}".format(e))
+                    exit(1)
+            if checkpoint is not None:
+                print("Picking up after clip {0} on the track ({1} of {2} in {3}) from the build journal in {4}".format(
+                    checkpoint.clip_idx, checkpoint.index + 1, len(sorted_files), sorted_json_filename, args.journal))
+                journal = resume_journal(args.journal, checkpoint)
+        if checkpoint is None:
+            checkpoint = find_resume_point(existing_seq, sorted_files, search_root, sorted_json_filename)
+            if not args.no_journal:
+                # journal from here on
+                journal = start_journal(args.journal, header)
+                journal.record(checkpoint.index, checkpoint.clip_idx, checkpoint.end)
         resume_time = pymiere.Time()
-        resume_time.seconds = second_to_last_clip.end.seconds
-        last_filepath = bin_tree_path_to_filepath(second_to_last_clip.projectItem.treePath)
-        resume_idx = next((i for i, file_meta in enumerate(sorted_files) if file_meta["filename"] == last_filepath), None)
-        if resume_idx is None:
-            print("Could not find {0} in {1}!".format(last_filepath, sorted_json_filename))
-            exit(1)
+        resume_time.seconds = checkpoint.end
         # Continue to populate the new sequence with the photos and videos in the correct order
         # with the correct motion properties applied
         print("Adding to existing sequence {0}...".format(seq_name))
-        add_clips_to_sequence(existing_seq, sorted_files, resume_idx + 1, prop_dict, bin_dict, resume_time)
+        try:
+            with report.phase("clips"):
+                add_clips_to_sequence(existing_seq, sorted_files, checkpoint.index + 1, prop_dict, dimension_lookups, bin_dict,
+                                      resume_time, args.batch_size, checkpoint.clip_idx, journal, args.chunk_size)
+        finally:
+            if journal is not None:
+                journal.close()
 
     print("Finished adding all {0} clips to {1}!".format(len(sorted_files), seq_name))
     exit(0)
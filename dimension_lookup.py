@@ -0,0 +1,83 @@
+from bisect import bisect_left
+
+# Finds the config sequence clip whose dimensions are closest to those of a clip being added.
+# Built once per media type after the config sequence has been read, and the answer for
+# each exact (height, width) is remembered, since a library usually only has a handful
+# of different dimensions in it.
+#
+# Two ways of measuring how close dimensions are:
+#   dimensions: the difference in height plus the difference in width, with ties going to
+#               the closest aspect ratio. Tells portrait and landscape media apart.
+#   height:     just the difference in height, like older versions of the script did.
+#               Uses a binary search over the sorted heights.
+# In both cases remaining ties go to whichever config clip came first.
+#
+# If max_distance is given, config clips further away than that don't count, and
+# the fallback decides what happens when there isn't one close enough:
+#   nearest: use the closest config clip anyway
+#   skip:    return None so the clip can be left out
+
+MATCH_MODES = ["dimensions", "height"]
+FALLBACKS = ["nearest", "skip"]
+
+
+def aspect_ratio(height, width):
+    return width / height if height else 0.0
+
+
+class DimensionLookup:
+    def __init__(self, dimensions, mode="dimensions", max_distance=None, fallback="nearest"):
+        if mode not in MATCH_MODES:
+            raise ValueError("Unknown dimension match mode {0}, expected one of {1}".format(mode, MATCH_MODES))
+        if fallback not in FALLBACKS:
+            raise ValueError("Unknown dimension fallback {0}, expected one of {1}".format(fallback, FALLBACKS))
+        # (height, width) keys, in config sequence order
+        self.dimensions = list(dimensions)
+        self.mode = mode
+        self.max_distance = max_distance
+        self.fallback = fallback
+        # for the height mode: the heights sorted, and the first config clip with each height
+        first_with_height = {}
+        for key in self.dimensions:
+            first_with_height.setdefault(key[0], key)
+        self.heights = sorted(first_with_height)
+        self.height_keys = [first_with_height[h] for h in self.heights]
+        self.memo = {}
+        self.fallbacks_used = 0
+
+    def distance(self, height, width, key):
+        if self.mode == "height":
+            return abs(height - key[0])
+        return abs(height - key[0]) + abs(width - key[1])
+
+    def _closest_by_height(self, height):
+        i = bisect_left(self.heights, height)
+        candidates = [self.height_keys[j] for j in (i - 1, i) if 0 <= j < len(self.heights)]
+        # on a tie, go with the config clip that came first like the old sort did
+        return min(candidates, key=lambda key: (abs(height - key[0]), self.dimensions.index(key)))
+
+    def _closest_by_dimensions(self, height, width):
+        ratio = aspect_ratio(height, width)
+        return min(self.dimensions, key=lambda key: (
+            abs(height - key[0]) + abs(width - key[1]), abs(ratio - aspect_ratio(*key))))
+
+    def _find(self, height, width):
+        if not self.dimensions:
+            return None
+        if self.mode == "height":
+            closest = self._closest_by_height(height)
+        else:
+            closest = self._closest_by_dimensions(height, width)
+        if self.max_distance is not None and self.distance(height, width, closest) > self.max_distance:
+            self.fallbacks_used += 1
+            if self.fallback == "skip":
+                return None
+        return closest
+
+    # Returns the (height, width) key of the closest config clip, or None if there isn't one
+    # (either there are no config clips at all or none were close enough with the skip fallback).
+    def closest(self, height, width):
+        key = (height, width)
+        if key not in self.memo:
+            self.memo[key] = self._find(height, width)
+        return self.memo[key]
@@ -0,0 +1,182 @@
+import json
+import time
+
+import pymiere
+
+from bin_index import es_string, FIND_ITEM_FUNCTION
+from instrumentation import report
+
+# Adds clips to a sequence in batches, with one round trip to Premiere per batch.
+# Adding a clip through pymiere one property at a time takes dozens of round trips
+# (placing it, finding it on the track, finding the Motion component and its properties,
+# and adding and setting every keyframe), and each of those is an HTTP request to Premiere.
+# Instead, this compiles the placements and keyframes of a whole batch of clips into a
+# single ExtendScript function and evaluates it in one go.
+#
+# The project items are found inside Premiere from the bin index (see BinIndex.es_item),
+# so they don't cost a round trip each either.
+#
+# Each placement is a dictionary:
+#   { "item": <index into the batch's project items>, "type": "video", "scale": <scale> }
+#   { "item": <index>, "type": "photo", "duration": <seconds>, "scaleIn": <scale>, "scaleOut": <scale> }
+
+DEFAULT_BATCH_SIZE = 50
+
+# {seq}: the sequence (see es_sequence), {find_item}: bin_index.FIND_ITEM_FUNCTION,
+# {items}: array of the batch's project items, {placements}: JSON array,
+# {clip_idx}: index of the next clip on the track, {start}: sequence time in seconds to start at
+BATCH_SCRIPT = """
+(function() {{
+    var seq = {seq};
+    var track = seq.videoTracks[0];
+    var findItem = {find_item};
+    var items = {items};
+    var placements = {placements};
+    var clipIdx = {clip_idx};
+    var t = {start};
+    var frame = new Time();
+    frame.ticks = seq.timebase;
+    var frameSeconds = frame.seconds;
+    var placed = 0;
+    var errors = [];
+
+    function findByName(collection, name) {{
+        for (var j = 0; j < collection.numItems; j++) {{
+            if (collection[j].displayName === name) {{
+                return collection[j];
+            }}
+        }}
+        throw new Error("No " + name + " found");
+    }}
+
+    for (var i = 0; i < placements.length; i++) {{
+        var p = placements[i];
+        var clip = null;
+        try {{
+            track.overwriteClip(items[p.item], t);
+            clip = track.clips[clipIdx];
+            var motion = findByName(clip.components, "Motion");
+            var scale = findByName(motion.properties, "Scale");
+            if (p.type === "video") {{
+                scale.setValue(p.scale, true);
+            }} else {{
+                var position = findByName(motion.properties, "Position");
+                var end = new Time();
+                end.seconds = t + p.duration;
+                clip.end = end;
+                scale.setTimeVarying(true);
+                position.setTimeVarying(true);
+                var inTime = clip.inPoint.seconds;
+                scale.addKey(inTime);
+                scale.setValueAtKey(inTime, p.scaleIn, true);
+                position.addKey(inTime);
+                position.setValueAtKey(inTime, [0.5, 0.5], true);
+                var outTime = inTime + clip.duration.seconds - frameSeconds;
+                scale.addKey(outTime);
+                scale.setValueAtKey(outTime, p.scaleOut, true);
+                position.addKey(outTime);
+                position.setValueAtKey(outTime, [0.5, 0.5], true);
+            }}
+        }} catch (e) {{
+            // stop at the first clip that couldn't be added in full, so that every clip counted
+            // as placed is finished. A clip left half added is at clipIdx and gets overwritten.
+            errors.push({{ "index": i, "message": e.toString() }});
+            break;
+        }}
+        t += clip.duration.seconds;
+        clipIdx++;
+        placed++;
+    }}
+    return ExtendJSON.stringify({{ "end": t, "placed": placed, "clipIdx": clipIdx, "errors": errors }});
+}})();
+"""
+
+
+# The sequence with the sequenceID {sequence_id}, as an expression on one line
+SEQUENCE_BY_ID = ("(function(id) {{ var s = app.project.sequences; for (var i = 0; i < s.numSequences; i++) {{ "
+                  "if (s[i].sequenceID === id) {{ return s[i]; }} }} throw new Error('No sequence ' + id); }})({sequence_id})")
+
+
+# ExtendScript expression for a pymiere object, which pymiere keeps in $._pymiere
+def es_reference(pymiere_object):
+    return "$._pymiere['{0}']".format(pymiere_object._pymiere_id)
+
+
+# ExtendScript expression for a sequence: either a pymiere object or the sequenceID of
+# a sequence that only ever gets used from ExtendScript (see sequence_chunks.py)
+def es_sequence(seq):
+    if isinstance(seq, str):
+        return SEQUENCE_BY_ID.format(sequence_id=es_string(seq))
+    return es_reference(seq)
+
+
+# items are ExtendScript expressions for the project items (see es_reference and BinIndex.es_item)
+def compile_batch(seq, items, placements, clip_idx, start_seconds):
+    return BATCH_SCRIPT.format(seq=es_sequence(seq),
+                               find_item=FIND_ITEM_FUNCTION,
+                               items="[" + ", ".join(items) + "]",
+                               placements=json.dumps(placements),
+                               clip_idx=int(clip_idx),
+                               start=repr(float(start_seconds)))
+
+
+# Evaluate one batch in Premiere.
+# Returns a dictionary with the sequence time the batch ended at ("end"), how many clips
+# were placed ("placed"), the index of the next clip on the track ("clipIdx") and
+# a list of {"index", "message"} for the placement that ran into an error ("errors").
+# The batch stops at the first error, so the clips placed are the first "placed" placements
+# and "end" and "clipIdx" are where the errored one started.
+def run_batch(seq, items, placements, clip_idx, start_seconds):
+    result = pymiere.core.eval_script(compile_batch(seq, items, placements, clip_idx, start_seconds))
+    if not isinstance(result, dict):
+        raise RuntimeError("Unexpected result from Premiere while adding a batch of clips: {0}".format(result))
+    return result
+
+
+class BatchError(Exception):
+    pass
+
+
+# Accumulates placements until there's a full batch
+class ClipBatch:
+    def __init__(self):
+        self.items = []
+        self.item_indices = {}
+        self.placements = []
+        self.labels = []
+        self.indices = []
+
+    def __len__(self):
+        return len(self.placements)
+
+    # item is an ExtendScript expression for the project item (see compile_batch),
+    # and index is the index of its file in the sorted files list
+    def add(self, item, placement, label, index=None):
+        if item not in self.item_indices:
+            self.item_indices[item] = len(self.items)
+            self.items.append(item)
+        placement = dict(placement, item=self.item_indices[item])
+        self.placements.append(placement)
+        self.labels.append(label)
+        self.indices.append(index)
+
+    # The index (see add) of the last clip run_batch's result placed, or None if there wasn't one
+    def last_placed(self, result):
+        return self.indices[result["placed"] - 1] if result["placed"] else None
+
+    # Raises a BatchError if run_batch's result has an error, after which nothing else is placed
+    def check(self, result):
+        if result["errors"]:
+            error = result["errors"][0]
+            raise BatchError("Stopped at {0}, which couldn't be added: {1}".format(self.labels[error["index"]], error["message"]))
+
+    # Runs the batch, printing how long it took, and returns run_batch's result
+    def run(self, seq, clip_idx, start_seconds, batch_number):
+        started = time.perf_counter()
+        result = run_batch(seq, self.items, self.placements, clip_idx, start_seconds)
+        elapsed = time.perf_counter() - started
+        report.item("Batch {0}: added {1} of {2} clips in {3:.2f}s ({4:.1f} ms per clip)".format(
+            batch_number, result["placed"], len(self), elapsed, 1000.0 * elapsed / max(len(self), 1)))
+        for error in result["errors"]:
+            print("ERROR: Problem adding {0}: {1}".format(self.labels[error["index"]], error["message"]))
+        return result
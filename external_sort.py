@@ -0,0 +1,66 @@
+import heapq
+from operator import itemgetter
+import os
+import pickle
+import tempfile
+
+# External merge sort for when there are too many files to comfortably sort in memory.
+# The items are sorted in runs of run_size that are spilled to temporary files,
+# and then the runs are merged back together, only holding a chunk of items per run in memory.
+# Like sorted(), the result is stable.
+
+DEFAULT_RUN_SIZE = 100000
+# records pickled together in a run, so merging holds up to this many per run in memory
+SPILL_CHUNK = 1000
+
+_first = itemgetter(0)
+
+
+def spill_run(run, tmp_dir, run_number):
+    run.sort(key=_first)
+    filename = os.path.join(tmp_dir, "run_{0}.pkl".format(run_number))
+    # pickled a chunk at a time: a Pickler or Unpickler used for the whole run would remember
+    # every object it's seen, holding on to the whole run while it's being merged, and pickling
+    # every record on its own is slow
+    with open(filename, "wb") as f:
+        for start in range(0, len(run), SPILL_CHUNK):
+            pickle.dump(run[start:start + SPILL_CHUNK], f, pickle.HIGHEST_PROTOCOL)
+    return filename
+
+
+def read_run(filename):
+    with open(filename, "rb") as f:
+        while True:
+            try:
+                chunk = pickle.load(f)
+            except EOFError:
+                return
+            yield from chunk
+
+
+# Generator yielding items sorted by key.
+# Items (and their keys) have to be picklable.
+def external_sort(items, key, run_size=DEFAULT_RUN_SIZE, tmp_dir=None):
+    run_size = max(run_size, 1)
+    with tempfile.TemporaryDirectory(dir=tmp_dir, prefix="sort_runs_") as run_dir:
+        runs = []
+        run = []
+        for item in items:
+            run.append((key(item), item))
+            if len(run) >= run_size:
+                runs.append(spill_run(run, run_dir, len(runs)))
+                run = []
+
+        # everything fit in a single run, no need to go to disk
+        if not runs:
+            run.sort(key=_first)
+            for _, item in run:
+                yield item
+            return
+
+        if run:
+            runs.append(spill_run(run, run_dir, len(runs)))
+            run = []
+        print("Merging {0} sorted runs of up to {1} files...".format(len(runs), run_size))
+        for _, item in heapq.merge(*[read_run(filename) for filename in runs], key=_first):
+            yield item
@@ -0,0 +1,155 @@
+from fnmatch import translate
+import os
+import re
+
+# Building blocks for streaming the files through sort_files one at a time:
+#
+#   walk_dirs          walk the search root, leaving out excluded directories and files
+#   (sort_files)       check the timezone config, read or look up the metadata of each file
+#   pair_by_directory  pair up live photos one directory at a time
+#   (sort_files)       sort
+#
+# The metadata can be read in any order (see async_extract.py), pairing doesn't depend on it.
+# Each stage is a generator, so the only thing holding the whole library is the final sort.
+# Files are passed along as FileRecords, which are a lot smaller than dictionaries.
+
+# Glob patterns for what's left out of the walk (see ExcludeFilter).
+# RAW files can't go in the sequence, and the script's own directory may be next to the media.
+DEFAULT_EXCLUDES = ["*.cr2", "*.cr3", "Auto-Create-Chronological-Premiere-Pro-Sequence"]
+
+
+# The metadata of one file in the sorted files list.
+# Can be used like the dictionaries it replaces: record["filename"], dict(record).
+class FileRecord:
+    __slots__ = ("filename", "datetime", "height", "width")
+    FIELDS = __slots__
+
+    def __init__(self, filename, datetime, height, width):
+        self.filename = filename
+        self.datetime = datetime
+        self.height = height
+        self.width = width
+
+    # record["filename"] is record.filename, without a Python level call since it's used so much
+    __getitem__ = object.__getattribute__
+
+    def __setitem__(self, field, value):
+        if field not in self.FIELDS:
+            raise KeyError(field)
+        setattr(self, field, value)
+
+    def keys(self):
+        return self.FIELDS
+
+    # pickled as a call with its fields (see external_sort.py), which is a lot quicker than
+    # pickle's default for classes with __slots__
+    def __reduce__(self):
+        return FileRecord, (self.filename, self.datetime, self.height, self.width)
+
+    def __eq__(self, other):
+        if isinstance(other, (FileRecord, dict)):
+            return dict(self) == dict(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return "FileRecord({0!r}, {1!r}, {2!r}, {3!r})".format(self.filename, self.datetime, self.height, self.width)
+
+
+# The directory of a path made by joining a directory and a filename (which is how every
+# path in the pipeline is made), to group the files of each directory by.
+# Slicing at the last separator is a lot cheaper than os.path.dirname, which does more
+# for paths this never sees (ex. a file in the root of a drive keeps its trailing separator).
+def directory_of(filepath):
+    return filepath[:filepath.rfind(os.sep)]
+
+
+def as_record(file_meta):
+    if isinstance(file_meta, FileRecord):
+        return file_meta
+    return FileRecord(file_meta["filename"], file_meta["datetime"], file_meta["height"], file_meta["width"])
+
+
+# Decides what's left out of the walk from a list of glob patterns.
+# A pattern is matched (regardless of case) against the name of each file and directory and
+# against its path relative to the search root with / separators, ex. "*.cr2" or "phone/trash/*".
+# An excluded directory isn't walked at all.
+class ExcludeFilter:
+    def __init__(self, patterns=DEFAULT_EXCLUDES):
+        self.patterns = list(patterns)
+        # all the patterns as a single regular expression
+        translated = [translate(pattern.replace("\\", "/").casefold()) for pattern in self.patterns]
+        self.regex = re.compile("|".join(translated)) if translated else None
+
+    def excludes(self, rel_dir, name):
+        return not self.keep(rel_dir, [name])
+
+    # The names in the directory rel_dir that aren't excluded.
+    # The directory's part of the paths is only worked out once for all of them.
+    def keep(self, rel_dir, names):
+        if self.regex is None:
+            return names
+        match = self.regex.match
+        if rel_dir in ("", "."):
+            return [name for name in names if not match(name.casefold())]
+        prefix = rel_dir.replace(os.sep, "/").casefold() + "/"
+        kept = []
+        for name in names:
+            folded = name.casefold()
+            if not match(folded) and not match(prefix + folded):
+                kept.append(name)
+        return kept
+
+
+# Generator yielding (dirpath, filenames) for every directory under search_root with files in it,
+# leaving out whatever exclude excludes. walk is os.walk or something that works like it.
+def walk_dirs(search_root, exclude, walk=os.walk):
+    for dirpath, dirnames, filenames in walk(search_root):
+        rel_dir = os.path.relpath(dirpath, search_root)
+        dirnames[:] = exclude.keep(rel_dir, dirnames)
+        filenames = exclude.keep(rel_dir, filenames)
+        if filenames:
+            yield dirpath, filenames
+
+
+# Generator passing records along one directory at a time, after pair_fn has been called on
+# each directory's records (ex. pair_live_photos, since a live photo's files are always in the
+# same directory). pair_fn's results are added to paired.
+# Records have to come in walk order, unless sizes is given: a dictionary of how many records
+# each directory has coming (see files_with_tz_config), which lets them come in any order.
+# A directory is then passed along as soon as all of its records are in, and whatever is
+# left (ex. directories with files that couldn't be read) at the end.
+def pair_by_directory(records, pair_fn, paired, sizes=None):
+    if sizes is not None:
+        yield from pair_by_directory_unordered(records, pair_fn, paired, sizes)
+        return
+    group = []
+    group_dir = None
+    for record in records:
+        dirpath = directory_of(record.filename)
+        if dirpath != group_dir:
+            if group:
+                paired.extend(pair_fn(group))
+                yield from group
+            group = []
+            group_dir = dirpath
+        group.append(record)
+    if group:
+        paired.extend(pair_fn(group))
+        yield from group
+
+
+def pair_by_directory_unordered(records, pair_fn, paired, sizes):
+    groups = {}
+    for record in records:
+        dirpath = directory_of(record.filename)
+        group = groups.get(dirpath)
+        if group is None:
+            group = groups[dirpath] = []
+        group.append(record)
+        if len(group) >= sizes.get(dirpath, 0):
+            del groups[dirpath]
+            paired.extend(pair_fn(group))
+            yield from group
+    for group in groups.values():
+        paired.extend(pair_fn(group))
+        yield from group
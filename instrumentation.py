@@ -0,0 +1,189 @@
+import json
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Timers and counters for each phase of a run ("scan": walking the directories and reading
+# metadata or finding it in the cache, which all happen at once, "sort", "save" or "load" of the
+# sorted files list, "bin index", "config sequence" and "clips"), and a JSON report of them
+# written when the script exits so that runs can be compared.
+#
+# Also decides how chatty the script is:
+#   "verbose"  prints a line for every file and clip like older versions of the script
+#   "progress" prints a progress line every few seconds instead
+#   "quiet"    only prints warnings, errors and the summary at the end
+#
+# Every phase's counters can include "items" (files read, clips added...), in which case
+# items per second and bridge calls per item are worked out for it.
+# Bridge calls are counted by wrapping pymiere's eval_script, which every request to
+# Premiere goes through (see count_bridge_calls).
+
+OUTPUT_MODES = ["verbose", "progress", "quiet"]
+DEFAULT_OUTPUT_MODE = "progress"
+DEFAULT_REPORT_FILENAME = "run_report.json"
+REPORT_VERSION = 1
+# seconds between progress messages
+PROGRESS_INTERVAL = 2.0
+PROGRESS_BAR_WIDTH = 30
+
+
+# Peak resident memory of this process in bytes, or None if there's no way to tell.
+# Uses the resource module where there is one, and psutil (if installed) on Windows.
+def peak_rss():
+    try:
+        import resource
+    except ImportError:
+        resource = None
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+    try:
+        import psutil
+    except ImportError:
+        return None
+    info = psutil.Process().memory_info()
+    return getattr(info, "peak_wset", info.rss)
+
+
+# Throttled progress for a loop over total items (or an unknown number if total is None)
+class Progress:
+    def __init__(self, label, total=None, mode=DEFAULT_OUTPUT_MODE, interval=PROGRESS_INTERVAL):
+        self.label = label
+        self.total = total
+        self.mode = mode
+        self.interval = interval
+        self.count = 0
+        self.started = time.perf_counter()
+        self.last_print = self.started
+        # rewrite the same line as a progress bar when writing to a terminal
+        self.bar = mode == "progress" and sys.stdout.isatty()
+        self.printed = False
+
+    def add(self, n=1):
+        self.count += n
+        now = time.perf_counter()
+        if self.mode != "quiet" and now - self.last_print >= self.interval:
+            self.last_print = now
+            self.show(now)
+
+    def show(self, now):
+        elapsed = now - self.started
+        rate = self.count / elapsed if elapsed > 0 else 0.0
+        if self.total:
+            filled = int(PROGRESS_BAR_WIDTH * min(self.count, self.total) / self.total)
+            message = "{0}: [{1}{2}] {3} of {4} ({5:.1f}/s)".format(
+                self.label, "#" * filled, "-" * (PROGRESS_BAR_WIDTH - filled), self.count, self.total, rate)
+        else:
+            message = "{0}: {1} ({2:.1f}/s, {3:.1f}s)".format(self.label, self.count, rate, elapsed)
+        if self.bar:
+            print("\r" + message, end="", flush=True)
+            self.printed = True
+        else:
+            print(message)
+
+    # Finish the progress bar's line
+    def done(self):
+        if self.printed:
+            print()
+            self.printed = False
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+class RunReport:
+    def __init__(self, mode=DEFAULT_OUTPUT_MODE):
+        self.mode = mode
+        self.info = {}
+        # phase name -> { "seconds", "bridge_calls", counters... }, in the order they ran
+        self.phases = {}
+        self.bridge_calls = 0
+        self.started = time.time()
+        self.started_perf = time.perf_counter()
+
+    # Time a phase of the run, yielding the dictionary to put its counters in.
+    # A phase that runs more than once adds up.
+    @contextmanager
+    def phase(self, name):
+        counters = self.phases.setdefault(name, { "seconds": 0.0, "bridge_calls": 0 })
+        start = time.perf_counter()
+        start_calls = self.bridge_calls
+        try:
+            yield counters
+        finally:
+            counters["seconds"] += time.perf_counter() - start
+            counters["bridge_calls"] += self.bridge_calls - start_calls
+
+    def count(self, phase, name, n=1):
+        counters = self.phases.setdefault(phase, { "seconds": 0.0, "bridge_calls": 0 })
+        counters[name] = counters.get(name, 0) + n
+
+    # A line about a single file or clip, only printed in verbose mode
+    def item(self, message):
+        if self.mode == "verbose":
+            print(message)
+
+    def progress(self, label, total=None):
+        return Progress(label, total, self.mode)
+
+    # Count every eval_script pymiere sends to Premiere
+    def count_bridge_calls(self):
+        import pymiere
+        core = pymiere.core
+        eval_script = core.eval_script
+        if getattr(eval_script, "counted", False):
+            return
+        def counted_eval_script(*args, **kwargs):
+            self.bridge_calls += 1
+            return eval_script(*args, **kwargs)
+        counted_eval_script.counted = True
+        core.eval_script = counted_eval_script
+
+    def to_dict(self):
+        phases = {}
+        for name, counters in self.phases.items():
+            phase = dict(counters)
+            items = counters.get("items")
+            if items:
+                phase["items_per_sec"] = items / counters["seconds"] if counters["seconds"] > 0 else None
+                phase["bridge_calls_per_item"] = counters["bridge_calls"] / items
+            phases[name] = phase
+        return { "version": REPORT_VERSION,
+                 "started": datetime.fromtimestamp(self.started, timezone.utc).isoformat(),
+                 "seconds": time.perf_counter() - self.started_perf,
+                 "peak_rss_bytes": peak_rss(),
+                 "bridge_calls": self.bridge_calls,
+                 "info": self.info,
+                 "phases": phases }
+
+    def summary(self):
+        data = self.to_dict()
+        lines = ["{0:<20} {1:>10} {2:>10} {3:>12} {4:>14}".format("phase", "time (s)", "items", "items/s", "bridge calls")]
+        for name, phase in data["phases"].items():
+            items_per_sec = phase.get("items_per_sec")
+            lines.append("{0:<20} {1:10.2f} {2:>10} {3:>12} {4:>14}".format(
+                name, phase["seconds"], phase.get("items", ""),
+                "{0:.1f}".format(items_per_sec) if items_per_sec else "", phase["bridge_calls"]))
+        rss = data["peak_rss_bytes"]
+        lines.append("Total {0:.1f}s, peak memory {1}".format(
+            data["seconds"], "{0:.1f} MB".format(rss / 2 ** 20) if rss is not None else "unknown"))
+        return "\n".join(lines)
+
+    def write(self, filename):
+        with open(filename, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2, default=str)
+
+    # Print the summary and, if filename is given, write the report to it. Meant for atexit.
+    def finish(self, filename=None):
+        if not self.phases:
+            return
+        print(self.summary())
+        if filename:
+            self.write(filename)
+            print("Run report saved in {0}".format(filename))
+
+
+# The report for this run
+report = RunReport()
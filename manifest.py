@@ -0,0 +1,340 @@
+from array import array
+from contextlib import ExitStack
+from datetime import datetime, timedelta, timezone
+import json
+import os
+import posixpath
+import shutil
+import struct
+import sys
+import tempfile
+
+# Compact binary format for the sorted files list.
+# The JSON list is easy to edit by hand but big and slow to load for large libraries,
+# and its datetimes come back as strings. The binary manifest stores the same list
+# as columns that can be loaded straight into arrays without parsing anything:
+#
+#   header       magic, version, number of entries, number of strings, string blob size
+#   strings      every directory once and every entry's filename, as UTF-8 with an offsets column
+#   dirs         uint32 per entry, index of the directory in the strings
+#   names        uint32 per entry, index of the filename in the strings
+#   utc_us       int64 per entry, UTC epoch of the datetime in microseconds
+#   tz_offset    int16 per entry, UTC offset of the datetime in minutes
+#   width        uint16 per entry
+#   height       uint16 per entry
+#
+# All numbers are little-endian and every section starts on an 8 byte boundary.
+# Files ending in .json are read and written as the old JSON list instead.
+#
+# To convert between the two:
+#   `python3 ./manifest.py export sorted_files.manifest sorted_files.json`
+#   `python3 ./manifest.py import sorted_files.json sorted_files.manifest`
+
+MAGIC = b"PRSQMNFT"
+VERSION = 1
+HEADER = struct.Struct("<8sIIIQ")
+MAX_DIMENSION = 0xFFFF
+# entries buffered in memory at a time while writing a manifest
+WRITE_CHUNK = 8192
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# (name, array typecode) of each per-entry column, in file order
+COLUMNS = [("dirs", "I"), ("names", "I"), ("utc_us", "q"), ("tz_offset", "h"), ("width", "H"), ("height", "H")]
+
+
+class ManifestError(Exception):
+    pass
+
+
+def is_json_filename(filename):
+    return os.path.splitext(filename)[-1].lower() == ".json"
+
+
+def padding(size):
+    return -size % 8
+
+
+def to_array(typecode, data):
+    column = array(typecode)
+    column.frombytes(data)
+    if sys.byteorder != "little":
+        column.byteswap()
+    return column
+
+
+def column_bytes(column):
+    if sys.byteorder != "little":
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+# Accepts the datetimes from sort_files (aware datetimes) as well as the strings
+# they turn into in the JSON file, ex. "2022-01-08 11:22:00-08:00".
+def to_datetime(value):
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        raise ManifestError("Datetime {0} has no timezone".format(value))
+    return value
+
+
+def clamp_dimension(value, filename):
+    value = int(value)
+    if value > MAX_DIMENSION:
+        print("WARNING: Dimension {0} of {1} is too big for the manifest and will be stored as {2}".format(
+            value, filename, MAX_DIMENSION))
+        return MAX_DIMENSION
+    return max(value, 0)
+
+
+# The sorted files list loaded from a binary manifest.
+# Behaves like the list of dictionaries that sort_files returns, but each dictionary
+# is only created when it's asked for.
+class ColumnarFiles:
+    def __init__(self, strings, columns):
+        self.strings = strings
+        self.dirs = columns["dirs"]
+        self.names = columns["names"]
+        self.utc_us = columns["utc_us"]
+        self.tz_offset = columns["tz_offset"]
+        self.width = columns["width"]
+        self.height = columns["height"]
+        self._timezones = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def filename(self, i):
+        return os.path.join(self.strings[self.dirs[i]], self.strings[self.names[i]])
+
+    def datetime(self, i):
+        offset = self.tz_offset[i]
+        tz = self._timezones.get(offset)
+        if tz is None:
+            tz = self._timezones[offset] = timezone(timedelta(minutes=offset))
+        return (EPOCH + timedelta(microseconds=self.utc_us[i])).astimezone(tz)
+
+    def record(self, i):
+        return { "filename": self.filename(i),
+                 "datetime": self.datetime(i),
+                 "height": self.height[i],
+                 "width": self.width[i] }
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.record(j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("manifest index out of range")
+        return self.record(i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.record(i)
+
+
+# Paths are compared regardless of their separators and case, since the sorted files list
+# may have been made on Windows with backslashes, and Premiere doesn't care about case.
+def normalize_path(path):
+    return posixpath.normpath(path.replace("\\", "/")).casefold()
+
+
+# The sorted files list, with hash maps from each (normalized) path to its index and record
+# so that finding a file is a dictionary lookup instead of a scan of the whole list.
+# files can be the list of dictionaries from sort_files or the JSON, or a ColumnarFiles.
+# If a path is in the list more than once, lookups find its first entry.
+class Manifest:
+    def __init__(self, files):
+        self.files = files
+        self._indices = None
+        self._records = {}
+
+    def __len__(self):
+        return len(self.files)
+
+    def __getitem__(self, i):
+        return self.files[i]
+
+    def __iter__(self):
+        return iter(self.files)
+
+    # the maps are only built the first time something is looked up
+    def _build_indices(self):
+        if isinstance(self.files, ColumnarFiles):
+            filenames = (self.files.filename(i) for i in range(len(self.files)))
+        else:
+            filenames = (file_meta["filename"] for file_meta in self.files)
+        indices = {}
+        for i, filename in enumerate(filenames):
+            indices.setdefault(normalize_path(filename), i)
+        self._indices = indices
+
+    # Returns the index of the entry for path, or None if it isn't in the list
+    def index_of(self, path):
+        if self._indices is None:
+            self._build_indices()
+        return self._indices.get(normalize_path(path))
+
+    # Returns the record for path, or None if it isn't in the list
+    def get(self, path):
+        key = normalize_path(path)
+        record = self._records.get(key)
+        if record is None:
+            i = self.index_of(path)
+            if i is None:
+                return None
+            record = self._records[key] = self.files[i]
+        return record
+
+
+# Written as the entries come in, so sorted_files can be a generator (ex. the merged runs of an
+# external sort) without the list ever being held in memory. Each section goes to a temporary
+# file of its own, a chunk of entries at a time, and they're copied into the manifest at the end
+# once the header's counts are known. Only the directories are remembered to store them once,
+# so a filename that's in more than one directory is stored once for each.
+def write_manifest(filename, sorted_files):
+    dir_index = {}
+    num_strings = 0
+    blob_size = 0
+    count = 0
+    with ExitStack() as stack:
+        section_files = { name: stack.enter_context(tempfile.TemporaryFile())
+                          for name in ["offsets", "blob"] + [name for name, _ in COLUMNS] }
+        offsets = array("Q", [0])
+        blob = []
+        columns = { name: array(typecode) for name, typecode in COLUMNS }
+
+        def flush():
+            section_files["offsets"].write(column_bytes(offsets))
+            section_files["blob"].write(b"".join(blob))
+            for name, _ in COLUMNS:
+                section_files[name].write(column_bytes(columns[name]))
+                del columns[name][:]
+            del offsets[:]
+            del blob[:]
+
+        def add_string(s):
+            nonlocal num_strings, blob_size
+            encoded = s.encode("utf-8")
+            blob.append(encoded)
+            blob_size += len(encoded)
+            offsets.append(blob_size)
+            num_strings += 1
+            return num_strings - 1
+
+        for file_meta in sorted_files:
+            dirpath, name = os.path.split(file_meta["filename"])
+            dt = to_datetime(file_meta["datetime"])
+            delta = dt - EPOCH
+            dir_i = dir_index.get(dirpath)
+            if dir_i is None:
+                dir_i = dir_index[dirpath] = add_string(dirpath)
+            columns["dirs"].append(dir_i)
+            columns["names"].append(add_string(name))
+            columns["utc_us"].append((delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds)
+            columns["tz_offset"].append(int(dt.utcoffset().total_seconds() // 60))
+            columns["width"].append(clamp_dimension(file_meta["width"], file_meta["filename"]))
+            columns["height"].append(clamp_dimension(file_meta["height"], file_meta["filename"]))
+            count += 1
+            if count % WRITE_CHUNK == 0:
+                flush()
+        flush()
+
+        # write to a temporary file first so an interrupted write never leaves a broken manifest behind
+        tmp_filename = filename + ".tmp"
+        with open(tmp_filename, "wb") as f:
+            def write_section(data_file):
+                size = data_file.tell()
+                data_file.seek(0)
+                shutil.copyfileobj(data_file, f)
+                f.write(b"\0" * padding(size))
+            header = HEADER.pack(MAGIC, VERSION, count, num_strings, blob_size)
+            f.write(header + b"\0" * padding(len(header)))
+            write_section(section_files["offsets"])
+            write_section(section_files["blob"])
+            for name, _ in COLUMNS:
+                write_section(section_files[name])
+    os.replace(tmp_filename, filename)
+
+
+def read_manifest(filename):
+    with open(filename, "rb") as f:
+        data = f.read()
+    view = memoryview(data)
+    if len(data) < HEADER.size:
+        raise ManifestError("{0} is too short to be a manifest".format(filename))
+    magic, version, count, num_strings, blob_size = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ManifestError("{0} is not a sorted files manifest".format(filename))
+    if version != VERSION:
+        raise ManifestError("{0} is manifest version {1}, expected {2}".format(filename, version, VERSION))
+
+    pos = HEADER.size + padding(HEADER.size)
+    def take(size):
+        nonlocal pos
+        if pos + size > len(data):
+            raise ManifestError("{0} is truncated".format(filename))
+        section = view[pos:pos + size]
+        pos += size + padding(size)
+        return section
+
+    offsets = to_array("Q", take((num_strings + 1) * 8))
+    blob = bytes(take(blob_size))
+    strings = [blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(num_strings)]
+    columns = {}
+    for name, typecode in COLUMNS:
+        columns[name] = to_array(typecode, take(count * array(typecode).itemsize))
+    return ColumnarFiles(strings, columns)
+
+
+# Written one entry at a time so the whole list is never held as one string
+def write_json(filename, sorted_files):
+    with open(filename, "w") as f:
+        f.write("[")
+        for i, file_meta in enumerate(sorted_files):
+            if i:
+                f.write(", ")
+            f.write(json.dumps(dict(file_meta), default=str, sort_keys=False))
+        f.write("]")
+
+
+def read_json(filename):
+    with open(filename, "r") as f:
+        return json.load(f)
+
+
+# Save the sorted files list, as JSON if the filename ends in .json and as a binary manifest otherwise
+def write_sorted_files(filename, sorted_files):
+    if is_json_filename(filename):
+        write_json(filename, sorted_files)
+    else:
+        write_manifest(filename, sorted_files)
+
+
+# Load the sorted files list as a Manifest
+def read_sorted_files(filename):
+    if is_json_filename(filename):
+        return Manifest(read_json(filename))
+    return Manifest(read_manifest(filename))
+
+
+def main():
+    usage = ("Usage:\n"
+             "  python3 ./manifest.py export <manifest filename> <json filename>\n"
+             "  python3 ./manifest.py import <json filename> <manifest filename>")
+    if len(sys.argv) != 4 or sys.argv[1] not in ("export", "import"):
+        print(usage)
+        exit(1)
+    command, src, dst = sys.argv[1:]
+    if command == "export":
+        write_json(dst, read_manifest(src))
+    else:
+        write_manifest(dst, read_json(src))
+    print("Converted {0} to {1}".format(src, dst))
+    exit(0)
+
+if __name__ == "__main__":
+    main()
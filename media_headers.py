@@ -0,0 +1,447 @@
+from datetime import datetime, timedelta, timezone
+import mmap
+import struct
+
+# Pure Python readers for the few bits of metadata we need out of photos and videos.
+# They only look at the header bytes that hold that metadata:
+#   - JPEG: the segments before the image data, for the EXIF APP1 segment
+#   - HEIC/HEIF: the 'meta' box, for the EXIF item
+#   - MP4/MOV: the 'mvhd' and 'tkhd' atoms in the 'moov' atom
+# and, for the dimensions alone, the JPEG start of frame, the PNG IHDR chunk
+# and the HEIF 'ispe' property (see probe_dimensions).
+# A file that isn't in the format at all raises a MediaHeaderError, but metadata that's
+# truncated or malformed is treated as missing rather than raising anything else.
+# ISO base media files (HEIC, MP4, MOV) are memory-mapped so the 'moov' atom can be
+# found at the end of a multi-gigabyte video without reading the video data in front of it.
+
+JPEG_EXTENSIONS = [".jpg", ".jpeg"]
+HEIF_EXTENSIONS = [".heic", ".heif"]
+QUICKTIME_EXTENSIONS = [".mp4", ".mov", ".m4v", ".3gp"]
+
+# EXIF tags we care about
+TAG_IMAGE_WIDTH = 0x0100
+TAG_IMAGE_LENGTH = 0x0101
+TAG_DATETIME = 0x0132
+TAG_EXIF_IFD = 0x8769
+TAG_DATETIME_ORIGINAL = 0x9003
+TAG_DATETIME_DIGITIZED = 0x9004
+TAG_PIXEL_X_DIMENSION = 0xA002
+TAG_PIXEL_Y_DIMENSION = 0xA003
+
+EXIF_TAG_NAMES = {
+    TAG_IMAGE_WIDTH: "ImageWidth",
+    TAG_IMAGE_LENGTH: "ImageLength",
+    TAG_DATETIME: "DateTime",
+    TAG_DATETIME_ORIGINAL: "DateTimeOriginal",
+    TAG_DATETIME_DIGITIZED: "DateTimeDigitized",
+    TAG_PIXEL_X_DIMENSION: "PixelXDimension",
+    TAG_PIXEL_Y_DIMENSION: "PixelYDimension",
+}
+
+# byte size of each EXIF field type
+EXIF_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 7: 1, 9: 4, 10: 8}
+
+EXIF_DATE_FORMAT = "%Y:%m:%d %H:%M:%S"
+
+# QuickTime times are seconds since midnight, January 1, 1904 UTC
+QUICKTIME_EPOCH = datetime(1904, 1, 1, tzinfo=timezone.utc)
+
+
+class MediaHeaderError(Exception):
+    pass
+
+
+# ---- EXIF ----
+
+# Parse an EXIF TIFF structure (starting at the "II*\0"/"MM\0*" header) and
+# return a dictionary of the tags in EXIF_TAG_NAMES that are present.
+# Returns an empty dictionary if the TIFF header is cut short or isn't valid.
+def parse_exif_tiff(buf):
+    if len(buf) < 8:
+        return {}
+    if buf[:2] == b"II":
+        endian = "<"
+    elif buf[:2] == b"MM":
+        endian = ">"
+    else:
+        return {}
+    if struct.unpack_from(endian + "H", buf, 2)[0] != 42:
+        return {}
+
+    tags = {}
+
+    def read_value(field_type, count, value_offset_pos):
+        size = EXIF_TYPE_SIZES.get(field_type, 1) * count
+        if size <= 4:
+            pos = value_offset_pos
+        else:
+            pos = struct.unpack_from(endian + "I", buf, value_offset_pos)[0]
+        if pos + size > len(buf):
+            return None
+        if field_type == 2:
+            return bytes(buf[pos:pos + size]).split(b"\0", 1)[0].decode("ascii", "replace").strip()
+        if field_type == 3:
+            return struct.unpack_from(endian + "H", buf, pos)[0]
+        if field_type == 4:
+            return struct.unpack_from(endian + "I", buf, pos)[0]
+        return None
+
+    def read_ifd(offset):
+        if offset <= 0 or offset + 2 > len(buf):
+            return None
+        count = struct.unpack_from(endian + "H", buf, offset)[0]
+        exif_ifd = None
+        for i in range(count):
+            entry = offset + 2 + i * 12
+            if entry + 12 > len(buf):
+                break
+            tag, field_type, value_count = struct.unpack_from(endian + "HHI", buf, entry)
+            if tag == TAG_EXIF_IFD:
+                exif_ifd = read_value(4, 1, entry + 8)
+            elif tag in EXIF_TAG_NAMES and EXIF_TAG_NAMES[tag] not in tags:
+                value = read_value(field_type, value_count, entry + 8)
+                if value is not None:
+                    tags[EXIF_TAG_NAMES[tag]] = value
+        return exif_ifd
+
+    exif_ifd = read_ifd(struct.unpack_from(endian + "I", buf, 4)[0])
+    if exif_ifd is not None:
+        read_ifd(exif_ifd)
+    return tags
+
+
+# Walk the JPEG segments up to the start of the image data, returning the
+# EXIF tags from the APP1 segment (or an empty dictionary if there isn't one).
+def read_jpeg_exif(filepath):
+    with open(filepath, "rb") as f:
+        if f.read(2) != b"\xff\xd8":
+            raise MediaHeaderError("{0} is not a JPEG".format(filepath))
+        while True:
+            header = f.read(4)
+            if len(header) < 4 or header[0] != 0xFF:
+                return {}
+            marker = header[1]
+            # start of scan: the image data follows, nothing more to find
+            if marker == 0xDA:
+                return {}
+            length = struct.unpack(">H", header[2:])[0]
+            # the length includes itself, so anything less is garbage
+            if length < 2:
+                return {}
+            if marker == 0xE1:
+                segment = f.read(length - 2)
+                if segment[:6] == b"Exif\0\0":
+                    return parse_exif_tiff(memoryview(segment)[6:])
+            else:
+                f.seek(length - 2, 1)
+
+
+# ---- ISO base media file format (HEIF, MP4, MOV) ----
+
+def map_file(f):
+    try:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+        # empty files can't be mapped
+        raise MediaHeaderError("{0} is empty".format(f.name))
+
+
+# Yield (box type, payload start, box end) for each box between start and end.
+def iter_boxes(buf, start, end):
+    pos = start
+    while pos + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", buf, pos)
+        header = 8
+        if size == 1:
+            if pos + 16 > end:
+                return
+            size = struct.unpack_from(">Q", buf, pos + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header or pos + size > end:
+            return
+        yield box_type, pos + header, pos + size
+        pos += size
+
+
+def find_box(buf, start, end, box_type):
+    return next(((s, e) for t, s, e in iter_boxes(buf, start, end) if t == box_type), None)
+
+
+def read_uint(buf, pos, size):
+    if size == 0:
+        return 0
+    return int.from_bytes(buf[pos:pos + size], "big")
+
+
+# Find the EXIF item in a HEIF 'meta' box and return its TIFF data
+def read_heif_exif_bytes(buf):
+    meta = find_box(buf, 0, len(buf), b"meta")
+    if meta is None:
+        return None
+    # 'meta' is a full box: skip its version and flags
+    meta_start, meta_end = meta[0] + 4, meta[1]
+
+    exif_item_id = None
+    iinf = find_box(buf, meta_start, meta_end, b"iinf")
+    if iinf is None:
+        return None
+    version = buf[iinf[0]]
+    entries_start = iinf[0] + 4 + (2 if version == 0 else 4)
+    for box_type, s, e in iter_boxes(buf, entries_start, iinf[1]):
+        if box_type != b"infe":
+            continue
+        infe_version = buf[s]
+        if infe_version < 2:
+            continue
+        id_size = 2 if infe_version == 2 else 4
+        item_id = read_uint(buf, s + 4, id_size)
+        item_type = bytes(buf[s + 4 + id_size + 2:s + 4 + id_size + 6])
+        if item_type == b"Exif":
+            exif_item_id = item_id
+            break
+    if exif_item_id is None:
+        return None
+
+    iloc = find_box(buf, meta_start, meta_end, b"iloc")
+    if iloc is None:
+        return None
+    pos = iloc[0]
+    version = buf[pos]
+    pos += 4
+    offset_size, length_size = buf[pos] >> 4, buf[pos] & 0x0F
+    base_offset_size, index_size = buf[pos + 1] >> 4, buf[pos + 1] & 0x0F
+    pos += 2
+    id_size = 2 if version < 2 else 4
+    item_count = read_uint(buf, pos, id_size)
+    pos += id_size
+    for _ in range(item_count):
+        # the counts of a truncated box can't be trusted
+        if pos >= iloc[1]:
+            return None
+        item_id = read_uint(buf, pos, id_size)
+        pos += id_size
+        construction_method = 0
+        if version in (1, 2):
+            construction_method = read_uint(buf, pos, 2) & 0x0F
+            pos += 2
+        pos += 2  # data_reference_index
+        base_offset = read_uint(buf, pos, base_offset_size)
+        pos += base_offset_size
+        extent_count = read_uint(buf, pos, 2)
+        pos += 2
+        extents = []
+        for _ in range(extent_count):
+            if pos >= iloc[1]:
+                return None
+            if version in (1, 2) and index_size > 0:
+                pos += index_size
+            extent_offset = read_uint(buf, pos, offset_size)
+            pos += offset_size
+            extent_length = read_uint(buf, pos, length_size)
+            pos += length_size
+            extents.append((base_offset + extent_offset, extent_length))
+        if item_id != exif_item_id:
+            continue
+        # only items stored directly in the file are supported
+        if construction_method != 0:
+            return None
+        data = b"".join(bytes(buf[offset:offset + length]) for offset, length in extents)
+        # the EXIF item starts with the offset of the TIFF header past this field
+        if len(data) < 4:
+            return None
+        tiff_start = 4 + struct.unpack_from(">I", data, 0)[0]
+        return data[tiff_start:]
+    return None
+
+
+def read_heif_exif(filepath):
+    with open(filepath, "rb") as f:
+        buf = map_file(f)
+        try:
+            tiff = read_heif_exif_bytes(buf)
+        except (IndexError, struct.error):
+            # a box that's cut short
+            tiff = None
+        finally:
+            buf.close()
+    if tiff is None:
+        return {}
+    return parse_exif_tiff(tiff)
+
+
+# Read the creation time and the video track dimensions from the 'moov' atom.
+# Returns a dictionary with "created" (a UTC datetime or None), "width" and "height".
+def read_quicktime_header(filepath):
+    info = {"created": None, "width": 0, "height": 0}
+    with open(filepath, "rb") as f:
+        buf = map_file(f)
+        try:
+            moov = find_box(buf, 0, len(buf), b"moov")
+            if moov is None:
+                raise MediaHeaderError("No moov atom found in {0}".format(filepath))
+            for box_type, s, e in iter_boxes(buf, *moov):
+                # too short to even have a version and flags
+                if e - s < 4:
+                    continue
+                if box_type == b"mvhd":
+                    version = buf[s]
+                    created = read_uint(buf, s + 4, 8 if version == 1 else 4)
+                    if created:
+                        info["created"] = QUICKTIME_EPOCH + timedelta(seconds=created)
+                elif box_type == b"trak" and not info["width"]:
+                    tkhd = find_box(buf, s, e, b"tkhd")
+                    if tkhd is None or tkhd[1] - tkhd[0] < 4:
+                        continue
+                    version = buf[tkhd[0]]
+                    # skip version/flags, times, track id, reserved and duration,
+                    # then reserved, layer, alternate group, volume, reserved and the matrix
+                    dims_pos = tkhd[0] + (4 + 32 if version == 1 else 4 + 20) + 8 + 8 + 36
+                    if dims_pos + 8 > tkhd[1]:
+                        continue
+                    # track width and height are 16.16 fixed point, audio tracks have 0
+                    width, height = struct.unpack_from(">II", buf, dims_pos)
+                    info["width"], info["height"] = width >> 16, height >> 16
+        finally:
+            buf.close()
+    return info
+
+
+# ---- dimensions ----
+
+# JPEG start of frame markers (all of 0xC0-0xCF except DHT, JPG and DAC)
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# Walk the JPEG segments until the start of frame, which holds the image size.
+def read_jpeg_dimensions(f):
+    f.seek(2)
+    while True:
+        header = f.read(4)
+        if len(header) < 4 or header[0] != 0xFF:
+            return None
+        marker = header[1]
+        # padding between segments
+        if marker == 0xFF:
+            f.seek(-3, 1)
+            continue
+        if marker == 0xDA:
+            return None
+        length = struct.unpack(">H", header[2:])[0]
+        if length < 2:
+            return None
+        if marker in JPEG_SOF_MARKERS:
+            # precision (1 byte), then height and width
+            sof = f.read(5)
+            if len(sof) < 5:
+                return None
+            height, width = struct.unpack(">HH", sof[1:])
+            return width, height
+        f.seek(length - 2, 1)
+
+
+# The IHDR chunk always comes first and starts with the width and height
+def read_png_dimensions(f):
+    f.seek(8)
+    chunk = f.read(16)
+    if len(chunk) < 16 or chunk[4:8] != b"IHDR":
+        return None
+    return struct.unpack(">II", chunk[8:16])
+
+
+# Returns the 'ispe' (image spatial extents) property of the primary item,
+# or of the largest image if the primary item can't be worked out.
+def read_heif_dimensions_bytes(buf):
+    meta = find_box(buf, 0, len(buf), b"meta")
+    if meta is None:
+        return None
+    meta_start, meta_end = meta[0] + 4, meta[1]
+    iprp = find_box(buf, meta_start, meta_end, b"iprp")
+    if iprp is None:
+        return None
+    ipco = find_box(buf, iprp[0], iprp[1], b"ipco")
+    if ipco is None:
+        return None
+    # properties are referred to by their 1-based index in 'ipco'
+    properties = list(iter_boxes(buf, *ipco))
+    extents = {}
+    for i, (box_type, s, e) in enumerate(properties):
+        # version and flags, then the width and height
+        if box_type == b"ispe" and e - s >= 12:
+            extents[i + 1] = struct.unpack_from(">II", buf, s + 4)
+    if not extents:
+        return None
+
+    pitm = find_box(buf, meta_start, meta_end, b"pitm")
+    ipma = find_box(buf, iprp[0], iprp[1], b"ipma")
+    if pitm is not None and ipma is not None:
+        primary_id = read_uint(buf, pitm[0] + 4, 2 if buf[pitm[0]] == 0 else 4)
+        pos = ipma[0]
+        version, flags = buf[pos], read_uint(buf, pos + 1, 3)
+        pos += 4
+        entry_count = read_uint(buf, pos, 4)
+        pos += 4
+        id_size = 2 if version < 1 else 4
+        index_size = 2 if flags & 1 else 1
+        for _ in range(entry_count):
+            if pos >= ipma[1]:
+                break
+            item_id = read_uint(buf, pos, id_size)
+            pos += id_size
+            association_count = buf[pos]
+            pos += 1
+            for _ in range(association_count):
+                index = read_uint(buf, pos, index_size) & (0x7FFF if index_size == 2 else 0x7F)
+                pos += index_size
+                if item_id == primary_id and index in extents:
+                    return extents[index]
+    return max(extents.values(), key=lambda wh: wh[0] * wh[1])
+
+
+# Get the (width, height) of a photo or video from its header alone, without decoding any pixels.
+# Supports JPEG, PNG, HEIF/HEIC and MP4/MOV and works out the format from the file's first bytes.
+# Returns None if the format isn't supported or the dimensions can't be found.
+def probe_dimensions(filepath):
+    try:
+        return probe_header_dimensions(filepath)
+    except (MediaHeaderError, IndexError, struct.error):
+        return None
+
+
+def probe_header_dimensions(filepath):
+    with open(filepath, "rb") as f:
+        head = f.read(12)
+        if head[:2] == b"\xff\xd8":
+            return read_jpeg_dimensions(f)
+        if head[:8] == PNG_SIGNATURE:
+            return read_png_dimensions(f)
+        if head[4:8] != b"ftyp":
+            return None
+        brand = head[8:12]
+        buf = map_file(f)
+        try:
+            if brand in (b"heic", b"heix", b"heim", b"heis", b"hevc", b"hevx", b"mif1", b"msf1", b"avif"):
+                return read_heif_dimensions_bytes(buf)
+        finally:
+            buf.close()
+    info = read_quicktime_header(filepath)
+    if info["width"] and info["height"]:
+        return info["width"], info["height"]
+    return None
+
+
+def read_exif(filepath, ext):
+    if ext in JPEG_EXTENSIONS:
+        return read_jpeg_exif(filepath)
+    if ext in HEIF_EXTENSIONS:
+        return read_heif_exif(filepath)
+    return None
+
+
+def parse_exif_date(value):
+    try:
+        return datetime.strptime(value, EXIF_DATE_FORMAT)
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,179 @@
+from datetime import datetime
+import os
+import threading
+
+from media_headers import (read_exif, read_quicktime_header, parse_exif_date, MediaHeaderError,
+                           JPEG_EXTENSIONS, HEIF_EXTENSIONS, QUICKTIME_EXTENSIONS)
+
+# Backends for retrieving the metadata of a single file.
+# Every backend returns a dictionary in the same shape as the Windows shell's
+# file details, i.e. the DATE_META fields as '%m/%d/%Y %I:%M %p' strings (or "NA"),
+# "Media created" as a timezone-aware datetime for videos, and the dimensions as
+# "Frame height"/"Frame width" for videos and "Height"/"Width" (or "Dimensions") for photos.
+#
+#   shell:  the Windows shell (Shell.Application), reads every detail Windows Explorer shows.
+#           Only available on Windows.
+#   native: pure Python header readers (see media_headers.py) plus the file system dates.
+#           Falls back to the shell for files it can't read when running on Windows.
+
+DATE_META = ["Date modified", "Date created", "Date taken", "Date accessed", "Media created"]
+VIDEO_EXTENSIONS = [".mp4", ".mov"]
+# the shell columns that get_earliest_date_and_dimensions uses
+SHELL_COLUMNS = DATE_META + ["Frame height", "Frame width", "Height", "Width", "Dimensions"]
+
+SHELL_DATE_FORMAT = '%m/%d/%Y %I:%M %p'
+
+# Add 0's to front of single-digit months and days of the month and hours.
+# Assumes string is formatted like '1/2/2022 2:41 PM' for example.
+# This would become '01/02/2022 02:41 PM'
+# Also handle unicode junk
+def clean_date_string(date_string):
+    if date_string is None:
+        return "NA"
+    # remove unicode junk
+    date_string = date_string.replace('\u200f', '').replace('\u200e', '')
+    # split the date into its parts to see if we need to pad with 0
+    date_parts = date_string.split('/')
+    # Handle padding month
+    if len(date_parts[0]) == 1:
+        date_string = '0' + date_string
+    # Handle padding day of month
+    if len(date_parts[1]) == 1:
+        date_string = date_string[:3] + '0' + date_string[3:]
+    # add padding to hour if necessary
+    if date_string.split(' ')[1].index(':') < 2:
+        colon_idx = date_string.index(':')
+        date_string = date_string[:colon_idx - 1] + '0' + date_string[colon_idx - 1:]
+    return date_string
+
+
+# ---- shell backend ----
+
+def shell_available():
+    try:
+        import win32com.client
+    except ImportError:
+        return False
+    return True
+
+
+# COM objects belong to the thread that created them, so the Shell.Application
+# dispatch and the folder that was last looked at are kept per thread.
+_shell_state = threading.local()
+
+# Returns the shell namespace for dir_path along with the indices of the columns we need,
+# only enumerating the (hundreds of) shell columns again when the directory changes.
+def get_shell_namespace(dir_path):
+    import win32com.client
+    if getattr(_shell_state, "shell", None) is None:
+        _shell_state.shell = win32com.client.gencache.EnsureDispatch('Shell.Application', 0)
+        _shell_state.dir_path = None
+    if _shell_state.dir_path != dir_path:
+        ns = _shell_state.shell.NameSpace(dir_path)
+        columns = {}
+        column = 0
+        while True:
+            colname = ns.GetDetailsOf(None, column)
+            if not colname:
+                break
+            if colname in SHELL_COLUMNS and colname not in columns:
+                columns[colname] = column
+            column += 1
+        _shell_state.dir_path = dir_path
+        _shell_state.ns = ns
+        _shell_state.columns = columns
+    return _shell_state.ns, _shell_state.columns
+
+
+# https://stackoverflow.com/questions/12521525/reading-metadata-with-python
+def get_file_metadata_shell(dir_path, filename):
+    # Path shouldn't end with backslash, i.e. "E:\Images\Paris"
+    # filename must include extension, i.e. "PID manual.pdf"
+    # Returns dictionary containing the file metadata we care about.
+    ns, columns = get_shell_namespace(dir_path)
+
+    file_metadata = {}
+
+    item = ns.ParseName(str(filename))
+    for colname, column in columns.items():
+        colval = ns.GetDetailsOf(item, column)
+        if colval:
+            file_metadata[colname] = colval
+
+    for field in DATE_META:
+        file_metadata[field] = clean_date_string(file_metadata.get(field))
+
+    if os.path.splitext(filename)[-1].lower() in VIDEO_EXTENSIONS:
+        try:
+            from win32com.propsys import propsys, pscon
+            # https://stackoverflow.com/questions/31507038/python-how-to-read-windows-media-created-date-not-file-creation-date
+            properties = propsys.SHGetPropertyStoreFromParsingName(os.path.join(dir_path, filename))
+            dt = properties.GetValue(pscon.PKEY_Media_DateEncoded).GetValue()
+            file_metadata["Media created"] = dt
+        except:
+            pass
+    return file_metadata
+
+
+# ---- native backend ----
+
+# Format a POSIX timestamp like the shell would show it (local time of this machine)
+def format_timestamp(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime(SHELL_DATE_FORMAT)
+
+
+def get_file_metadata_native(dir_path, filename):
+    filepath = os.path.join(dir_path, filename)
+    ext = os.path.splitext(filename)[-1].lower()
+    st = os.stat(filepath)
+
+    file_metadata = {}
+    file_metadata["Date modified"] = format_timestamp(st.st_mtime)
+    file_metadata["Date accessed"] = format_timestamp(st.st_atime)
+    # st_ctime is only the creation time on Windows, elsewhere it's the last metadata change
+    if hasattr(st, "st_birthtime"):
+        file_metadata["Date created"] = format_timestamp(st.st_birthtime)
+    elif os.name == "nt":
+        file_metadata["Date created"] = format_timestamp(st.st_ctime)
+
+    read_header = False
+    try:
+        if ext in QUICKTIME_EXTENSIONS:
+            info = read_quicktime_header(filepath)
+            if info["created"] is not None:
+                file_metadata["Media created"] = info["created"]
+            if info["width"] and info["height"]:
+                file_metadata["Frame width"] = str(info["width"])
+                file_metadata["Frame height"] = str(info["height"])
+            read_header = True
+        elif ext in JPEG_EXTENSIONS or ext in HEIF_EXTENSIONS:
+            exif = read_exif(filepath, ext)
+            date_taken = parse_exif_date(exif.get("DateTimeOriginal") or exif.get("DateTimeDigitized"))
+            if date_taken is not None:
+                file_metadata["Date taken"] = date_taken.strftime(SHELL_DATE_FORMAT)
+            width = exif.get("PixelXDimension") or exif.get("ImageWidth")
+            height = exif.get("PixelYDimension") or exif.get("ImageLength")
+            if width and height:
+                file_metadata["Width"] = str(width)
+                file_metadata["Height"] = str(height)
+            read_header = True
+    except (MediaHeaderError, OSError, IndexError, ValueError) as e:
+        print("Could not read the header of {0}: {1}".format(filepath, e))
+
+    # Let the shell handle anything we couldn't read ourselves, if it's there
+    if not read_header and shell_available():
+        return get_file_metadata_shell(dir_path, filename)
+
+    for field in DATE_META:
+        file_metadata.setdefault(field, "NA")
+    return file_metadata
+
+
+BACKENDS = {
+    "native": get_file_metadata_native,
+    "shell": get_file_metadata_shell,
+}
+DEFAULT_BACKEND = "native"
+
+def get_file_metadata(dir_path, filename, backend=DEFAULT_BACKEND):
+    return BACKENDS[backend](dir_path, filename)
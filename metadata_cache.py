@@ -0,0 +1,139 @@
+from datetime import datetime
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+# On-disk cache of the per-file results of get_earliest_date_and_dimensions
+# so that rescanning a library only has to read the files that are new or changed.
+# Entries are keyed by absolute path and are only used if the file's size and
+# modification time (and the timezone config of its subdirectory and the way
+# the metadata is extracted, see config_hash) haven't changed.
+# It can be used from more than one thread (the "async" executor looks files up on the thread
+# walking the directories and stores them on the one sorting them), but only one at a time.
+
+DEFAULT_CACHE_FILENAME = "metadata_cache.sqlite3"
+
+# Commit after this many new entries so an interrupted scan keeps most of its work.
+COMMIT_EVERY = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS file_metadata (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    config_hash TEXT NOT NULL,
+    datetime TEXT NOT NULL,
+    height INTEGER NOT NULL,
+    width INTEGER NOT NULL
+)
+"""
+
+
+def cache_key(filepath):
+    return os.path.normcase(os.path.abspath(filepath))
+
+
+# Version of how the metadata is extracted. Bump this whenever get_earliest_date_and_dimensions,
+# the metadata backends (metadata_backends.py) or the header readers (media_headers.py) change
+# what they return for a file, so the entries read the old way aren't used anymore.
+EXTRACTOR_VERSION = 1
+
+
+# The result for a file also depends on the timezone config of its subdirectory, on the metadata
+# backend that read it and on EXTRACTOR_VERSION, so a hash of those is stored alongside every entry.
+def config_hash(subdir_tz_config, backend):
+    payload = [EXTRACTOR_VERSION, subdir_tz_config, backend]
+    return hashlib.sha1(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class MetadataCache:
+    def __init__(self, filename=DEFAULT_CACHE_FILENAME):
+        self.filename = filename
+        self.conn = sqlite3.connect(filename, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.conn.execute(SCHEMA)
+        self.conn.commit()
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.pruned = 0
+        self._uncommitted = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Returns the cached result for filepath, or None if there isn't an up to date one.
+    # st is the os.stat() result of filepath.
+    def lookup(self, filepath, st, subdir_config_hash):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT size, mtime_ns, config_hash, datetime, height, width FROM file_metadata WHERE path = ?",
+                (cache_key(filepath),)).fetchone()
+        if row is None or row[0] != st.st_size or row[1] != st.st_mtime_ns or row[2] != subdir_config_hash:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return { "filename": filepath,
+                 "datetime": datetime.fromisoformat(row[3]),
+                 "height": row[4],
+                 "width": row[5] }
+
+    def store(self, filepath, st, subdir_config_hash, file_meta):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO file_metadata VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (cache_key(filepath), st.st_size, st.st_mtime_ns, subdir_config_hash,
+                 file_meta["datetime"].isoformat(), file_meta["height"], file_meta["width"]))
+            self.stored += 1
+            self._uncommitted += 1
+            if self._uncommitted >= COMMIT_EVERY:
+                self._commit()
+
+    # Start keeping track of the files found by a walk (see mark_seen and prune_unseen).
+    # They're kept in a temporary table rather than in memory, for walks of huge libraries.
+    def begin_scan(self):
+        with self.lock:
+            self.conn.execute("DROP TABLE IF EXISTS temp.seen")
+            self.conn.execute("CREATE TEMP TABLE seen (path TEXT PRIMARY KEY)")
+
+    def mark_seen(self, filepath):
+        with self.lock:
+            self.conn.execute("INSERT OR IGNORE INTO temp.seen VALUES (?)", (cache_key(filepath),))
+
+    # Drop the entries under search_root for files that weren't marked as seen since begin_scan.
+    def prune_unseen(self, search_root):
+        root = cache_key(search_root)
+        prefix = root if root.endswith(os.sep) else root + os.sep
+        with self.lock:
+            cursor = self.conn.execute(
+                "DELETE FROM file_metadata WHERE substr(path, 1, ?) = ? AND path NOT IN (SELECT path FROM temp.seen)",
+                (len(prefix), prefix))
+            self.conn.execute("DROP TABLE temp.seen")
+            self.pruned += cursor.rowcount
+            self._commit()
+        return cursor.rowcount
+
+    def commit(self):
+        with self.lock:
+            self._commit()
+
+    def _commit(self):
+        self.conn.commit()
+        self._uncommitted = 0
+
+    def close(self):
+        with self.lock:
+            self._commit()
+            self.conn.close()
+
+    def report(self):
+        total = self.hits + self.misses
+        hit_rate = 100.0 * self.hits / total if total else 0.0
+        return ("Metadata cache {0}: {1} hits, {2} misses ({3:.1f}% hit rate), "
+                "{4} entries stored, {5} stale entries dropped").format(
+                    self.filename, self.hits, self.misses, hit_rate, self.stored, self.pruned)
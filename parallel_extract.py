@@ -0,0 +1,97 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import traceback
+
+# Pooled metadata extraction for sort_files.
+# Reading the metadata of one file is almost entirely waiting on the disk and
+# on the Windows shell, so a pool of workers can keep many reads in flight
+# while results are still handed back in the same order as the files were walked.
+
+EXECUTOR_TYPES = {
+    "process": ProcessPoolExecutor,
+    "thread": ThreadPoolExecutor,
+}
+
+# How many jobs may be waiting in the pool per worker before we stop submitting more.
+# Keeps memory bounded when walking enormous libraries.
+DEFAULT_QUEUE_FACTOR = 4
+
+
+# Shell.Application is a COM object, and COM has to be initialized
+# on every thread that uses it (the main thread gets this for free).
+def init_thread_worker():
+    try:
+        import pythoncom
+    except ImportError:
+        return
+    pythoncom.CoInitialize()
+
+
+# A job whose result is already known (ex. from the metadata cache). It's handed back
+# in its place among the results without going through the pool.
+class Ready:
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+
+# Stands in for the Future of a Ready job
+class ReadyResult:
+    __slots__ = ("filepath", "value")
+
+    def __init__(self, filepath, value):
+        self.filepath = filepath
+        self.value = value
+
+    def result(self):
+        return self.filepath, self.value, None
+
+
+# Run the extraction function on a single file, catching any exception so that
+# one unreadable file doesn't take down the whole batch.
+# Returns (filepath, result, error) where error is None on success
+# or the formatted traceback on failure.
+def extract_one(extract_fn, filepath, *args):
+    try:
+        return filepath, extract_fn(filepath, *args), None
+    except Exception:
+        return filepath, None, traceback.format_exc()
+
+
+# Generator that applies extract_fn to every (filepath, args) job and yields
+# (filepath, result, error) tuples in the same order as the jobs were given.
+# args can also be a Ready, whose value is yielded as the result without calling extract_fn.
+# With workers <= 1 everything runs serially in this process.
+# queue_size is the maximum number of submitted-but-not-yet-yielded jobs.
+def extract_all(extract_fn, jobs, workers=1, executor_type="process", queue_size=None):
+    if workers <= 1:
+        for filepath, args in jobs:
+            if isinstance(args, Ready):
+                yield filepath, args.value, None
+            else:
+                yield extract_one(extract_fn, filepath, *args)
+        return
+
+    if executor_type not in EXECUTOR_TYPES:
+        raise ValueError("Unknown executor type {0}, expected one of {1}".format(executor_type, list(EXECUTOR_TYPES)))
+    if queue_size is None:
+        queue_size = workers * DEFAULT_QUEUE_FACTOR
+    queue_size = max(queue_size, workers)
+
+    executor_kwargs = {"max_workers": workers}
+    if executor_type == "thread":
+        executor_kwargs["initializer"] = init_thread_worker
+
+    pending = deque()
+    with EXECUTOR_TYPES[executor_type](**executor_kwargs) as executor:
+        for filepath, args in jobs:
+            if isinstance(args, Ready):
+                pending.append(ReadyResult(filepath, args.value))
+            else:
+                pending.append(executor.submit(extract_one, extract_fn, filepath, *args))
+            # wait on the oldest job once the queue is full so results stay in order
+            if len(pending) >= queue_size:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
@@ -0,0 +1,51 @@
+# Remembers where a clip's components (like "Motion") and their properties (like "Scale"
+# and "Position") are, so they don't have to be searched for by name on every clip.
+#
+# Searching a pymiere collection fetches every item in it and then asks for each one's
+# displayName, and every one of those is a round trip to Premiere. Clips of the same media
+# type in a sequence have their components and properties in the same order though,
+# so once one has been found its index can be used directly on the next clip.
+# Whatever is found at the remembered index is checked against the name, and if it
+# doesn't match, the resolver falls back to searching by name and remembers the new index.
+
+
+class PropertyResolver:
+    def __init__(self):
+        # (context, name) -> index
+        self.indices = {}
+        self.hits = 0
+        self.searches = 0
+        self.mismatches = 0
+
+    # Returns the item of collection with the given displayName.
+    # context identifies what kind of collection this is, ex. ("video", "Motion").
+    def find(self, collection, name, context):
+        key = (context, name)
+        index = self.indices.get(key)
+        if index is not None:
+            try:
+                item = collection[index]
+                if item.displayName == name:
+                    self.hits += 1
+                    return item
+            except (IndexError, TypeError):
+                # pymiere gives a TypeError for indices past the end of some collections
+                pass
+            self.mismatches += 1
+        self.searches += 1
+        for i, item in enumerate(collection):
+            if item.displayName == name:
+                self.indices[key] = i
+                return item
+        raise KeyError("No {0} found in {1}".format(name, context))
+
+    def component(self, clip, name, media_type):
+        return self.find(clip.components, name, (media_type,))
+
+    # component_name is passed in rather than asked for so it doesn't cost another round trip
+    def property(self, component, component_name, name, media_type):
+        return self.find(component.properties, name, (media_type, component_name))
+
+    def report(self):
+        return "Property lookups: {0} by remembered index, {1} by searching ({2} remembered indices were wrong)".format(
+            self.hits, self.searches, self.mismatches)
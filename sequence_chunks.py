@@ -0,0 +1,89 @@
+import pymiere
+
+from bin_index import es_string
+from extendscript_batch import es_reference, es_sequence
+
+# Building a very long sequence out of shorter ones nested in it.
+# Premiere gets slower at adding a clip the more clips there already are on the track, so
+# a sequence with tens of thousands of clips takes longer and longer to add each one to.
+# Instead, every chunk of clips is added to a sequence of its own (a "part"), which never has
+# more than the chunk's clips on its track, and the part is then nested in the sequence
+# after the last one, so the sequence itself only ever has one clip per part.
+#
+# The parts are made by copying the sequence being built, so they have the same settings
+# without Premiere asking about them like it does for createNewSequence, and are only
+# referred to by their sequenceID (see es_sequence in extendscript_batch.py).
+
+# Copies {template}, names the copy {name} and clears out every clip it had.
+# A sequence that's already called {name} is left over from a run that was interrupted
+# before it could be nested, so it's deleted first. Sends back the copy's sequenceID.
+NEW_PART_SCRIPT = """
+(function(template, name) {{
+    var sequences = app.project.sequences;
+    for (var i = sequences.numSequences - 1; i >= 0; i--) {{
+        if (sequences[i].name === name) {{
+            app.project.deleteSequence(sequences[i]);
+        }}
+    }}
+    var before = {{}};
+    for (var i = 0; i < sequences.numSequences; i++) {{
+        before[sequences[i].sequenceID] = true;
+    }}
+    template.clone();
+    var copy = null;
+    for (var i = 0; i < sequences.numSequences; i++) {{
+        if (!before[sequences[i].sequenceID]) {{
+            copy = sequences[i];
+        }}
+    }}
+    if (copy === null) {{
+        throw new Error("The sequence couldn't be copied");
+    }}
+    copy.name = name;
+    var trackLists = [copy.videoTracks, copy.audioTracks];
+    for (var t = 0; t < trackLists.length; t++) {{
+        for (var j = 0; j < trackLists[t].numTracks; j++) {{
+            var clips = trackLists[t][j].clips;
+            for (var k = clips.numItems - 1; k >= 0; k--) {{
+                clips[k].remove(false, false);
+            }}
+        }}
+    }}
+    return copy.sequenceID;
+}})({template}, {name})
+"""
+
+# Nests the part {part} in {seq} at {start} seconds. Sends back { "end": the time the part ends at }
+NEST_SCRIPT = """
+(function(seq, part, start) {{
+    seq.videoTracks[0].overwriteClip(part.projectItem, start);
+    var duration = new Time();
+    duration.ticks = part.end;
+    return ExtendJSON.stringify({{ "end": start + duration.seconds }});
+}})({seq}, {part}, {start})
+"""
+
+
+class ChunkError(Exception):
+    pass
+
+
+def part_name(seq_name, part_number):
+    return "{0} part {1:04d}".format(seq_name, part_number)
+
+
+# Returns the sequenceID of a new, empty part of seq
+def new_part(seq, name):
+    part_id = pymiere.core.eval_script(NEW_PART_SCRIPT.format(template=es_reference(seq), name=es_string(name)))
+    if not isinstance(part_id, str) or not part_id:
+        raise ChunkError("Unexpected result from Premiere while making sequence {0}: {1}".format(name, part_id))
+    return part_id
+
+
+# Nest the part with the sequenceID part_id in seq at start_seconds, returning the time it ends at
+def nest_part(seq, part_id, start_seconds):
+    result = pymiere.core.eval_script(NEST_SCRIPT.format(seq=es_reference(seq), part=es_sequence(part_id),
+                                                         start=repr(float(start_seconds))))
+    if not isinstance(result, dict):
+        raise ChunkError("Unexpected result from Premiere while nesting sequence {0}: {1}".format(part_id, result))
+    return float(result["end"])
@@ -0,0 +1,164 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+import fake_pymiere
+# build_journal imports pymiere, so these run against the fake in benchmarks/fake_pymiere.py
+fake_pymiere.install()
+import build_journal  # noqa: E402 (needs the fake installed first)
+from build_journal import (Checkpoint, load_checkpoint, make_header, read_entries, resume_journal,  # noqa: E402
+                           start_journal, verify_checkpoint)
+
+# Tests for the build journal in build_journal.py: finding where to carry on from, a last line
+# left half written by a crash, entries that straddle the chunks the end of the journal is read
+# backwards in, and checking the journal against the clips on a (fake) sequence's track.
+
+PHOTO_SECONDS = fake_pymiere.DEFAULT_PHOTO_SECONDS
+
+
+@pytest.fixture
+def header(tmp_path):
+    sorted_files = tmp_path / "sorted_files.json"
+    sorted_files.write_text("[]")
+    return make_header(fake_pymiere.Sequence("SEQ"), str(sorted_files), 1000)
+
+
+# A journal for clips 0 to num_clips - 1, every one of them on the track after the one before
+def write_journal(filename, header, num_clips):
+    with start_journal(filename, header) as journal:
+        for i in range(num_clips):
+            journal.record(i, i + 1, (i + 1) * PHOTO_SECONDS)
+
+
+def as_tuple(checkpoint):
+    return checkpoint.index, checkpoint.clip_idx, checkpoint.end
+
+
+def test_resume_point(tmp_path, header):
+    filename = str(tmp_path / "build_journal.jsonl")
+    write_journal(filename, header, 25)
+    checkpoint = load_checkpoint(filename, header)
+    assert as_tuple(checkpoint) == (24, 25, 125.0)
+    assert checkpoint.offset == os.path.getsize(filename)
+
+
+def test_no_entries_yet(tmp_path, header):
+    filename = str(tmp_path / "build_journal.jsonl")
+    write_journal(filename, header, 0)
+    checkpoint = load_checkpoint(filename, header)
+    # before the first file, at the start of the sequence
+    assert as_tuple(checkpoint) == (-1, 0, 0.0)
+    assert checkpoint.offset == os.path.getsize(filename)
+
+
+def test_no_journal(tmp_path, header):
+    assert load_checkpoint(str(tmp_path / "build_journal.jsonl"), header) is None
+
+
+def test_journal_for_something_else(tmp_path, header):
+    filename = str(tmp_path / "build_journal.jsonl")
+    write_journal(filename, header, 3)
+    assert load_checkpoint(filename, dict(header, sequence="another sequence")) is None
+    assert load_checkpoint(filename, dict(header, sorted_files="another list")) is None
+    assert load_checkpoint(filename, dict(header, files=999)) is None
+
+
+@pytest.mark.parametrize("contents", [b"", b'{"version": 1', b"not json\n"])
+def test_journal_without_a_header(tmp_path, header, contents):
+    filename = tmp_path / "build_journal.jsonl"
+    filename.write_bytes(contents)
+    assert load_checkpoint(str(filename), header) is None
+
+
+@pytest.mark.parametrize("torn", [b"[25, 2", b"[25, 26, 130.0]", b"\n[25, 26", b"garbage\n"])
+def test_torn_last_line(tmp_path, header, torn):
+    filename = str(tmp_path / "build_journal.jsonl")
+    write_journal(filename, header, 25)
+    with open(filename, "ab") as f:
+        f.write(torn)
+    checkpoint = load_checkpoint(filename, header)
+    assert as_tuple(checkpoint) == (24, 25, 125.0)
+
+    # carrying on drops the torn line and appends after the checkpoint
+    with resume_journal(filename, checkpoint) as journal:
+        journal.record(25, 26, 130.0)
+    entries, _ = read_entries(filename)
+    assert [as_tuple(entry) for entry in entries] == [(i, i + 1, (i + 1) * PHOTO_SECONDS) for i in range(26)]
+    assert as_tuple(load_checkpoint(filename, header)) == (25, 26, 130.0)
+
+
+@pytest.mark.parametrize("torn", [b"", b"[25, 2"])
+def test_entries_straddling_chunks(tmp_path, header, monkeypatch, torn):
+    filename = str(tmp_path / "build_journal.jsonl")
+    write_journal(filename, header, 25)
+    with open(filename, "ab") as f:
+        f.write(torn)
+    size = os.path.getsize(filename)
+    # read backwards in every chunk size up to the whole journal, so the last entry
+    # (and the torn line) start and end at every position in a chunk
+    for chunk in range(1, size + 1):
+        monkeypatch.setattr(build_journal, "TAIL_CHUNK", chunk)
+        checkpoint = load_checkpoint(filename, header)
+        assert as_tuple(checkpoint) == (24, 25, 125.0), chunk
+        assert checkpoint.offset == size - len(torn)
+
+
+def test_only_a_torn_entry(tmp_path, header, monkeypatch):
+    filename = str(tmp_path / "build_journal.jsonl")
+    write_journal(filename, header, 0)
+    with open(filename, "ab") as f:
+        f.write(b"[0, 1, 5.")
+    for chunk in [1, 3, 4096]:
+        monkeypatch.setattr(build_journal, "TAIL_CHUNK", chunk)
+        assert as_tuple(load_checkpoint(filename, header)) == (-1, 0, 0.0)
+
+
+def test_resuming_from_an_earlier_entry(tmp_path, header):
+    filename = str(tmp_path / "build_journal.jsonl")
+    write_journal(filename, header, 10)
+    entries, _ = read_entries(filename)
+    with resume_journal(filename, entries[3]) as journal:
+        journal.record(4, 5, 99.0)
+    entries, _ = read_entries(filename)
+    assert [as_tuple(entry) for entry in entries] == [(0, 1, 5.0), (1, 2, 10.0), (2, 3, 15.0), (3, 4, 20.0), (4, 5, 99.0)]
+
+
+def test_checkpoint_json():
+    checkpoint = Checkpoint.from_json(Checkpoint(7, 8, 40.5).to_json())
+    assert as_tuple(checkpoint) == (7, 8, 40.5)
+
+
+# A sequence with num_clips photos on its track, one after the other from the start
+def sequence_with_clips(num_clips):
+    seq = fake_pymiere.Sequence("SEQ")
+    project_item = fake_pymiere.ProjectItem("IMG_0001.JPG", fake_pymiere.ProjectItemType.CLIP, None, PHOTO_SECONDS)
+    track = seq._data["videoTracks"]._items[0]
+    for i in range(num_clips):
+        track.overwriteClip(project_item, i * PHOTO_SECONDS)
+    return seq
+
+
+def test_verify_against_the_track(tmp_path, header):
+    filename = str(tmp_path / "build_journal.jsonl")
+    write_journal(filename, header, 10)
+    assert as_tuple(verify_checkpoint(sequence_with_clips(10), filename)) == (9, 10, 50.0)
+    # the last 3 clips never made it onto the track
+    assert as_tuple(verify_checkpoint(sequence_with_clips(7), filename)) == (6, 7, 35.0)
+    assert as_tuple(verify_checkpoint(sequence_with_clips(0), filename)) == (-1, 0, 0.0)
+
+
+def test_verify_a_clip_that_ends_elsewhere(tmp_path, header):
+    filename = str(tmp_path / "build_journal.jsonl")
+    write_journal(filename, header, 10)
+    seq = sequence_with_clips(10)
+    # clip 5 was cut short, so it and everything after it are added again
+    clip = seq._data["videoTracks"]._items[0]._data["clips"]._items[5]
+    clip._set("end", fake_pymiere.seconds_time(27.0))
+    checkpoint = verify_checkpoint(seq, filename)
+    assert as_tuple(checkpoint) == (4, 5, 25.0)
+    # and carrying on from there drops the entries after it
+    resume_journal(filename, checkpoint).close()
+    assert as_tuple(load_checkpoint(filename, header)) == (4, 5, 25.0)
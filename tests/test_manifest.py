@@ -0,0 +1,182 @@
+import os
+import struct
+import sys
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import manifest
+from manifest import (Manifest, ManifestError, HEADER, MAGIC, MAX_DIMENSION, padding, read_json, read_manifest,
+                      read_sorted_files, to_datetime, write_json, write_manifest, write_sorted_files)
+from file_pipeline import FileRecord
+
+# Tests for the sorted files list in manifest.py: saving it as a binary manifest or JSON and
+# reading it back, converting between the two, and reading manifests that are cut short.
+
+
+def tz(hours, minutes=0):
+    return timezone(timedelta(hours=hours, minutes=minutes))
+
+
+# Records like the ones sort_files saves, with UTC offsets that aren't whole hours and a few
+# directories shared between files
+def sorted_files():
+    root = os.path.join("..", "media")
+    return [FileRecord(os.path.join(root, "Chris's Photos", "IMG_4025.JPG"),
+                       datetime(2022, 1, 8, 11, 22, 0, tzinfo=tz(-8)), 3024, 4032),
+            FileRecord(os.path.join(root, "Chris's Photos", "IMG_4025.MOV"),
+                       datetime(2022, 1, 8, 11, 22, 0, tzinfo=tz(-8)), 1080, 1920),
+            FileRecord(os.path.join(root, "Gio's photos", "IMG_0001.HEIC"),
+                       datetime(2022, 1, 9, 6, 30, 15, 250000, tzinfo=tz(5, 45)), 4032, 3024),
+            FileRecord(os.path.join(root, "Chris's Photos", "IMG_4026.JPG"),
+                       datetime(2022, 1, 10, 0, 0, 0, tzinfo=tz(-3, -30)), 3024, 4032),
+            FileRecord(os.path.join(root, "old scans", "scan_1969.jpg"),
+                       datetime(1969, 7, 20, 20, 17, 40, tzinfo=tz(14)), 600, 800)]
+
+
+UNICODE_FILES = [FileRecord(os.path.join("..", "médias", "Été 2022", "Плавание.JPG"),
+                            datetime(2022, 7, 1, 12, 0, tzinfo=timezone.utc), 3024, 4032),
+                 FileRecord(os.path.join("..", "médias", "旅行", "写真_😀.HEIC"),
+                            datetime(2022, 7, 2, 8, 30, tzinfo=tz(9)), 4032, 3024)]
+
+
+# What a record reads back as, for comparing records of any kind (datetimes are compared
+# as the same instant with the same UTC offset, however they were stored)
+def normalized(record):
+    dt = to_datetime(record["datetime"])
+    return record["filename"], dt, dt.utcoffset(), int(record["height"]), int(record["width"])
+
+
+def same_records(a, b):
+    return [normalized(x) for x in a] == [normalized(x) for x in b]
+
+
+@pytest.mark.parametrize("files", [sorted_files(), UNICODE_FILES, []])
+def test_binary_round_trip(tmp_path, files):
+    filename = str(tmp_path / "sorted_files.manifest")
+    write_sorted_files(filename, files)
+    loaded = read_sorted_files(filename)
+    assert isinstance(loaded, Manifest)
+    assert len(loaded) == len(files)
+    assert same_records(loaded, files)
+    # records come back as dictionaries, the same as from the JSON list
+    assert all(set(record) == {"filename", "datetime", "height", "width"} for record in loaded)
+
+
+@pytest.mark.parametrize("files", [sorted_files(), UNICODE_FILES])
+def test_json_round_trip(tmp_path, files):
+    filename = str(tmp_path / "sorted_files.json")
+    write_sorted_files(filename, files)
+    loaded = read_sorted_files(filename)
+    assert same_records(loaded, files)
+
+
+def test_converting_between_json_and_binary(tmp_path):
+    files = sorted_files() + UNICODE_FILES
+    json_filename = str(tmp_path / "sorted_files.json")
+    manifest_filename = str(tmp_path / "sorted_files.manifest")
+    write_json(json_filename, files)
+    # import, export and import again, like `manifest.py import` and `manifest.py export`
+    write_manifest(manifest_filename, read_json(json_filename))
+    write_json(json_filename, read_manifest(manifest_filename))
+    assert same_records(read_json(json_filename), files)
+    first = (tmp_path / "sorted_files.manifest").read_bytes()
+    write_manifest(manifest_filename, read_json(json_filename))
+    assert (tmp_path / "sorted_files.manifest").read_bytes() == first
+
+
+def test_offsets_are_kept(tmp_path):
+    filename = str(tmp_path / "sorted_files.manifest")
+    write_sorted_files(filename, sorted_files())
+    loaded = read_sorted_files(filename)
+    assert [record["datetime"].utcoffset() for record in loaded] == \
+           [timedelta(hours=-8), timedelta(hours=-8), timedelta(hours=5, minutes=45),
+            timedelta(hours=-3, minutes=-30), timedelta(hours=14)]
+    # the same wall time as it was saved with, down to the microsecond
+    assert loaded[2]["datetime"].replace(tzinfo=None) == datetime(2022, 1, 9, 6, 30, 15, 250000)
+    assert loaded[4]["datetime"].replace(tzinfo=None) == datetime(1969, 7, 20, 20, 17, 40)
+
+
+def test_written_from_a_generator_in_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(manifest, "WRITE_CHUNK", 2)
+    files = sorted_files() + UNICODE_FILES
+    filename = str(tmp_path / "sorted_files.manifest")
+    write_sorted_files(filename, (record for record in files))
+    assert same_records(read_sorted_files(filename), files)
+    assert not os.path.exists(filename + ".tmp")
+
+
+def test_every_directory_is_stored_once(tmp_path):
+    filename = str(tmp_path / "sorted_files.manifest")
+    write_manifest(filename, sorted_files())
+    loaded = read_manifest(filename)
+    # 3 directories and 5 filenames
+    assert len(loaded.strings) == 8
+    assert loaded.dirs[0] == loaded.dirs[1] == loaded.dirs[3]
+
+
+def test_dimensions_too_big_are_clamped(tmp_path):
+    filename = str(tmp_path / "sorted_files.manifest")
+    record = FileRecord(os.path.join("..", "media", "pano.jpg"), datetime(2022, 1, 1, tzinfo=timezone.utc), 70000, 12000)
+    write_manifest(filename, [record])
+    assert read_manifest(filename)[0]["height"] == MAX_DIMENSION
+    assert read_manifest(filename)[0]["width"] == 12000
+
+
+def test_naive_datetimes_are_refused(tmp_path):
+    record = FileRecord(os.path.join("..", "media", "IMG_0001.JPG"), datetime(2022, 1, 1), 3024, 4032)
+    with pytest.raises(ManifestError):
+        write_manifest(str(tmp_path / "sorted_files.manifest"), [record])
+
+
+def test_lookups(tmp_path):
+    filename = str(tmp_path / "sorted_files.manifest")
+    files = sorted_files()
+    # the same path again further down, which lookups should never find
+    files.append(FileRecord(files[0].filename, datetime(2023, 1, 1, tzinfo=timezone.utc), 1, 1))
+    write_sorted_files(filename, files)
+    loaded = read_sorted_files(filename)
+    # found regardless of case and separators
+    windows_path = "..\\MEDIA\\chris's photos\\img_4026.jpg"
+    assert loaded.index_of(windows_path) == 3
+    assert normalized(loaded.get(windows_path)) == normalized(files[3])
+    assert loaded.index_of(files[0].filename) == 0
+    assert loaded.get(os.path.join("..", "media", "missing.jpg")) is None
+    assert same_records(loaded[1:3], files[1:3])
+    assert normalized(loaded[-1]) == normalized(files[-1])
+    with pytest.raises(IndexError):
+        loaded[len(files)]
+
+
+def test_truncated_manifest(tmp_path):
+    filename = str(tmp_path / "sorted_files.manifest")
+    write_manifest(filename, sorted_files() + UNICODE_FILES)
+    data = (tmp_path / "sorted_files.manifest").read_bytes()
+    # the last column's padding isn't needed to read it
+    last_padding = padding(len(sorted_files() + UNICODE_FILES) * 2)
+    for n in range(len(data) - last_padding):
+        (tmp_path / "sorted_files.manifest").write_bytes(data[:n])
+        with pytest.raises(ManifestError):
+            read_manifest(filename)
+
+
+def test_not_a_manifest(tmp_path):
+    filename = str(tmp_path / "sorted_files.manifest")
+    (tmp_path / "sorted_files.manifest").write_bytes(b"[" + b"\0" * 64)
+    with pytest.raises(ManifestError):
+        read_manifest(filename)
+    (tmp_path / "sorted_files.manifest").write_bytes(HEADER.pack(MAGIC, 99, 0, 0, 0))
+    with pytest.raises(ManifestError):
+        read_manifest(filename)
+
+
+def test_header_counts_past_the_end(tmp_path):
+    filename = str(tmp_path / "sorted_files.manifest")
+    write_manifest(filename, sorted_files())
+    data = bytearray((tmp_path / "sorted_files.manifest").read_bytes())
+    # claims far more entries than the file has
+    struct.pack_into("<I", data, 12, 0xFFFFFF)
+    (tmp_path / "sorted_files.manifest").write_bytes(bytes(data))
+    with pytest.raises(ManifestError):
+        read_manifest(filename)
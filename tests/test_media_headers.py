@@ -0,0 +1,274 @@
+import os
+import struct
+import sys
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from media_headers import (read_jpeg_exif, read_heif_exif, read_quicktime_header, probe_dimensions,
+                           MediaHeaderError, QUICKTIME_EPOCH, TAG_DATETIME_ORIGINAL, TAG_EXIF_IFD,
+                           TAG_IMAGE_LENGTH, TAG_IMAGE_WIDTH, TAG_PIXEL_X_DIMENSION, TAG_PIXEL_Y_DIMENSION)
+
+# Tests for the header readers in media_headers.py, on files built by hand byte by byte.
+# Besides reading well-formed headers, every reader is run on each of the files cut short at
+# every length, and on a few that are corrupted, to check that it gives up on the metadata
+# (an empty dictionary or None) instead of raising anything but a MediaHeaderError.
+
+DATE_TAKEN = "2023:05:06 07:08:09"
+CREATED = datetime(2023, 5, 6, 7, 8, 9, tzinfo=timezone.utc)
+
+
+def write(tmp_path, name, data):
+    filepath = tmp_path / name
+    filepath.write_bytes(data)
+    return str(filepath)
+
+
+# ---- EXIF ----
+
+# An IFD starting at offset, for (tag, type, count, value bytes) entries.
+# Values that don't fit in an entry go right after the IFD.
+def ifd(endian, offset, entries):
+    out = struct.pack(endian + "H", len(entries))
+    extra = b""
+    extra_start = offset + 2 + 12 * len(entries) + 4
+    for tag, field_type, count, value in entries:
+        if len(value) <= 4:
+            field = value.ljust(4, b"\0")
+        else:
+            field = struct.pack(endian + "I", extra_start + len(extra))
+            extra += value
+        out += struct.pack(endian + "HHI", tag, field_type, count) + field
+    return out + struct.pack(endian + "I", 0) + extra
+
+
+def exif_tiff(endian="<", width=4032, height=3024):
+    header = (b"II" if endian == "<" else b"MM") + struct.pack(endian + "HI", 42, 8)
+    ifd0_entries = [(TAG_IMAGE_WIDTH, 4, 1, struct.pack(endian + "I", 640)),
+                    (TAG_IMAGE_LENGTH, 4, 1, struct.pack(endian + "I", 480)),
+                    (TAG_EXIF_IFD, 4, 1, None)]
+    # the EXIF IFD goes right after IFD0, which has no values that don't fit
+    exif_offset = 8 + 2 + 12 * len(ifd0_entries) + 4
+    ifd0_entries[2] = (TAG_EXIF_IFD, 4, 1, struct.pack(endian + "I", exif_offset))
+    exif_entries = [(TAG_DATETIME_ORIGINAL, 2, 20, DATE_TAKEN.encode("ascii") + b"\0"),
+                    (TAG_PIXEL_X_DIMENSION, 4, 1, struct.pack(endian + "I", width)),
+                    (TAG_PIXEL_Y_DIMENSION, 3, 1, struct.pack(endian + "H", height))]
+    return header + ifd(endian, 8, ifd0_entries) + ifd(endian, exif_offset, exif_entries)
+
+
+def jpeg_segment(marker, payload):
+    return bytes([0xFF, marker]) + struct.pack(">H", len(payload) + 2) + payload
+
+
+def jpeg(tiff=None, width=4032, height=3024):
+    data = b"\xff\xd8" + jpeg_segment(0xE0, b"JFIF\0\x01\x01\0\0\x01\0\x01\0\0")
+    if tiff is not None:
+        data += jpeg_segment(0xE1, b"Exif\0\0" + tiff)
+    # baseline start of frame: precision, height, width and 3 components
+    data += jpeg_segment(0xC0, struct.pack(">BHHB", 8, height, width, 3) + b"\x01\x22\x00\x02\x11\x01\x03\x11\x01")
+    return data + jpeg_segment(0xDA, b"\x03\x01\x00\x02\x11\x03\x11\x00\x3f\x00") + b"\x00" * 64 + b"\xff\xd9"
+
+
+EXPECTED_TAGS = { "ImageWidth": 640, "ImageLength": 480, "DateTimeOriginal": DATE_TAKEN,
+                  "PixelXDimension": 4032, "PixelYDimension": 3024 }
+
+
+@pytest.mark.parametrize("endian", ["<", ">"])
+def test_jpeg_exif(tmp_path, endian):
+    filepath = write(tmp_path, "IMG_0001.JPG", jpeg(exif_tiff(endian)))
+    assert read_jpeg_exif(filepath) == EXPECTED_TAGS
+    assert probe_dimensions(filepath) == (4032, 3024)
+
+
+def test_jpeg_without_exif(tmp_path):
+    filepath = write(tmp_path, "IMG_0001.JPG", jpeg())
+    assert read_jpeg_exif(filepath) == {}
+    assert probe_dimensions(filepath) == (4032, 3024)
+
+
+def test_not_a_jpeg(tmp_path):
+    filepath = write(tmp_path, "IMG_0001.JPG", b"GIF89a" + b"\0" * 32)
+    with pytest.raises(MediaHeaderError):
+        read_jpeg_exif(filepath)
+    assert probe_dimensions(filepath) is None
+
+
+def test_jpeg_exif_with_a_bad_tiff_header(tmp_path):
+    for tiff in [b"XX*\0\x08\0\0\0", b"II\x2b\0\x08\0\0\0", b"II*"]:
+        filepath = write(tmp_path, "IMG_0001.JPG", jpeg(tiff))
+        assert read_jpeg_exif(filepath) == {}
+
+
+def test_jpeg_exif_with_offsets_past_the_end(tmp_path):
+    tiff = bytearray(exif_tiff())
+    # point IFD0 past the end of the EXIF data
+    struct.pack_into("<I", tiff, 4, 0xFFFF)
+    filepath = write(tmp_path, "IMG_0001.JPG", jpeg(bytes(tiff)))
+    assert read_jpeg_exif(filepath) == {}
+
+
+def test_jpeg_segment_with_a_bad_length(tmp_path):
+    # a length that doesn't even cover itself used to send the segment walk back to where it started
+    filepath = write(tmp_path, "IMG_0001.JPG", b"\xff\xd8\xff\xe0\x00\x00" + b"\0" * 32)
+    assert read_jpeg_exif(filepath) == {}
+    assert probe_dimensions(filepath) is None
+
+
+def test_truncated_jpeg(tmp_path):
+    data = jpeg(exif_tiff())
+    for n in range(2, len(data)):
+        filepath = write(tmp_path, "IMG_0001.JPG", data[:n])
+        assert isinstance(read_jpeg_exif(filepath), dict)
+        assert probe_dimensions(filepath) in (None, (4032, 3024))
+
+
+# ---- ISO base media file format ----
+
+def box(box_type, payload):
+    return struct.pack(">I", 8 + len(payload)) + box_type + payload
+
+
+def full_box(box_type, version, payload, flags=0):
+    return box(box_type, bytes([version]) + flags.to_bytes(3, "big") + payload)
+
+
+# A HEIC with a primary image item (1) of primary_size, a thumbnail item (2) of thumbnail_size
+# and an EXIF item (3) stored in 'mdat'
+def heic(tiff, primary_size=(1000, 800), thumbnail_size=(4000, 3000)):
+    exif_item = struct.pack(">I", 6) + b"Exif\0\0" + tiff
+    ftyp = box(b"ftyp", b"heic" + struct.pack(">I", 0) + b"mif1heic")
+
+    def meta(exif_offset):
+        infe = [full_box(b"infe", 2, struct.pack(">HH", item_id, 0) + item_type + b"\0")
+                for item_id, item_type in [(1, b"hvc1"), (2, b"hvc1"), (3, b"Exif")]]
+        iinf = full_box(b"iinf", 0, struct.pack(">H", len(infe)) + b"".join(infe))
+        # version 1, 4 byte offsets and lengths, no base offsets or extent indices
+        iloc = full_box(b"iloc", 1, bytes([0x44, 0x00]) + struct.pack(">H", 1) +
+                        struct.pack(">HHHHII", 3, 0, 0, 1, exif_offset, len(exif_item)))
+        ipco = box(b"ipco", box(b"hvcC", b"\0" * 8) +
+                   full_box(b"ispe", 0, struct.pack(">II", *thumbnail_size)) +
+                   full_box(b"ispe", 0, struct.pack(">II", *primary_size)))
+        # item 1 has properties 1 (essential) and 3, item 2 has 1 and 2
+        ipma = full_box(b"ipma", 0, struct.pack(">I", 2) +
+                        struct.pack(">HB", 1, 2) + bytes([0x81, 0x03]) +
+                        struct.pack(">HB", 2, 2) + bytes([0x81, 0x02]))
+        return full_box(b"meta", 0, full_box(b"hdlr", 0, b"\0" * 4 + b"pict" + b"\0" * 13) +
+                        full_box(b"pitm", 0, struct.pack(">H", 1)) + iinf + iloc + box(b"iprp", ipco + ipma))
+
+    # the EXIF item's offset goes in 'meta', which doesn't change its size
+    exif_offset = len(ftyp) + len(meta(0)) + 8
+    return ftyp + meta(exif_offset) + box(b"mdat", exif_item)
+
+
+def test_heif_exif(tmp_path):
+    filepath = write(tmp_path, "IMG_0001.HEIC", heic(exif_tiff(">")))
+    assert read_heif_exif(filepath) == EXPECTED_TAGS
+
+
+def test_heif_dimensions_of_the_primary_item(tmp_path):
+    filepath = write(tmp_path, "IMG_0001.HEIC", heic(exif_tiff()))
+    # the primary item's, not the largest one's
+    assert probe_dimensions(filepath) == (1000, 800)
+
+
+def test_heif_without_meta(tmp_path):
+    filepath = write(tmp_path, "IMG_0001.HEIC", box(b"ftyp", b"heic\0\0\0\0mif1") + box(b"mdat", b"\0" * 16))
+    assert read_heif_exif(filepath) == {}
+    assert probe_dimensions(filepath) is None
+
+
+def test_heif_with_a_huge_item_count(tmp_path):
+    data = bytearray(heic(exif_tiff()))
+    # the item count of 'iloc', which only has room for one item, and that item isn't the EXIF one
+    pos = data.index(b"iloc") + 4 + 4 + 2
+    struct.pack_into(">HH", data, pos, 0xFFFF, 9)
+    filepath = write(tmp_path, "IMG_0001.HEIC", bytes(data))
+    started = time.perf_counter()
+    assert read_heif_exif(filepath) == {}
+    assert time.perf_counter() - started < 1.0
+
+
+def test_truncated_heif(tmp_path):
+    data = heic(exif_tiff())
+    for n in range(1, len(data)):
+        filepath = write(tmp_path, "IMG_0001.HEIC", data[:n])
+        assert isinstance(read_heif_exif(filepath), dict)
+        assert probe_dimensions(filepath) in (None, (1000, 800), (4000, 3000))
+
+
+def test_empty_heif(tmp_path):
+    filepath = write(tmp_path, "IMG_0001.HEIC", b"")
+    with pytest.raises(MediaHeaderError):
+        read_heif_exif(filepath)
+    assert probe_dimensions(filepath) is None
+
+
+def quicktime_seconds(dt):
+    return int((dt - QUICKTIME_EPOCH).total_seconds())
+
+
+def mvhd(version, created):
+    if version == 1:
+        times = struct.pack(">QQIQ", created, created, 600, 6000)
+    else:
+        times = struct.pack(">IIII", created, created, 600, 6000)
+    return full_box(b"mvhd", version, times + b"\0" * 80)
+
+
+def trak(width, height):
+    # times, track id, reserved and duration, then reserved, layer, alternate group,
+    # volume, reserved and the matrix, then the 16.16 fixed point width and height
+    tkhd = full_box(b"tkhd", 0, b"\0" * 20 + b"\0" * 8 + b"\0" * 8 + b"\0" * 36 + struct.pack(">II", width << 16, height << 16))
+    return box(b"trak", tkhd)
+
+
+# A video with the 'moov' atom at the end, after the media data, and the audio track first
+def quicktime(version=0, created=CREATED):
+    moov = box(b"moov", mvhd(version, quicktime_seconds(created)) + trak(0, 0) + trak(1920, 1080))
+    return box(b"ftyp", b"qt  \0\0\0\0qt  ") + box(b"mdat", b"\0" * 256) + moov
+
+
+@pytest.mark.parametrize("version", [0, 1])
+def test_quicktime_header(tmp_path, version):
+    filepath = write(tmp_path, "IMG_0001.MOV", quicktime(version))
+    assert read_quicktime_header(filepath) == { "created": CREATED, "width": 1920, "height": 1080 }
+    assert probe_dimensions(filepath) == (1920, 1080)
+
+
+def test_quicktime_without_a_creation_time(tmp_path):
+    filepath = write(tmp_path, "IMG_0001.MOV", quicktime(created=QUICKTIME_EPOCH))
+    assert read_quicktime_header(filepath)["created"] is None
+
+
+def test_quicktime_with_empty_atoms(tmp_path):
+    moov = box(b"moov", box(b"mvhd", b"") + box(b"trak", box(b"tkhd", b"")))
+    filepath = write(tmp_path, "IMG_0001.MOV", box(b"ftyp", b"qt  \0\0\0\0qt  ") + moov)
+    assert read_quicktime_header(filepath) == { "created": None, "width": 0, "height": 0 }
+    assert probe_dimensions(filepath) is None
+
+
+def test_truncated_quicktime(tmp_path):
+    data = quicktime()
+    for n in range(1, len(data)):
+        filepath = write(tmp_path, "IMG_0001.MOV", data[:n])
+        # cut anywhere before the end, there's no complete 'moov' atom
+        with pytest.raises(MediaHeaderError):
+            read_quicktime_header(filepath)
+        assert probe_dimensions(filepath) is None
+
+
+def test_quicktime_with_a_truncated_track(tmp_path):
+    moov = box(b"moov", mvhd(0, quicktime_seconds(CREATED)) + box(b"trak", box(b"tkhd", b"\0" * 40)))
+    filepath = write(tmp_path, "IMG_0001.MOV", box(b"ftyp", b"qt  \0\0\0\0qt  ") + moov)
+    assert read_quicktime_header(filepath) == { "created": CREATED, "width": 0, "height": 0 }
+    assert probe_dimensions(filepath) is None
+
+
+def test_png_dimensions(tmp_path):
+    ihdr = struct.pack(">I", 13) + b"IHDR" + struct.pack(">IIBBBBB", 1242, 2688, 8, 6, 0, 0, 0) + b"\0" * 4
+    filepath = write(tmp_path, "IMG_0001.PNG", b"\x89PNG\r\n\x1a\n" + ihdr)
+    assert probe_dimensions(filepath) == (1242, 2688)
+    filepath = write(tmp_path, "IMG_0001.PNG", b"\x89PNG\r\n\x1a\n" + ihdr[:10])
+    assert probe_dimensions(filepath) is None
@@ -0,0 +1,80 @@
+from bisect import bisect_left
+from datetime import datetime, timezone
+
+import pytz
+
+# The timezone config (see timezone_config.json) compiled into something that's fast to look up.
+# Every subdirectory's "timezones" list becomes a sorted list of boundaries (as epoch seconds)
+# and the tzinfo objects that apply after each of them, so finding the timezone of a
+# datetime is a binary search instead of parsing every boundary string for every file.
+# The whole config is validated when it's compiled so mistakes show up before any files are read.
+
+BOUNDARY_FORMAT = '%B %d, %Y %I:%M:%S %p'
+
+
+class TimezoneConfigError(ValueError):
+    pass
+
+
+# Boundaries are compared against wall clock times as if both were in UTC
+def wall_time_to_epoch(naive_dt):
+    return naive_dt.replace(tzinfo=timezone.utc).timestamp()
+
+
+class SubdirTimezones:
+    def __init__(self, subdir, subdir_config, date_fields=None):
+        self.subdir = subdir
+        self.raw = subdir_config
+
+        def error(message):
+            return TimezoneConfigError("Timezone config for \"{0}\": {1}".format(subdir, message))
+
+        if not isinstance(subdir_config, dict) or not subdir_config.get("timezones"):
+            raise error("there should be a \"timezones\" array with at least one entry")
+
+        self.datefield = subdir_config.get("datefield")
+        if self.datefield is not None and date_fields is not None and self.datefield not in date_fields:
+            raise error("unknown datefield \"{0}\", expected one of {1}".format(self.datefield, date_fields))
+
+        self.boundaries = []
+        self.zones = []
+        for i, entry in enumerate(subdir_config["timezones"]):
+            if not isinstance(entry, (list, tuple)) or len(entry) != 2:
+                raise error("entry {0} should be a [datetime, timezone] pair".format(i))
+            boundary, zone_name = entry
+            try:
+                self.zones.append(pytz.timezone(zone_name))
+            except pytz.UnknownTimeZoneError:
+                raise error("unknown timezone \"{0}\" in entry {1}".format(zone_name, i))
+            if i == 0:
+                # the first entry applies to everything before the second one, so it has no datetime
+                continue
+            try:
+                epoch = wall_time_to_epoch(datetime.strptime(boundary, BOUNDARY_FORMAT))
+            except (TypeError, ValueError):
+                raise error("can't read the datetime \"{0}\" in entry {1}, it should look like \"{2}\"".format(
+                    boundary, i, "January 8, 2022 01:30:00 PM"))
+            if self.boundaries and epoch <= self.boundaries[-1]:
+                raise error("entry {0} (\"{1}\") doesn't come after the entry before it".format(i, boundary))
+            self.boundaries.append(epoch)
+
+    # The timezone of whichever entry's boundary most recently comes strictly before epoch
+    def zone_at(self, epoch):
+        return self.zones[bisect_left(self.boundaries, epoch)]
+
+    # For the dates read from file details, which are wall clock times
+    def zone_for_wall_time(self, naive_dt):
+        return self.zone_at(wall_time_to_epoch(naive_dt))
+
+    # For the "Media created" field, which is an actual point in time.
+    # naive_dt is that point in time expressed in the local time of this machine.
+    def zone_for_local_time(self, naive_dt):
+        return self.zone_at(naive_dt.timestamp())
+
+
+# Compile and validate the whole timezone config, returning a dictionary of
+# subdirectory to SubdirTimezones.
+# Raises a TimezoneConfigError describing the first problem found.
+def compile_tz_config(tz_config, date_fields=None):
+    return { subdir: SubdirTimezones(subdir, subdir_config, date_fields)
+             for subdir, subdir_config in tz_config.items() }